@@ -50,6 +50,32 @@ class MockDataService:
 
 
 class MockScoringService:
+    async def process_batch(self, events):
+        for event in events:
+            if event.type == "like":
+                self.process_like(
+                    event.user_id,
+                    event.nickname,
+                    event.count,
+                    event.is_follower,
+                    event.avatar_url,
+                )
+            elif event.type == "gift":
+                self.process_gift(
+                    event.user_id,
+                    event.nickname,
+                    event.diamond_count,
+                    event.gift_id,
+                    event.gift_name,
+                    event.count,
+                    event.avatar_url,
+                    event.gift_image,
+                )
+            elif event.type == "comment":
+                self.process_comment(
+                    event.user_id, event.comment, event.nickname, event.avatar_url
+                )
+
     def process_like(self, unique_id, nickname, count, is_follower, avatar_url=None):
         logger.info(
             f"[Like] | user={unique_id} | count={count} | is_follower={is_follower} | avatar={avatar_url[-8:]}"
@@ -0,0 +1,221 @@
+import sys
+import os
+import asyncio
+import pytest
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import comment_writer as comment_writer_module
+from app.services import data_service as data_service_module
+from app.services.data_service import DataService
+from app.services.gift_catalog import GiftCatalog
+from app.services.comment_writer import CommentWriter
+
+
+class RecordingSession:
+    """แทน AsyncSessionLocal: นับจำนวน Statement ที่ส่งไป DB"""
+
+    statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        RecordingSession.statements.append(stmt)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+def test_known_users_skip_the_database(monkeypatch):
+    RecordingSession.statements = []
+    monkeypatch.setattr(data_service_module, "AsyncSessionLocal", RecordingSession)
+    service = DataService(user_cache_size=2)
+
+    async def run():
+        await service.upsert_user("u1", "Alice", "a.png")
+        await service.upsert_user("u1", "Alice", "a.png")  # hit
+        await service.upsert_user("u1", "Alice")  # hit, keeps avatar
+        await service.upsert_user("u1", "Alice2")  # nickname changed
+        await service.upsert_user("u2", "Bob")
+        await service.upsert_user("u3", "Carol")  # evicts u1
+        await service.upsert_user("u1", "Alice2")
+
+    asyncio.run(run())
+
+    assert len(RecordingSession.statements) == 5
+    metrics = service.get_user_cache_metrics()
+    assert metrics["hits"] == 2
+    assert metrics["misses"] == 5
+    assert metrics["size"] == 2
+    assert list(service.user_cache) == ["u3", "u1"]
+    assert service.user_cache["u1"] == ("Alice2", None)
+
+
+class RecordingDataService:
+    def __init__(self):
+        self.gift_writes = []
+        self.fail_next = False
+
+    async def upsert_gift(self, gift_id, name, diamond_count, image_url=None):
+        self.gift_writes.append((gift_id, image_url))
+        if self.fail_next:
+            self.fail_next = False
+            return False
+        return True
+
+
+def test_gift_catalog_writes_only_new_or_changed_gifts():
+    data = RecordingDataService()
+    catalog = GiftCatalog(data)
+
+    async def run():
+        await catalog.record("5655", "Rose", 1, "rose.png")
+        await catalog.record("5655", "Rose", 1, "rose.png")
+        await catalog.record("5655", "Rose", 1)  # no image = unchanged
+        await catalog.record("5655", "Rose", 1, "rose_v2.png")
+        await catalog.record("7934", "Heart Me", 1)
+
+    asyncio.run(run())
+
+    assert data.gift_writes == [
+        ("5655", "rose.png"),
+        ("5655", "rose_v2.png"),
+        ("7934", None),
+    ]
+    assert catalog.get("5655") == {
+        "name": "Rose",
+        "diamond_count": 1,
+        "icon": "rose_v2.png",
+    }
+
+
+def test_gift_catalog_retries_after_failed_write():
+    data = RecordingDataService()
+    catalog = GiftCatalog(data)
+
+    async def run():
+        data.fail_next = True
+        first = await catalog.record("5655", "Rose", 1, "rose.png")
+        known_after_failure = catalog.get("5655")
+        second = await catalog.record("5655", "Rose", 1, "rose.png")
+        third = await catalog.record("5655", "Rose", 1, "rose.png")
+        return first, known_after_failure, second, third
+
+    first, known_after_failure, second, third = asyncio.run(run())
+    assert (first, known_after_failure) == (False, None)
+    assert (second, third) == (True, False)
+    assert data.gift_writes == [("5655", "rose.png"), ("5655", "rose.png")]
+    assert catalog.get_metrics()["failed_writes"] == 1
+    assert catalog.get_metrics()["writes"] == 1
+
+
+class RecordingCommentWriter(CommentWriter):
+    """แทน INSERT จริง: คืน id ต่อเนื่อง, content 'bad' ทำให้ทั้ง Batch ล้ม"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.statements = []
+        self.next_id = 1
+
+    async def _insert(self, rows):
+        self.statements.append(len(rows))
+        if any(row["content"] == "bad" for row in rows):
+            raise ValueError("bad row")
+        ids = list(range(self.next_id, self.next_id + len(rows)))
+        self.next_id += len(rows)
+        return ids
+
+
+def test_comment_writer_bulk_inserts_and_retries_failed_batch():
+    async def run():
+        writer = RecordingCommentWriter(flush_interval_ms=60_000, max_rows=3)
+        writer.start()
+        for i in range(3):
+            writer.add("u1", "s1", f"c{i}")
+        # Full batch wakes the flush loop
+        while writer.flushes == 0:
+            await asyncio.sleep(0.001)
+
+        writer.add("u1", "s1", "c3")
+        writer.add("u1", "s1", "bad")
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(run())
+    # 1 bulk insert, then failed bulk + per-row retry
+    assert writer.statements == [3, 2, 1, 1]
+    metrics = writer.get_metrics()
+    assert metrics["rows_written"] == 4
+    assert metrics["failed_rows"] == 1
+    assert metrics["pending"] == 0
+
+
+def test_comment_writer_inserts_into_sqlite(monkeypatch, tmp_path):
+    """_insert จริง (INSERT ... RETURNING, sort_by_parameter_order) กับ SQLite"""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy import event, select
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.models.base import Base
+    from app.models.comment import Comment
+    from app.models.session import LiveSession
+    from app.models.user import User
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def enable_foreign_keys(connection, _):
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(comment_writer_module, "AsyncSessionLocal", session_factory)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_factory() as session:
+            session.add_all(
+                [User(tiktok_id="u1", nickname="Alice"), LiveSession(id="s1")]
+            )
+            await session.commit()
+
+        writer = CommentWriter(flush_interval_ms=60_000, max_rows=100)
+        ids = await writer._insert(
+            [
+                {"user_id": "u1", "session_id": "s1", "content": f"c{i}"}
+                for i in range(5)
+            ]
+        )
+
+        # FK ผิด 1 แถว: Bulk ล้มทั้ง Batch แล้ว Retry ทีละแถว
+        writer.add("u1", "s1", "c5")
+        writer.add("ghost", "s1", "orphan")
+        writer.add("u1", "s1", "c6")
+        await writer.flush()
+
+        async with session_factory() as session:
+            stored = (
+                await session.execute(
+                    select(Comment.id, Comment.content).order_by(Comment.id)
+                )
+            ).all()
+        await engine.dispose()
+        return ids, writer.get_metrics(), stored
+
+    ids, metrics, stored = asyncio.run(run())
+    # id ที่คืนมาเรียงตามลำดับ Row ที่ส่งเข้าไป
+    assert [content for comment_id, content in stored if comment_id in ids] == [
+        f"c{i}" for i in range(5)
+    ]
+    assert ids == sorted(ids)
+    assert [content for _, content in stored] == [f"c{i}" for i in range(7)]
+    assert metrics["rows_written"] == 2
+    assert metrics["failed_rows"] == 1
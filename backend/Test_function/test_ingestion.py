@@ -0,0 +1,184 @@
+import sys
+import os
+import asyncio
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.ingestion_service import IngestionService
+from app.events import NormalizedEvent, LIKE, GIFT
+
+
+class RecordingScoringService:
+    def __init__(self):
+        self.likes = []
+        self.gifts = []
+
+    async def process_batch(self, events):
+        self.likes.extend((e.user_id, e.count) for e in events if e.type == LIKE)
+        self.gifts.extend((e.user_id, e.count) for e in events if e.type == GIFT)
+
+
+class NullDataService:
+    async def upsert_user(self, tiktok_id, nickname, avatar_url=None):
+        pass
+
+    async def upsert_gift(self, gift_id, name, diamond_count, image_url=None):
+        return True
+
+
+class NullLoggingService:
+    async def info(self, message, details=None):
+        pass
+
+    async def error(self, message, error=None):
+        pass
+
+    async def warning(self, message, details=None):
+        pass
+
+
+def like(user_id, count=1):
+    return NormalizedEvent(type=LIKE, user_id=user_id, nickname=user_id, count=count)
+
+
+def rose(user_id, count, streaking, group_id="g1"):
+    return NormalizedEvent(
+        type=GIFT,
+        user_id=user_id,
+        nickname=user_id,
+        count=count,
+        gift_id="5655",
+        gift_name="Rose",
+        diamond_count=1,
+        streakable=True,
+        streaking=streaking,
+        group_id=group_id,
+    )
+
+
+def make_service(scoring, **kwargs):
+    kwargs.setdefault("like_window_ms", 0)
+    return IngestionService(
+        scoring, NullLoggingService(), NullDataService(), "test_session", **kwargs
+    )
+
+
+def test_drop_oldest_keeps_newest_events():
+    async def run():
+        scoring = RecordingScoringService()
+        service = make_service(scoring, maxsize=2, workers=1)
+        for i in range(4):
+            await service.submit(like(f"user_{i}"))
+
+        metrics = service.get_metrics()
+        assert metrics["depth"] == 2
+        assert metrics["dropped"] == 2
+
+        service.start()
+        await service.stop()
+        return scoring.likes
+
+    assert asyncio.run(run()) == [("user_2", 1), ("user_3", 1)]
+
+
+def test_drop_newest_rejects_when_full():
+    async def run():
+        scoring = RecordingScoringService()
+        service = make_service(scoring, maxsize=1, overflow_policy="drop_newest")
+        accepted = [await service.submit(like(f"user_{i}")) for i in range(3)]
+
+        service.start()
+        await service.stop()
+        return accepted, scoring.likes, service.get_metrics()
+
+    accepted, likes, metrics = asyncio.run(run())
+    assert accepted == [True, False, False]
+    assert likes == [("user_0", 1)]
+    assert metrics["processed"] == 1
+    assert metrics["dropped"] == 2
+
+
+def test_unknown_overflow_policy_is_rejected():
+    try:
+        make_service(RecordingScoringService(), overflow_policy="spill")
+    except ValueError:
+        return
+    assert False, "expected ValueError"
+
+
+def test_like_bursts_are_coalesced_per_user():
+    async def run():
+        scoring = RecordingScoringService()
+        service = make_service(scoring, like_window_ms=60_000)
+        service.start()
+        for count in (3, 5, 7):
+            await service.submit(like("user_a", count))
+        await service.submit(like("user_b", 2))
+
+        # Nothing reaches the queue until the window closes (here: on stop)
+        assert service.get_metrics()["enqueued"] == 0
+        await service.stop()
+        return scoring.likes, service.get_metrics()
+
+    likes, metrics = asyncio.run(run())
+    assert sorted(likes) == [("user_a", 15), ("user_b", 2)]
+    assert metrics["like_coalescing"]["likes_in"] == 4
+    assert metrics["like_coalescing"]["likes_out"] == 2
+
+
+def test_gift_streak_ticks_are_dropped_before_queue():
+    async def run():
+        scoring = RecordingScoringService()
+        service = make_service(scoring)
+        for count in (1, 2, 3):
+            await service.submit(rose("user_a", count, streaking=True))
+        # Abandoned streak (no final tick)
+        await service.submit(rose("user_b", 4, streaking=True, group_id="g2"))
+
+        # Only progress is tracked, nothing reaches the queue yet
+        assert service.get_metrics()["enqueued"] == 0
+        assert [s["count"] for s in service.get_active_streaks()] == [3, 4]
+
+        await service.submit(rose("user_a", 5, streaking=False))
+        await service.gift_streaks.expire(now=float("inf"))
+
+        service.start()
+        await service.stop()
+        return scoring.gifts, service.get_metrics()
+
+    gifts, metrics = asyncio.run(run())
+    assert gifts == [("user_a", 5)]
+    assert metrics["enqueued"] == 1
+    assert metrics["gift_streaks"] == {
+        "active": 0,
+        "ticks_in": 5,
+        "ticks_dropped": 4,
+        "completed": 1,
+        "expired": 1,
+    }
+
+
+def test_failed_score_flush_logs_every_event():
+    from app.services.score_batcher import ScoreBatcher
+
+    class FailingScoringService:
+        async def process_batch(self, events):
+            raise ConnectionError("redis down")
+
+    errors = []
+
+    async def on_error(error, event_data):
+        errors.append((str(error), event_data["type"], event_data["data"].user_id))
+
+    async def run():
+        batcher = ScoreBatcher(FailingScoringService(), on_error=on_error)
+        for user_id in ("a", "b", "c"):
+            batcher.add(like(user_id))
+        await batcher.flush()
+        return batcher.get_metrics()
+
+    metrics = asyncio.run(run())
+    assert errors == [("redis down", LIKE, u) for u in ("a", "b", "c")]
+    assert (metrics["failed_flushes"], metrics["failed_events"]) == (1, 3)
+    assert (metrics["flushes"], metrics["pending"]) == (0, 0)
@@ -0,0 +1,54 @@
+import sys
+import os
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.log_store import LogStore
+
+
+def fill(store, n):
+    for i in range(1, n + 1):
+        level = "ERROR" if i % 5 == 0 else "INFO"
+        log_type = "Gift" if i % 2 == 0 else "Comment"
+        store.append(level, f"log {i}", log_type)
+
+
+def test_ring_keeps_latest_entries_and_reads_from_cursor():
+    store = LogStore(capacity=10)
+    fill(store, 25)
+    assert len(store) == 10
+    assert store.first_id == 16
+    assert [log["id"] for log in store.get()] == list(range(16, 26))
+    # Cursor older than the buffer returns what is left
+    assert [log["id"] for log in store.get(after_id=3)] == list(range(16, 26))
+    assert [log["id"] for log in store.get(after_id=22)] == [23, 24, 25]
+    assert [log["id"] for log in store.get(after_id=17, until_id=19)] == [18, 19]
+    assert [log["id"] for log in store.get(limit=3)] == [23, 24, 25]
+    assert store.get(after_id=25) == []
+
+
+def test_level_and_type_indexes_match_a_full_scan():
+    store = LogStore(capacity=50)
+    fill(store, 180)
+    everything = store.get()
+
+    errors = store.get(after_id=140, levels={"ERROR"})
+    assert errors == [
+        log for log in everything if log["id"] > 140 and log["level"] == "ERROR"
+    ]
+    gifts = store.get(types={"Gift"}, limit=4)
+    assert [log["id"] for log in gifts] == [174, 176, 178, 180]
+    both = store.get(levels={"ERROR", "INFO"}, types={"Comment"})
+    assert both == [log for log in everything if log["type"] == "Comment"]
+    assert store.get(levels={"DEBUG"}) == []
+
+    # Indexes only hold ids still in the ring
+    assert store.get_metrics() == {
+        "capacity": 50,
+        "size": 50,
+        "last_id": 180,
+        "levels": 2,
+        "types": 2,
+    }
+    assert all(len(index) <= 50 for index in store._by_type.values())
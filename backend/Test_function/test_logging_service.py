@@ -0,0 +1,52 @@
+import sys
+import os
+import asyncio
+import json
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.logging_service import LoggingService
+
+
+class RecordingLoggingService(LoggingService):
+    """แทน INSERT จริง: เก็บแต่ละ Batch ที่จะเขียนลง DB"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    async def _write(self, rows):
+        self.batches.append(rows)
+
+
+def test_logs_are_sampled_batched_and_streamed_immediately():
+    streamed = []
+
+    async def run():
+        service = RecordingLoggingService(sampling={"Like": 5})
+        service.set_callback(lambda level, message, details: streamed.append(message))
+        service.start()
+        for i in range(12):
+            await service.info(f"like {i}", details={"type": "Like"})
+        await service.info("gift", details={"type": "Gift"})
+        await service.warning("like warning", details={"type": "Like"})
+
+        # Nothing written yet, but every record reached the callback
+        assert service.batches == []
+        assert len(streamed) == 14
+
+        service.set_sampling("Gift", 0)
+        await service.info("gift 2", details={"type": "Gift"})
+        await service.stop()
+        return service
+
+    service = asyncio.run(run())
+    assert len(service.batches) == 1
+    messages = [row["message"] for row in service.batches[0]]
+    assert messages[:5] == ["like 0", "like 5", "like 10", "gift", "like warning"]
+    summaries = {
+        json.loads(row["details"])["type"]: json.loads(row["details"])["aggregated"]
+        for row in service.batches[0][5:]
+    }
+    assert summaries == {"Like": 9, "Gift": 1}
@@ -0,0 +1,91 @@
+import sys
+import os
+import asyncio
+import json
+import pytest
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.overlay_frame import OverlayPublisher, OverlayRelay, OVERLAY_FIELDS
+
+
+class FakeGameManager:
+    def __init__(self):
+        self.current_session_id = "s1"
+        self.scoring_service = object()
+        self.calls = []
+        self.score = 10
+
+    async def get_leaderboard(self, offset=0, limit=None, fields=None):
+        self.calls.append((offset, limit, fields))
+        return [{"user_id": "u1", "nickname": "A", "score": self.score, "rank": 1}]
+
+    async def get_leaderboard_counts(self):
+        return {"total": 1, "scored": 1}
+
+
+def test_publisher_sends_only_changed_frames_to_relay():
+    async def run():
+        gm = FakeGameManager()
+        publisher = OverlayPublisher(gm, top_n=5)
+        relay = OverlayRelay()
+        publisher.add_listener(relay.push)
+
+        sent = [await publisher.publish(), await publisher.publish()]
+        seq, text = await asyncio.wait_for(relay.next_frame(0), 1.0)
+
+        # A score change: clients waiting on the old seq get the new frame
+        waiter = asyncio.create_task(relay.next_frame(seq))
+        gm.score = 12
+        sent.append(await publisher.publish())
+        second = await asyncio.wait_for(waiter, 1.0)
+        return gm, publisher, relay, sent, (seq, text), second
+
+    gm, publisher, relay, sent, first, second = asyncio.run(run())
+    assert sent == [True, False, True]
+    assert gm.calls[0] == (0, 5, OVERLAY_FIELDS)
+    assert json.loads(first[1]) == {
+        "type": "overlay",
+        "session_id": "s1",
+        "total": 1,
+        "scored": 1,
+        "leaderboard": [{"user_id": "u1", "nickname": "A", "score": 10, "rank": 1}],
+    }
+    assert second[0] == first[0] + 1
+    assert json.loads(second[1])["leaderboard"][0]["score"] == 12
+    assert publisher.get_metrics()["unchanged"] == 1
+    # Echo of our own frame (e.g. back from Pub/Sub) is not a new frame
+    assert relay.push(second[1]) is False
+    assert relay.get_metrics()["frames"] == 2
+
+
+def test_only_the_process_with_a_session_writes_the_frame():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        owner_gm = FakeGameManager()
+        idle_gm = FakeGameManager()
+        idle_gm.current_session_id = None
+        idle_gm.scoring_service = None
+        owner = OverlayPublisher(owner_gm, r, min_interval_ms=0)
+        idle = OverlayPublisher(idle_gm, r, min_interval_ms=0)
+
+        sent = [await owner.publish()]
+        # A remote ChangeNotifier message wakes the idle process too
+        sent.append(await idle.publish())
+        stored = await r.get(owner.key)
+
+        # An idle worker booting does not overwrite the live frame either
+        idle.start()
+        await asyncio.sleep(0.05)
+        await idle.stop()
+        return sent, idle_gm, idle, stored, await r.get(owner.key)
+
+    sent, idle_gm, idle, stored, after_boot = asyncio.run(run())
+    assert sent == [True, False]
+    assert idle_gm.calls == []
+    assert idle.get_metrics()["published"] == 0
+    assert json.loads(stored)["session_id"] == "s1"
+    assert after_boot == stored
@@ -1,30 +1,61 @@
 import sys
 import os
-import redis
+import redis.asyncio as aioredis
 import json
 import asyncio
 
+import pytest
+
 # Add backend directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app.services.scoring_service import ScoringService
+from app.services.scoring_service import (
+    ScoringService,
+    LAYOUT_COLUMNAR,
+    MEMBER_MIGRATION_KEY,
+    migrate_leaderboard_members,
+)
+from app.events import NormalizedEvent, LIKE, GIFT, COMMENT
+
+
+_redis_server_available = None
+
+
+async def _connect_redis():
+    """
+    Redis จริงที่ localhost ถ้ามี ไม่งั้นใช้ fakeredis (รองรับ Lua ผ่าน lupa)
+    ไม่มีทั้งคู่ -> Skip (ให้เห็นว่าไม่ได้ทดสอบ แทนที่จะผ่านเฉยๆ)
+    """
+    global _redis_server_available
+    if _redis_server_available is not False:
+        try:
+            r = aioredis.Redis(host="localhost", port=6379, decode_responses=True)
+            await r.ping()
+            _redis_server_available = True
+            return r
+        except Exception as e:
+            _redis_server_available = False
+            print(f"Redis not available ({e}), falling back to fakeredis")
+    try:
+        import fakeredis
+    except ImportError:
+        pytest.skip("No Redis server and fakeredis is not installed")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
 
 
 def test_scoring():
+    asyncio.run(_run_scoring())
+
+
+async def _run_scoring():
     print("Connecting to Redis...")
-    try:
-        r = redis.Redis(host="localhost", port=6379, decode_responses=True)
-        r.ping()
-        print("✅ Redis connected")
-    except Exception as e:
-        print(f"❌ Redis connection failed: {e}")
-        return
+    r = await _connect_redis()
 
     session_id = "test_verification_session"
     # Clear previous test data
-    keys = r.keys(f"session:{session_id}:*")
+    keys = await r.keys(f"session:{session_id}:*")
     if keys:
-        r.delete(*keys)
+        await r.delete(*keys)
 
     service = ScoringService(r, session_id)
     user_id = "user_123"
@@ -32,7 +63,7 @@ def test_scoring():
     avatar = "http://avatar.url"
 
     print("\n--- Testing Process Gift ---")
-    service.process_gift(
+    await service.process_gift(
         user_id=user_id,
         user_nickname=nickname,
         coin_value_per_unit=10,
@@ -45,12 +76,12 @@ def test_scoring():
     print("✅ Gift processed")
 
     print("\n--- Testing Process Comment ---")
-    service.process_comment(user_id, "Hello World", nickname, avatar)
-    service.process_comment(user_id, "Second Comment", nickname, avatar)
+    await service.process_comment(user_id, "Hello World", nickname, avatar)
+    await service.process_comment(user_id, "Second Comment", nickname, avatar)
     print("✅ Comments processed")
 
     print("\n--- Testing Get Leaderboard ---")
-    leaderboard = service.get_leaderboard()
+    leaderboard = await service.get_leaderboard()
     print(f"Leaderboard: {json.dumps(leaderboard, indent=2)}")
 
     user_entry = leaderboard[0]
@@ -65,7 +96,7 @@ def test_scoring():
         print("❌ Gift Breakdown missing or incorrect")
 
     print("\n--- Testing Get User Stats ---")
-    stats = service.get_user_stats_and_comments(user_id)
+    stats = await service.get_user_stats_and_comments(user_id)
     print(f"User Stats: {json.dumps(stats, indent=2)}")
 
     comments = stats["comments"]
@@ -79,5 +110,462 @@ def test_scoring():
         print(f"❌ Expected 2 comments, got {len(comments)}")
 
 
+def test_process_batch_matches_single_events():
+    asyncio.run(_run_process_batch_matches_single_events())
+
+
+async def _run_process_batch_matches_single_events():
+    r = await _connect_redis()
+
+    single_session = "test_batch_single"
+    batch_session = "test_batch_folded"
+    for session_id in (single_session, batch_session):
+        keys = await r.keys(f"session:{session_id}:*")
+        if keys:
+            await r.delete(*keys)
+
+    single = ScoringService(r, single_session)
+    batched = ScoringService(r, batch_session)
+    avatar = "http://avatar.url"
+
+    await single.process_like("user_1", "Alice", 15, True, avatar)
+    await single.process_like("user_1", "Alice", 5, True, avatar)
+    await single.process_like("user_2", "Bob", 30, False)
+    await single.process_gift("user_2", "Bob", 10, "gift_1", "Rose", 3, avatar, "icon.png")
+    await single.process_comment("user_1", "Hello", "Alice", avatar)
+
+    await batched.process_batch(
+        [
+            NormalizedEvent(LIKE, "user_1", "Alice", avatar, True, count=15),
+            NormalizedEvent(LIKE, "user_1", "Alice", avatar, True, count=5),
+            NormalizedEvent(LIKE, "user_2", "Bob", None, False, count=30),
+            NormalizedEvent(
+                GIFT,
+                "user_2",
+                "Bob",
+                avatar,
+                count=3,
+                gift_id="gift_1",
+                gift_name="Rose",
+                diamond_count=10,
+                gift_image="icon.png",
+            ),
+            NormalizedEvent(COMMENT, "user_1", "Alice", avatar, comment="Hello"),
+        ]
+    )
+
+    assert await single.get_leaderboard() == await batched.get_leaderboard()
+    for user_id in ("user_1", "user_2"):
+        single_stats = await single.get_user_stats_and_comments(user_id)
+        batch_stats = await batched.get_user_stats_and_comments(user_id)
+        assert single_stats["stats"] == batch_stats["stats"]
+        assert single_stats["gifts_breakdown"] == batch_stats["gifts_breakdown"]
+        assert [c["text"] for c in single_stats["comments"]] == [
+            c["text"] for c in batch_stats["comments"]
+        ]
+
+
+def test_lua_and_pipeline_paths_match():
+    asyncio.run(_run_lua_and_pipeline_paths_match())
+
+
+async def _run_lua_and_pipeline_paths_match():
+    r = await _connect_redis()
+
+    async def run(session_id, use_scripts):
+        keys = await r.keys(f"session:{session_id}:*")
+        if keys:
+            await r.delete(*keys)
+        service = ScoringService(r, session_id)
+        service.use_scripts = use_scripts
+        await service.process_like("user_1", "Alice", 15, True, "http://avatar.url")
+        await service.process_gift("user_1", "Alice", 10, "gift_1", "Rose", 3, None, "icon")
+        await service.process_comment("user_1", "Hello", "Alice")
+        await service.increment_used_comments("user_1")
+        await service.decrement_used_comments("user_1")
+        # Must not go below 0
+        await service.decrement_used_comments("user_1")
+        return (
+            await service.get_leaderboard(),
+            (await service.get_user_stats_and_comments("user_1"))["stats"],
+        )
+
+    lua_result = await run("test_lua_path", True)
+    pipeline_result = await run("test_pipeline_path", False)
+    assert lua_result == pipeline_result
+    assert lua_result[1]["used_comments_count"] == "0"
+
+
+def test_leaderboard_uses_gift_catalog():
+    asyncio.run(_run_leaderboard_uses_gift_catalog())
+
+
+class StaticGiftCatalog:
+    def __init__(self, gifts):
+        self.gifts = gifts
+
+    def get(self, gift_id):
+        return self.gifts.get(gift_id)
+
+
+async def _run_leaderboard_uses_gift_catalog():
+    r = await _connect_redis()
+
+    session_id = "test_gift_catalog_session"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+
+    catalog = StaticGiftCatalog(
+        {"gift_1": {"name": "Rose", "diamond_count": 1, "icon": "rose.png"}}
+    )
+    service = ScoringService(r, session_id, catalog)
+    for _ in range(3):
+        await service.process_batch(
+            [
+                NormalizedEvent(
+                    GIFT,
+                    "user_1",
+                    "Alice",
+                    count=1,
+                    gift_id="gift_1",
+                    gift_name="Rose",
+                    diamond_count=1,
+                    gift_image="rose.png",
+                ),
+                NormalizedEvent(
+                    GIFT,
+                    "user_1",
+                    "Alice",
+                    count=2,
+                    gift_id="gift_2",
+                    gift_name="Galaxy",
+                    diamond_count=1000,
+                    gift_image="galaxy.png",
+                ),
+            ]
+        )
+
+    # gift_1 comes from the catalog, gift_2 falls back to the session hash
+    await r.hdel(f"session:{session_id}:gift_meta", "gift_1")
+    breakdown = (await service.get_leaderboard())[0]["gifts_breakdown"]
+    assert breakdown["Rose"] == {
+        "id": "gift_1",
+        "count": 3,
+        "diamond_count": 1,
+        "icon": "rose.png",
+    }
+    assert breakdown["Galaxy"]["count"] == 6
+    assert breakdown["Galaxy"]["icon"] == "galaxy.png"
+
+    await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_leaderboard_window_and_fields():
+    asyncio.run(_run_leaderboard_window_and_fields())
+
+
+async def _run_leaderboard_window_and_fields():
+    r = await _connect_redis()
+
+    session_id = "test_leaderboard_window"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+
+    service = ScoringService(r, session_id)
+    for i in range(5):
+        await service.process_like(f"user_{i}", f"User{i}", (i + 1) * 15, True)
+
+    full = await service.get_leaderboard()
+    assert [row["rank"] for row in full] == [1, 2, 3, 4, 5]
+
+    # Ranks 2-3 only, with just the requested fields
+    page = await service.get_leaderboard(1, 2, ["nickname", "score", "rank"])
+    assert page == [
+        {key: row[key] for key in ("nickname", "score", "rank")} for row in full[1:3]
+    ]
+    assert await service.get_leaderboard(10, 5) == []
+
+    try:
+        await service.get_leaderboard(fields=["password"])
+        assert False, "unknown field must be rejected"
+    except ValueError:
+        pass
+
+    await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_user_rank_neighborhood():
+    asyncio.run(_run_user_rank_neighborhood())
+
+
+async def _run_user_rank_neighborhood():
+    r = await _connect_redis()
+
+    session_id = "test_user_rank"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+
+    service = ScoringService(r, session_id)
+    for i in range(6):
+        await service.process_like(f"user_{i}", f"User{i}", (i + 1) * 15, True)
+
+    # user_3 is 3rd (user_5, user_4 above it)
+    result = await service.get_user_rank("user_3", around=1, fields=["user_id", "rank"])
+    assert result["rank"] == 3
+    assert result["score"] == 6
+    assert result["total"] == 6
+    assert result["above"] == [{"user_id": "user_4", "rank": 2}]
+    assert result["entry"] == {"user_id": "user_3", "rank": 3}
+    assert result["below"] == [{"user_id": "user_2", "rank": 4}]
+
+    # Top of the board has nobody above
+    top = await service.get_user_rank("user_5", around=2, fields=["user_id"])
+    assert top["above"] == [] and len(top["below"]) == 2
+    assert await service.get_user_rank("nobody") is None
+
+    await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_nickname_change_keeps_one_member_and_migration():
+    asyncio.run(_run_nickname_change_keeps_one_member_and_migration())
+
+
+async def _run_nickname_change_keeps_one_member_and_migration():
+    r = await _connect_redis()
+
+    session_id = "test_member_keys"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+
+    service = ScoringService(r, session_id)
+    await service.process_like("user_1", "Alice", 20, True)
+    await service.process_like("user_1", "Alice2", 20, True)
+    leaderboard = await service.get_leaderboard()
+    assert [(row["user_id"], row["nickname"], row["score"]) for row in leaderboard] == [
+        ("user_1", "Alice2", 4)
+    ]
+
+    # Legacy "user_id|nickname" members (split by a rename) merge into one
+    await r.delete(service.leaderboard_key, MEMBER_MIGRATION_KEY)
+    await r.zadd(service.leaderboard_key, {"user_1|Alice": 2, "user_1|Alice2": 3, "user_2|Bob": 1})
+    assert await migrate_leaderboard_members(r) == 3
+    assert await r.zrange(service.leaderboard_key, 0, -1, withscores=True) == [
+        ("user_2", 1.0),
+        ("user_1", 5.0),
+    ]
+    assert await r.hget(f"session:{session_id}:user_data:user_2", "nickname") == "Bob"
+    # One-shot
+    await r.zadd(service.leaderboard_key, {"user_3|Carol": 1})
+    assert await migrate_leaderboard_members(r) == 0
+
+    await r.delete(MEMBER_MIGRATION_KEY, *(await r.keys(f"session:{session_id}:*")))
+
+
+def test_columnar_layout_matches_hash_layout():
+    asyncio.run(_run_columnar_layout_matches_hash_layout())
+
+
+async def _run_columnar_layout_matches_hash_layout():
+    r = await _connect_redis()
+
+    sessions = ("test_layout_hash", "test_layout_columnar", "test_layout_converted")
+    for session_id in sessions:
+        keys = await r.keys(f"session:{session_id}:*")
+        if keys:
+            await r.delete(*keys)
+
+    async def play(service):
+        await service.process_like("user_1", "Alice", 15, True, "a.png")
+        await service.process_gift("user_2", "Bob", 10, "gift_1", "Rose", 3, None, "rose.png")
+        await service.process_batch(
+            [
+                NormalizedEvent(LIKE, "user_2", "Bob", None, False, count=30),
+                NormalizedEvent(COMMENT, "user_3", "Carol", comment="Hi"),
+            ]
+        )
+        await service.increment_used_comments("user_3")
+        await service.decrement_used_comments("user_3")
+
+    async def snapshot(service):
+        return (
+            await service.get_leaderboard(),
+            [
+                await service.get_user_stats_and_comments(user_id)
+                for user_id in ("user_1", "user_2", "user_3")
+            ],
+        )
+
+    hashed = ScoringService(r, sessions[0])
+    columnar = ScoringService(r, sessions[1], layout=LAYOUT_COLUMNAR)
+    converted = ScoringService(r, sessions[2])
+    for service in (hashed, columnar, converted):
+        await play(service)
+    assert await converted.convert_to_columnar() == 3
+    assert converted.layout == LAYOUT_COLUMNAR
+    # Same write path (row updates via ROW_SCRIPT) as a fresh columnar instance
+    assert converted.use_scripts == columnar.use_scripts
+    for service in (hashed, columnar, converted):
+        await service.process_batch(
+            [NormalizedEvent(LIKE, "user_3", "Carol", None, True, count=20)]
+        )
+
+    def without_timestamps(result):
+        leaderboard, users = result
+        for user in users:
+            user["comments"] = [c["text"] for c in user["comments"]]
+        return leaderboard, users
+
+    expected = without_timestamps(await snapshot(hashed))
+    assert without_timestamps(await snapshot(columnar)) == expected
+    assert without_timestamps(await snapshot(converted)) == expected
+    # No per-user stat keys left after converting
+    assert not await r.keys(f"session:{sessions[2]}:user_data:*")
+    assert not await r.keys(f"session:{sessions[2]}:user_gifts:*")
+
+    await hashed.reset_user_stats("user_2")
+    await columnar.reset_user_stats("user_2")
+    assert without_timestamps(await snapshot(columnar)) == without_timestamps(
+        await snapshot(hashed)
+    )
+
+    for session_id in sessions:
+        await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_rows_maintained_on_write_match_rebuilt_rows():
+    asyncio.run(_run_rows_maintained_on_write_match_rebuilt_rows())
+
+
+async def _run_rows_maintained_on_write_match_rebuilt_rows():
+    r = await _connect_redis()
+
+    for layout in ("hash", LAYOUT_COLUMNAR):
+        session_id = f"test_rows_{layout}"
+        keys = await r.keys(f"session:{session_id}:*")
+        if keys:
+            await r.delete(*keys)
+
+        service = ScoringService(r, session_id, layout=layout)
+        await service.process_like("user_1", "Alice", 15, True, "a.png")
+        await service.process_gift("user_1", "Alice", 10, "gift_1", "Rose", 3, None, "rose.png")
+        await service.process_comment("user_2", "Hi", "Bob")
+        await service.process_batch(
+            [
+                NormalizedEvent(LIKE, "user_2", "Bob2", "b.png", False, count=30),
+                NormalizedEvent(COMMENT, "user_3", "Carol", comment="Hello"),
+            ]
+        )
+        await service.increment_used_comments("user_2")
+        await service.reset_user_stats("user_1")
+
+        assert await r.hlen(service.rows_key) == 3
+        maintained = await service.get_leaderboard()
+        # Rows rebuilt from the raw stats must match the ones kept on write
+        await r.delete(service.rows_key)
+        assert await service.get_leaderboard() == maintained
+        assert maintained[0]["nickname"] == "Bob2"
+        assert maintained[0]["comments"] == 0
+
+        await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_batch_scores_and_rows_commit_in_one_transaction():
+    asyncio.run(_run_batch_scores_and_rows_commit_in_one_transaction())
+
+
+async def _run_batch_scores_and_rows_commit_in_one_transaction():
+    r = await _connect_redis()
+    session_id = "test_batch_transaction"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+    service = ScoringService(r, session_id)
+
+    pipelines = []
+    make_pipeline = r.pipeline
+
+    def recording_pipeline(transaction=True, **kwargs):
+        pipe = make_pipeline(transaction=transaction, **kwargs)
+        execute = pipe.execute
+
+        async def recording_execute(*args, **kw):
+            commands = [command[0][0] for command in pipe.command_stack]
+            pipelines.append((transaction, commands))
+            return await execute(*args, **kw)
+
+        pipe.execute = recording_execute
+        return pipe
+
+    r.pipeline = recording_pipeline
+    try:
+        await service.process_batch(
+            [NormalizedEvent(LIKE, "user_1", "Alice", None, True, count=15)]
+        )
+    finally:
+        del r.pipeline
+
+    # The score write and the row rebuild (EVALSHA) share one MULTI/EXEC
+    assert len(pipelines) == 1
+    transaction, commands = pipelines[0]
+    assert transaction is True
+    assert commands[0] == "ZINCRBY" and commands[-1] == "EVALSHA"
+    row = json.loads(await r.hget(service.rows_key, "user_1"))
+    assert (row["nickname"], row["likes"]) == ("Alice", 15)
+
+    await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
+def test_gift_icon_change_reaches_every_cached_row():
+    asyncio.run(_run_gift_icon_change_reaches_every_cached_row())
+
+
+async def _run_gift_icon_change_reaches_every_cached_row():
+    r = await _connect_redis()
+    session_id = "test_gift_icon_change"
+    keys = await r.keys(f"session:{session_id}:*")
+    if keys:
+        await r.delete(*keys)
+    catalog = StaticGiftCatalog({})
+    service = ScoringService(r, session_id, catalog)
+
+    def rose(user_id, nickname, icon):
+        return NormalizedEvent(
+            GIFT,
+            user_id,
+            nickname,
+            count=1,
+            gift_id="gift_1",
+            gift_name="Rose",
+            diamond_count=1,
+            gift_image=icon,
+        )
+
+    await service.process_batch([rose("user_1", "Alice", "rose_v1.png")])
+    # Only Bob scores after the icon changes: Alice's cached row is not rebuilt
+    await service.process_batch([rose("user_2", "Bob", "rose_v2.png")])
+    stored = json.loads(await r.hget(service.rows_key, "user_1"))
+    assert stored["gifts_breakdown"]["Rose"]["icon"] == "rose_v1.png"
+
+    # Not in the catalog: the session's gift_meta hash has the new icon
+    rows = await service.get_leaderboard()
+    assert [row["gifts_breakdown"]["Rose"]["icon"] for row in rows] == [
+        "rose_v2.png",
+        "rose_v2.png",
+    ]
+
+    # The catalog wins over both (renamed gift moves to its new key)
+    catalog.gifts["gift_1"] = {"name": "Red Rose", "diamond_count": 1, "icon": "r3.png"}
+    rows = await service.get_leaderboard(fields=("user_id", "gifts_breakdown"))
+    assert [row["gifts_breakdown"] for row in rows] == [
+        {"Red Rose": {"id": "gift_1", "count": 1, "diamond_count": 1, "icon": "r3.png"}}
+    ] * 2
+
+    await r.delete(*(await r.keys(f"session:{session_id}:*")))
+
+
 if __name__ == "__main__":
     test_scoring()
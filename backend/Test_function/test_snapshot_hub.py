@@ -0,0 +1,192 @@
+import sys
+import os
+import asyncio
+import json
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.snapshot_hub import SnapshotHub, diff_leaderboard
+from app.services.change_notifier import ChangeNotifier
+from app.services.ws_views import View, DEFAULT_VIEW
+
+
+class FakeGameManager:
+    def __init__(self):
+        self.leaderboard_calls = 0
+        self.logs = [{"id": 1, "message": "hello"}]
+        self.is_connected = True
+        self.is_paused = False
+        self.current_session_id = "s1"
+
+    async def get_leaderboard(self, offset=0, limit=None, fields=None):
+        self.leaderboard_calls += 1
+        return [{"user_id": "u1", "score": self.leaderboard_calls, "rank": 1}]
+
+    async def get_leaderboard_counts(self):
+        return {"total": 1, "scored": 1}
+
+    def get_logs(self, after_id=0, limit=None):
+        return [log for log in self.logs if log["id"] > after_id]
+
+    def get_current_question(self):
+        return None
+
+    def get_gift_streaks(self):
+        return []
+
+
+def test_one_snapshot_per_tick_is_shared_by_all_subscribers():
+    async def run():
+        gm = FakeGameManager()
+        hub = SnapshotHub(gm, max_interval_ms=60_000)
+        hub.start()
+        for _ in range(3):
+            hub.add_subscriber()
+
+        frames = await asyncio.gather(*(hub.next_frame(0) for _ in range(3)))
+        await hub.stop()
+        return gm, hub, frames
+
+    gm, hub, frames = asyncio.run(run())
+    assert gm.leaderboard_calls == 1
+    assert frames[0] is frames[1] is frames[2]
+    payload = json.loads(frames[0].views[DEFAULT_VIEW].text)
+    assert payload["leaderboard"] == [{"user_id": "u1", "score": 1, "rank": 1}]
+    assert payload["logs"] == [{"id": 1, "message": "hello"}]
+    assert (frames[0].logs_after, frames[0].last_log_id) == (0, 1)
+    assert hub.get_metrics()["subscribers"] == 3
+
+
+def test_delta_frames_carry_only_changed_rows():
+    async def run():
+        gm = FakeGameManager()
+        hub = SnapshotHub(gm)
+        first = await hub.produce()
+        second = await hub.produce()
+        return first, second
+
+    first, second = asyncio.run(run())
+    snapshot = json.loads(first.views[DEFAULT_VIEW].snapshot_v2)
+    delta = json.loads(second.views[DEFAULT_VIEW].delta_v2)
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["leaderboard"] == [{"user_id": "u1", "score": 1, "rank": 1}]
+    assert (delta["type"], delta["seq"], delta["base"]) == ("delta", 2, 1)
+    # Only the score changed; rank and user_id are not resent as new rows
+    assert delta["upsert"] == [{"score": 2, "user_id": "u1"}]
+    assert delta["remove"] == []
+
+
+def test_diff_leaderboard_inserts_and_removes():
+    previous = {
+        "a": {"user_id": "a", "score": 5, "rank": 1},
+        "b": {"user_id": "b", "score": 3, "rank": 2},
+    }
+    rows = [
+        {"user_id": "c", "score": 9, "rank": 1},
+        {"user_id": "a", "score": 5, "rank": 2},
+    ]
+    upsert, remove = diff_leaderboard(previous, rows)
+    assert upsert == [rows[0], {"rank": 2, "user_id": "a"}]
+    assert remove == ["b"]
+
+
+def test_change_notification_pushes_a_frame_before_the_interval():
+    async def run():
+        gm = FakeGameManager()
+        notifier = ChangeNotifier()  # in-process only
+        hub = SnapshotHub(gm, min_interval_ms=0, max_interval_ms=60_000)
+        notifier.add_listener(hub.wake)
+        hub.start()
+        hub.add_subscriber()
+        first = await hub.next_frame(0)
+
+        # A score write signals a change: the next frame comes right away
+        await notifier.notify("s1")
+        second = await asyncio.wait_for(hub.next_frame(first.seq), 1.0)
+        await hub.stop()
+        return first, second, notifier
+
+    first, second, notifier = asyncio.run(run())
+    assert second.seq == first.seq + 1
+    assert json.loads(second.views[DEFAULT_VIEW].text)["leaderboard"][0]["score"] == 2
+    assert notifier.get_metrics() == {"local": 1, "published": 0, "remote": 0}
+
+
+def test_views_render_only_subscribed_channels():
+    async def run():
+        gm = FakeGameManager()
+        gm.logs.append({"id": 2, "level": "ERROR", "type": "System", "message": "x"})
+        gm.logs[0].update(level="INFO", type="Like")
+        hub = SnapshotHub(gm)
+        overlay = View.from_message(
+            {"type": "subscribe", "leaderboard": {"limit": 5, "fields": ["score"]}}
+        )
+        errors = View.from_message(
+            {"type": "subscribe", "logs": {"levels": ["ERROR"]}, "question": True}
+        )
+        hub.add_subscriber(overlay)
+        hub.add_subscriber(errors)
+        frame = await hub.produce()
+        return gm, frame, overlay, errors
+
+    gm, frame, overlay, errors = asyncio.run(run())
+    assert set(frame.views) == {overlay, errors}
+    assert json.loads(frame.views[overlay].text) == {
+        "leaderboard": [{"user_id": "u1", "score": 1, "rank": 1}],
+        "total": 1,
+        "scored": 1,
+    }
+    assert json.loads(frame.views[errors].text) == {
+        "question": None,
+        "logs": [{"id": 2, "level": "ERROR", "type": "System", "message": "x"}],
+    }
+    # Leaderboard is fetched once for both views
+    assert gm.leaderboard_calls == 1
+
+
+def test_leaderboard_window_covers_all_views():
+    hub = SnapshotHub(FakeGameManager())
+    top = View.from_message({"leaderboard": {"limit": 5, "fields": ["nickname"]}})
+    page = View.from_message({"leaderboard": {"offset": 3, "limit": 10, "fields": ["score"]}})
+    assert hub._leaderboard_window([top, page]) == (
+        0,
+        13,
+        ["user_id", "nickname", "score", "rank"],
+    )
+    assert hub._leaderboard_window([page, View()]) == (0, None, None)
+    assert hub._leaderboard_window([View(leaderboard=False)]) is None
+
+    rows = [{"user_id": f"u{i}", "rank": i + 1} for i in range(3, 13)]
+    assert page.project_rows(rows, base=3) == rows
+
+
+def test_repeated_frames_keep_each_views_window():
+    class RankedGameManager(FakeGameManager):
+        async def get_leaderboard(self, offset=0, limit=None, fields=None):
+            self.leaderboard_calls += 1
+            score = 10 * self.leaderboard_calls
+            ranks = range(offset + 1, offset + 1 + min(limit or 8, 8))
+            return [
+                {"user_id": f"u{rank}", "score": score - rank, "rank": rank}
+                for rank in ranks
+            ]
+
+    async def run():
+        hub = SnapshotHub(RankedGameManager())
+        full = View.from_message({"leaderboard": {"limit": 5}, "question": True})
+        board = View.from_message({"leaderboard": {"limit": 5}})
+        hub.add_subscriber(full)
+        hub.add_subscriber(board)
+        frames = [await hub.produce() for _ in range(3)]
+        return frames, full, board
+
+    frames, full, board = asyncio.run(run())
+    for seq, frame in enumerate(frames, start=1):
+        for view in (full, board):
+            view_frame = frame.views[view]
+            rows = json.loads(view_frame.text)["leaderboard"]
+            assert [row["rank"] for row in rows] == [1, 2, 3, 4, 5]
+            assert rows[0]["score"] == 10 * seq - 1
+            assert view_frame.base == seq - 1
+            assert json.loads(view_frame.delta_v2)["base"] == seq - 1
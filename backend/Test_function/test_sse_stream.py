@@ -0,0 +1,82 @@
+import sys
+import os
+import asyncio
+import json
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.snapshot_hub import SnapshotHub
+from app.services.ws_views import View
+from app.services.sse_stream import (
+    STREAM_ID,
+    event_id,
+    format_event,
+    parse_last_event_id,
+)
+
+
+class FakeGameManager:
+    is_connected = True
+    is_paused = False
+    current_session_id = "s1"
+
+    def __init__(self):
+        self.rows = [
+            {"user_id": "u1", "score": 5, "rank": 1},
+            {"user_id": "u2", "score": 3, "rank": 2},
+        ]
+
+    async def get_leaderboard(self, offset=0, limit=None, fields=None):
+        return [dict(row) for row in self.rows]
+
+    async def get_leaderboard_counts(self):
+        return {"total": len(self.rows), "scored": len(self.rows)}
+
+    def get_logs(self, after_id=0, limit=None):
+        return []
+
+    def get_current_question(self):
+        return None
+
+    def get_gift_streaks(self):
+        return []
+
+
+def test_event_ids_only_resume_within_this_stream():
+    assert parse_last_event_id(event_id(42)) == 42
+    assert parse_last_event_id("0123abcd.42") == (42 if STREAM_ID == "0123abcd" else 0)
+    assert parse_last_event_id(None) == 0
+    assert parse_last_event_id(f"{STREAM_ID}.x") == 0
+    assert format_event('{"a":1}', "delta", "s.3") == 'id: s.3\nevent: delta\ndata: {"a":1}\n\n'
+    assert format_event("a\nb") == "data: a\ndata: b\n\n"
+
+
+def test_reconnected_view_gets_delta_against_its_last_frame():
+    async def run():
+        gm = FakeGameManager()
+        hub = SnapshotHub(gm)
+        view = View.from_message({"leaderboard": {"limit": 5}, "question": True})
+        hub.add_subscriber(view)
+        first = await hub.produce()
+
+        # The overlay disconnects (only subscriber), scores change, it reconnects
+        hub.remove_subscriber(view)
+        gm.rows = [
+            {"user_id": "u2", "score": 9, "rank": 1},
+            {"user_id": "u3", "score": 1, "rank": 2},
+        ]
+        hub.add_subscriber(view)
+        second = await hub.produce()
+        return first, second, view
+
+    first, second, view = asyncio.run(run())
+    resumed = second.views[view]
+    assert resumed.base == first.seq
+    delta = json.loads(resumed.delta_v2)
+    assert delta["base"] == first.seq
+    assert delta["remove"] == ["u1"]
+    assert delta["upsert"] == [
+        {"score": 9, "rank": 1, "user_id": "u2"},
+        {"user_id": "u3", "score": 1, "rank": 2},
+    ]
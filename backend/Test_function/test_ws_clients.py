@@ -0,0 +1,122 @@
+import sys
+import os
+import asyncio
+import json
+
+import pytest
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import main
+from app.services.snapshot_hub import SnapshotHub
+from app.services.ws_clients import ClientRegistry, SlowClientError, CLOSE_SLOW_CLIENT
+from app.services.ws_views import View
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, data):
+        if self.stalled:
+            await asyncio.sleep(60)  # Tab in background: never drains
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.send_text(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_stalled_client_times_out_and_is_evicted():
+    async def run():
+        registry = ClientRegistry(send_timeout_ms=20)
+        head = {"seq": 7}
+        ok = registry.connect(FakeWebSocket(), "/ws", lambda: head["seq"])
+        stalled = registry.connect(FakeWebSocket(stalled=True), "/ws", lambda: head["seq"])
+
+        await ok.send("frame")
+        ok.frame_sent(7)
+        with pytest.raises(SlowClientError):
+            await stalled.send("frame")
+        metrics = registry.get_metrics()
+        await registry.disconnect(stalled, evicted=True)
+        return registry, ok, stalled, metrics
+
+    registry, ok, stalled, metrics = asyncio.run(run())
+    assert ok.websocket.sent == ["frame"]
+    assert metrics["clients"] == 2
+    # The stalled client is the furthest behind
+    assert metrics["max_lag_frames"] == 7
+    assert metrics["slowest"][0]["id"] == stalled.id
+    assert stalled.websocket.closed_with == CLOSE_SLOW_CLIENT
+    assert registry.get_metrics()["evicted"] == 1
+    assert list(registry.clients) == [ok.id]
+
+
+def test_replaced_frames_count_as_skipped():
+    registry = ClientRegistry()
+    client = registry.connect(FakeWebSocket(), "/ws/overlay", lambda: 9)
+    for seq in (1, 2, 5, 9):
+        client.frame_sent(seq)
+    assert (client.frames, client.skipped, client.lag()) == (4, 5, 0)
+
+
+class FakeGameManager:
+    is_connected = True
+    is_paused = False
+    current_session_id = "s1"
+
+    def __init__(self):
+        self.score = 5
+
+    async def get_leaderboard(self, offset=0, limit=None, fields=None):
+        return [{"user_id": "u1", "score": self.score, "rank": 1}]
+
+    async def get_leaderboard_counts(self):
+        return {"total": 1, "scored": 1}
+
+    def get_logs(self, after_id=0, limit=None):
+        return []
+
+    def get_current_question(self):
+        return None
+
+    def get_gift_streaks(self):
+        return []
+
+
+def test_v2_client_gets_snapshot_first_then_deltas(monkeypatch):
+    async def run():
+        gm = FakeGameManager()
+        hub = SnapshotHub(gm)
+        monkeypatch.setattr(main, "snapshot_hub", hub)
+        view = View.from_message({"leaderboard": {"limit": 5}})
+        hub.add_subscriber(view)
+
+        ws = FakeWebSocket()
+        client = ClientRegistry().connect(ws, "leaderboard", lambda: hub.seq)
+        state = {
+            "version": main.DELTA_PROTOCOL_VERSION,
+            "resync": False,
+            "view": view,
+        }
+        sender = asyncio.create_task(main._ws_send_frames(client, state))
+
+        for score in (5, 7):
+            gm.score = score
+            await hub.produce()
+            while client.sent_seq != hub.seq:
+                await asyncio.sleep(0.001)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        return [json.loads(text) for text in ws.sent]
+
+    messages = asyncio.run(run())
+    # Connect = snapshot even though the view's first render has base 0
+    assert [m["type"] for m in messages] == ["snapshot", "delta"]
+    assert messages[1]["base"] == messages[0]["seq"]
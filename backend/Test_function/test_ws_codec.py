@@ -0,0 +1,98 @@
+import sys
+import os
+import asyncio
+import json
+from dataclasses import replace
+
+import pytest
+
+# Add backend directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import ws_codec
+from app.services.ws_codec import (
+    FORMAT_JSON,
+    FORMAT_MSGPACK,
+    LOG_FIELDS,
+    encode,
+    decode,
+    negotiate_format,
+    unpack_rows,
+)
+from app.services.snapshot_hub import SnapshotHub
+from app.services.ws_views import View, DEFAULT_VIEW
+
+ROWS = [
+    {"user_id": "u1", "nickname": "A", "score": 9, "rank": 1},
+    {"user_id": "u2", "nickname": "B", "score": 4, "rank": 2},
+]
+LOGS = [{"id": 1, "time": "10:00:00", "level": "INFO", "type": "Like", "message": "x"}]
+
+
+def test_json_frames_match_stdlib_encoder():
+    payload = {"leaderboard": ROWS, "logs": LOGS, "question": None}
+    text = encode(payload)
+    assert isinstance(text, str)
+    assert json.loads(text) == payload
+    assert decode(text) == payload
+
+
+def test_msgpack_frames_pack_rows_once_per_frame():
+    pytest.importorskip("msgpack")
+    payload = {"type": "snapshot", "leaderboard": ROWS, "logs": LOGS, "total": 2}
+    data = encode(payload, FORMAT_MSGPACK, ("user_id", "score", "rank"))
+    assert isinstance(data, bytes)
+    assert len(data) < len(encode(payload))
+
+    message = decode(data)
+    assert message["leaderboard"]["fields"] == ["user_id", "score", "rank"]
+    assert unpack_rows(message["leaderboard"]) == [
+        {"user_id": "u1", "score": 9, "rank": 1},
+        {"user_id": "u2", "score": 4, "rank": 2},
+    ]
+    assert message["logs"]["fields"] == list(LOG_FIELDS)
+    assert unpack_rows(message["logs"]) == LOGS
+    assert message["total"] == 2
+
+
+def test_negotiation_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(ws_codec, "msgpack", None)
+    assert negotiate_format(FORMAT_MSGPACK) == FORMAT_JSON
+    assert negotiate_format("xml") == FORMAT_JSON
+
+
+def test_hub_renders_each_format_once():
+    pytest.importorskip("msgpack")
+
+    class FakeGameManager:
+        is_connected = True
+        is_paused = False
+        current_session_id = "s1"
+
+        async def get_leaderboard(self, offset=0, limit=None, fields=None):
+            return ROWS
+
+        async def get_leaderboard_counts(self):
+            return {"total": 2, "scored": 2}
+
+        def get_logs(self, after_id=0, limit=None):
+            return []
+
+        def get_current_question(self):
+            return None
+
+        def get_gift_streaks(self):
+            return []
+
+    binary = replace(DEFAULT_VIEW, format=FORMAT_MSGPACK)
+    hub = SnapshotHub(FakeGameManager())
+    hub.add_subscriber(DEFAULT_VIEW)
+    hub.add_subscriber(binary)
+    frame = asyncio.run(hub.produce())
+
+    text = frame.views[DEFAULT_VIEW].snapshot_v2
+    data = frame.views[binary].snapshot_v2
+    assert isinstance(text, str) and isinstance(data, bytes)
+    message = decode(data)
+    assert unpack_rows(message["leaderboard"]) == json.loads(text)["leaderboard"]
+    assert View.from_message({"type": "subscribe"}).format == FORMAT_JSON
@@ -2,6 +2,80 @@ import json
 import time
 import asyncio
 from app.services.scoring_service import ScoringService
+from app.services.logging_service import LoggingService
+from app.services.ingestion_service import IngestionService
+from app.events import NormalizedEvent, LIKE, GIFT, COMMENT, FOLLOW
+
+# Key ของ User ในแต่ละ Event ของไฟล์ที่บันทึกไว้ (camelCase)
+USER_KEYS = {
+    COMMENT: "userInfo",
+    LIKE: "user",
+    GIFT: "fromUser",
+}
+
+
+def _first_url(image: dict):
+    """URL แรกของรูป (ส่วนใหญ่ใช้ mUrls, Like ใช้ urlList)"""
+    image = image or {}
+    urls = image.get("mUrls") or image.get("urlList")
+    return urls[0] if urls else None
+
+
+def _mock_is_follower(user: dict) -> bool:
+    follow_info = user.get("follow_info") or user.get("followInfo") or {}
+    status = follow_info.get("follow_status", follow_info.get("followStatus", 0))
+    return status == 1
+
+
+def normalize_mock_event(event_type: str, payload: dict):
+    """
+    แปลง Event จากไฟล์ .jsonl เป็น NormalizedEvent
+    คืนค่า None ถ้าข้อมูลไม่พอจะคิดคะแนน
+    """
+    if event_type == FOLLOW:
+        # Follow payload คือ User เอง (ยังไม่คิดคะแนน)
+        return None
+
+    user_key = USER_KEYS.get(event_type)
+    if not user_key:
+        return None
+
+    user = payload.get(user_key) or {}
+    event = NormalizedEvent(
+        type=event_type,
+        user_id=user.get("id"),
+        nickname=user.get("nickName"),
+        avatar_url=_first_url(user.get("avatarThumb")),
+        is_follower=_mock_is_follower(user),
+    )
+    if not event.user_id:
+        return None
+
+    if event_type == COMMENT:
+        event.comment = payload.get("content")
+        return event if event.comment else None
+
+    if not event.nickname:
+        return None
+
+    if event_type == LIKE:
+        event.count = payload.get("count", 0)
+        return event if event.count > 0 else None
+
+    # GIFT
+    gift_info = payload.get("mGift", {})
+    event.count = payload.get("repeatCount", 1)
+    event.gift_id = str(gift_info.get("id", "Unknown"))
+    event.gift_name = gift_info.get("name", "Unknown Gift")
+    event.diamond_count = gift_info.get("diamondCount", 0)
+    event.gift_image = _first_url(gift_info.get("icon"))
+    event.streakable = bool(gift_info.get("combo", False))
+    # repeatEnd = 1 คือ Tick สุดท้ายของ Streak (ไฟล์เก่าไม่มี field นี้ = จบแล้ว)
+    event.streaking = event.streakable and payload.get("repeatEnd", 1) != 1
+    event.group_id = str(payload["groupId"]) if payload.get("groupId") else None
+    if event.diamond_count <= 0 or event.count <= 0:
+        return None
+    return event
 
 
 class MockLiveAdapter:
@@ -10,7 +84,11 @@ class MockLiveAdapter:
     """
 
     def __init__(
-        self, scoring_service: ScoringService, data_service, mock_file_path: str
+        self,
+        scoring_service: ScoringService,
+        data_service,
+        mock_file_path: str,
+        ingestion_service: IngestionService = None,
     ):
         self.service = scoring_service
         self.data_service = data_service
@@ -18,11 +96,19 @@ class MockLiveAdapter:
         self.is_scoring_active = True
         self.is_running = False
 
+        # Same path as the live adapter: normalize -> ingestion queue
+        self.owns_ingestion = ingestion_service is None
+        self.ingestion = ingestion_service or IngestionService(
+            scoring_service, LoggingService(), data_service, scoring_service.session_id
+        )
+
     def set_scoring(self, active: bool):
         self.is_scoring_active = active
 
     async def stop(self):
         self.is_running = False
+        if self.owns_ingestion:
+            await self.ingestion.stop()
         print("Mock Adapter Stopped")
 
     async def simulate_from_file(self, speed_multiplier: float = 1.0):
@@ -30,6 +116,8 @@ class MockLiveAdapter:
         เริ่มการจำลองโดยการอ่านไฟล์
         """
         self.is_running = True
+        if self.owns_ingestion:
+            self.ingestion.start()
         print(
             f"========= 🚀 MOCK SIMULATION START (Session: {self.service.session_id}) ========= "
         )
@@ -44,104 +132,21 @@ class MockLiveAdapter:
                         if not line.strip():
                             continue
 
-                        # ก่อนเรียก self.service.process_xxx
+                        # ก่อนส่ง Event เข้าคิว
                         if not self.is_scoring_active:
                             continue  # ข้าม Event นี้ไปเลยถ้าปิดรับคะแนนอยู่
 
                         try:
-                            event = json.loads(line)
-                            event_type = event.get("type")
-                            payload = event.get("payload")
+                            raw = json.loads(line)
 
                             # Simulate delay if needed (optional)
                             await asyncio.sleep(0.1 / speed_multiplier)
 
-                            if event_type == "comment":
-                                user_info = payload.get("userInfo", {})
-                                user_id = user_info.get("id")
-                                nickname = user_info.get("nickName")
-                                avatar_url = user_info.get("avatarThumb", {}).get(
-                                    "mUrls", [""]
-                                )[0]
-                                comment = payload.get("content")
-
-                                if user_id and comment:
-                                    await self.data_service.upsert_user(
-                                        user_id, nickname, avatar_url
-                                    )
-                                    await self.data_service.save_comment(
-                                        user_id, comment, self.service.session_id
-                                    )
-                                    self.service.process_comment(
-                                        user_id, comment, nickname, avatar_url
-                                    )
-
-                            elif event_type == "like":
-                                user = payload.get("user", {})
-                                user_id = user.get("id")
-                                nickname = user.get("nickName")
-                                avatar_url = user.get("avatarThumb", {}).get(
-                                    "urlList", [""]
-                                )[0]
-                                is_follower = (
-                                    user.get("follow_info", {}).get("follow_status", 0)
-                                    == 1
-                                )
-                                like_count = payload.get("count", 0)
-
-                                if user_id and nickname and like_count > 0:
-                                    await self.data_service.upsert_user(
-                                        user_id, nickname, avatar_url
-                                    )
-                                    self.service.process_like(
-                                        user_id,
-                                        nickname,
-                                        like_count,
-                                        is_follower,
-                                        avatar_url,
-                                    )
-
-                            elif event_type == "gift":
-                                user = payload.get("fromUser", {})
-                                user_id = user.get("id")
-                                nickname = user.get("nickName")
-                                avatar_url = user.get("avatarThumb", {}).get(
-                                    "mUrls", [""]
-                                )[0]
-
-                                gift_info = payload.get("mGift", {})
-                                coin_value_per_unit = gift_info.get("diamondCount", 0)
-                                gift_id = gift_info.get("id", "Unknown")
-                                gift_name = gift_info.get("name", "Unknown Gift")
-                                gift_quantity = payload.get("repeatCount", 1)
-
-                                if (
-                                    user_id
-                                    and nickname
-                                    and coin_value_per_unit > 0
-                                    and gift_quantity > 0
-                                ):
-                                    await self.data_service.upsert_user(
-                                        user_id, nickname, avatar_url
-                                    )
-                                    await self.data_service.save_gift(
-                                        user_id,
-                                        gift_id,
-                                        gift_name,
-                                        coin_value_per_unit,
-                                        gift_quantity,
-                                        self.service.session_id,
-                                    )
-
-                                    self.service.process_gift(
-                                        user_id,
-                                        nickname,
-                                        coin_value_per_unit,
-                                        gift_id,
-                                        gift_name,
-                                        gift_quantity,
-                                        avatar_url,
-                                    )
+                            event = normalize_mock_event(
+                                raw.get("type"), raw.get("payload") or {}
+                            )
+                            if event:
+                                await self.ingestion.submit(event)
 
                         except json.JSONDecodeError:
                             print(f"Warning: Skipping malformed line: {line}")
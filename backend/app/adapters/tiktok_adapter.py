@@ -12,8 +12,86 @@ from TikTokLive.events import (
 from app.services.scoring_service import ScoringService
 from app.services.logging_service import LoggingService
 from app.services.data_service import DataService
-import json
-from datetime import datetime
+from app.services.ingestion_service import IngestionService, log_ingestion_error
+from app.events import NormalizedEvent, IncompleteEventError, LIKE, GIFT, COMMENT
+
+# ลำดับ Attribute ที่ใช้หา User ของแต่ละ Event
+# CRITICAL: event.user raises TypeError on Like/Comment in some TikTokLive versions,
+# so it is only tried after user_info.
+USER_ATTRS = {
+    LIKE: ("user_info", "user", "sender"),
+    GIFT: ("user", "user_info", "sender"),
+    COMMENT: ("user_info", "user"),
+}
+
+
+def _first_attr(obj, names):
+    """getattr ตามลำดับ คืนค่าตัวแรกที่มีค่า (ข้ามตัวที่ raise TypeError)"""
+    for name in names:
+        try:
+            value = getattr(obj, name, None)
+        except TypeError:
+            continue
+        if value:
+            return value
+    return None
+
+
+def _first_url(image):
+    """URL แรกของ ImageModel (m_urls / url_list / urls แล้วแต่เวอร์ชัน)"""
+    if not image:
+        return None
+    urls = _first_attr(image, ("m_urls", "url_list", "urls"))
+    return urls[0] if urls else None
+
+
+def normalize_tiktok_event(event_type: str, event) -> NormalizedEvent:
+    """
+    แปลง TikTokLive Event (betterproto) เป็น NormalizedEvent ในรอบเดียว
+    raise IncompleteEventError ถ้าไม่มีข้อมูล User ที่ต้องใช้
+    """
+    event_name = type(event).__name__
+    user = _first_attr(event, USER_ATTRS[event_type])
+    if not user:
+        raise IncompleteEventError(f"{event_name} received without user info")
+
+    # unique_id is often 'username' and nickname 'nick_name' in ExtendedUser
+    unique_id = _first_attr(user, ("unique_id", "username"))
+    nickname = _first_attr(user, ("nickname", "nick_name"))
+    if not unique_id or not nickname:
+        raise IncompleteEventError(
+            f"Incomplete user info in {event_name}: {unique_id}, {nickname}"
+        )
+
+    # Follower Status
+    follow_info = getattr(user, "follow_info", None)
+    is_follower = bool(follow_info) and getattr(follow_info, "follow_status", 0) == 1
+
+    normalized = NormalizedEvent(
+        type=event_type,
+        user_id=unique_id,
+        nickname=nickname,
+        avatar_url=_first_url(getattr(user, "avatar_thumb", None)),
+        is_follower=is_follower,
+    )
+
+    if event_type == LIKE:
+        normalized.count = event.count
+    elif event_type == GIFT:
+        gift = event.gift
+        normalized.count = event.repeat_count
+        normalized.gift_id = str(gift.id)
+        normalized.gift_name = gift.name
+        normalized.diamond_count = gift.diamond_count
+        normalized.gift_image = gift.icon.m_urls[0]
+        normalized.streakable = gift.streakable
+        normalized.streaking = event.streaking
+        group_id = getattr(event, "group_id", None)
+        normalized.group_id = str(group_id) if group_id else None
+    elif event_type == COMMENT:
+        normalized.comment = event.comment
+
+    return normalized
 
 
 class TikTokLiveAdapter:
@@ -24,6 +102,7 @@ class TikTokLiveAdapter:
         data_service: DataService,
         unique_id: str,
         session_id: str,
+        ingestion_service: IngestionService = None,
     ):
         self.scoring_service = scoring_service
         self.logging_service = logging_service
@@ -33,6 +112,13 @@ class TikTokLiveAdapter:
         self.client = TikTokLiveClient(unique_id=self.unique_id)
         self.is_running = False
 
+        # Callbacks only normalize & enqueue; DB/Redis work happens in the queue workers.
+        # If no shared queue is given, the adapter owns its own.
+        self.owns_ingestion = ingestion_service is None
+        self.ingestion = ingestion_service or IngestionService(
+            scoring_service, logging_service, data_service, session_id
+        )
+
         # Register events
         self.client.add_listener(ConnectEvent, self.on_connect)
         self.client.add_listener(DisconnectEvent, self.on_disconnect)
@@ -44,21 +130,12 @@ class TikTokLiveAdapter:
 
     async def log_ingestion_error(self, error: Exception, event_data: dict):
         """Log ingestion errors to a JSONL file"""
-        try:
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "error": str(error),
-                "event_data": str(
-                    event_data
-                ),  # Convert to string to avoid serialization issues
-            }
-            with open("ingestion_errors.jsonl", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as log_err:
-            print(f"Failed to log ingestion error: {log_err}")
+        await log_ingestion_error(error, event_data)
 
     async def start(self):
         self.is_running = True
+        if self.owns_ingestion:
+            self.ingestion.start()
         await self.logging_service.info(
             f"Starting TikTokLiveAdapter for {self.unique_id}"
         )
@@ -83,6 +160,8 @@ class TikTokLiveAdapter:
         self.is_running = False
         if self.client.connected:
             await self.client.disconnect()
+        if self.owns_ingestion:
+            await self.ingestion.stop()
         await self.logging_service.info("TikTokLiveAdapter stopped")
 
     async def on_connect(self, event: ConnectEvent):
@@ -91,225 +170,31 @@ class TikTokLiveAdapter:
     async def on_disconnect(self, event: DisconnectEvent):
         await self.logging_service.warning("❌ Disconnected from TikTok Live")
 
-    async def on_like(self, event: LikeEvent):
+    async def _ingest(self, event_type: str, event):
+        """Normalize a TikTok event and hand it to the ingestion queue"""
         try:
-            # CRITICAL: Do not access event.user directly, it raises TypeError in this version.
-            # Use event.user_info or event.sender if available.
-            user = getattr(event, "user_info", getattr(event, "user", None))
-            if not user:
-                # Fallback for some versions
-                user = getattr(event, "sender", None)
-
-            if not user:
-                await self.logging_service.warning(
-                    "LikeEvent received without user info"
-                )
-                return
-
-            # Robust Attribute Access
-            # unique_id is often 'username' in ExtendedUser
-            unique_id = getattr(user, "unique_id", getattr(user, "username", None))
-            # nickname is often 'nick_name' in ExtendedUser
-            nickname = getattr(user, "nickname", getattr(user, "nick_name", None))
-
-            if not unique_id or not nickname:
-                await self.logging_service.warning(
-                    f"Incomplete user info in LikeEvent: {unique_id}, {nickname}"
-                )
-                return
-
-            # Avatar Extraction
-            avatar_thumb = getattr(user, "avatar_thumb", None)
-            avatar_url = None
-            if avatar_thumb:
-                if hasattr(avatar_thumb, "m_urls") and avatar_thumb.m_urls:
-                    avatar_url = avatar_thumb.m_urls[0]
-                elif hasattr(avatar_thumb, "url_list") and avatar_thumb.url_list:
-                    avatar_url = avatar_thumb.url_list[0]
-                elif hasattr(avatar_thumb, "urls") and avatar_thumb.urls:
-                    avatar_url = avatar_thumb.urls[0]
-
-            await self.data_service.upsert_user(unique_id, nickname, avatar_url)
-
-            # Follower Status
-            is_follower = False
-            follow_info = getattr(user, "follow_info", None)
-            if follow_info and hasattr(follow_info, "follow_status"):
-                is_follower = follow_info.follow_status == 1
-
-            self.scoring_service.process_like(
-                unique_id,
-                nickname,
-                event.count,
-                is_follower,
-                avatar_url=avatar_url,
-            )
-
-            # Log for Admin Dashboard
-            await self.logging_service.info(
-                f"{nickname} sent {event.count} likes",
-                details={"type": "Like"},
-            )
+            normalized = normalize_tiktok_event(event_type, event)
+        except IncompleteEventError as e:
+            await self.logging_service.warning(str(e))
+            return
         except Exception as e:
-            # Do NOT access event.user in error handling either
-            await self.log_ingestion_error(e, {"type": "Like", "data": str(event)})
+            # Do NOT access event.user in error handling
+            await self.log_ingestion_error(e, {"type": event_type, "data": str(event)})
             asyncio.create_task(
-                self.logging_service.error(f"Error processing like: {e}", e)
+                self.logging_service.error(f"Error processing {event_type}: {e}", e)
             )
+            return
 
-    async def on_gift(self, event: GiftEvent):
-        try:
-            # Robust User Extraction
-            user = getattr(
-                event,
-                "user",
-                getattr(event, "user_info", getattr(event, "sender", None)),
-            )
-
-            if not user:
-                await self.logging_service.warning(
-                    "GiftEvent received without user info"
-                )
-                return
-
-            unique_id = getattr(user, "unique_id", getattr(user, "username", None))
-            nickname = getattr(user, "nickname", getattr(user, "nick_name", None))
-
-            if not unique_id or not nickname:
-                await self.logging_service.warning(
-                    f"Incomplete user info in GiftEvent: {unique_id}, {nickname}"
-                )
-                return
-
-            # Persist User & Gift
-            avatar_thumb = getattr(user, "avatar_thumb", None)
-            avatar_url = None
-            if avatar_thumb:
-                if hasattr(avatar_thumb, "m_urls") and avatar_thumb.m_urls:
-                    avatar_url = avatar_thumb.m_urls[0]
-                elif hasattr(avatar_thumb, "url_list") and avatar_thumb.url_list:
-                    avatar_url = avatar_thumb.url_list[0]
-                elif hasattr(avatar_thumb, "urls") and avatar_thumb.urls:
-                    avatar_url = avatar_thumb.urls[0]
-
-            await self.data_service.upsert_user(unique_id, nickname, avatar_url)
+        await self.ingestion.submit(normalized)
 
-            gift_icon = event.gift.icon
-            gift_image = gift_icon.m_urls[0]
-            # if hasattr(gift_icon, "urls") and gift_icon.urls:
-            #     gift_image = gift_icon.urls[0]
-
-            await self.data_service.upsert_gift(
-                str(event.gift.id),
-                event.gift.name,
-                event.gift.diamond_count,
-                gift_image,
-            )
-
-            if event.gift.streakable and not event.streaking:
-                # End of streak or single gift
-                self.scoring_service.process_gift(
-                    unique_id,
-                    nickname,
-                    event.gift.diamond_count,
-                    str(event.gift.id),
-                    event.gift.name,
-                    event.repeat_count,
-                    avatar_url=avatar_url,
-                    gift_icon=gift_image,
-                )
-            elif not event.gift.streakable:
-                # Non-streakable
-                self.scoring_service.process_gift(
-                    unique_id,
-                    nickname,
-                    event.gift.diamond_count,
-                    str(event.gift.id),
-                    event.gift.name,
-                    1,
-                    avatar_url=avatar_url,
-                    gift_icon=gift_image,
-                )
+    async def on_like(self, event: LikeEvent):
+        await self._ingest(LIKE, event)
 
-            # Log for Admin Dashboard
-            await self.logging_service.info(
-                f"{nickname} sent {event.gift.name} x{event.repeat_count}",
-                details={"type": "Gift"},
-            )
-        except Exception as e:
-            await self.log_ingestion_error(
-                e,
-                {"type": "Gift", "data": str(event)},
-            )
-            asyncio.create_task(
-                self.logging_service.error(f"Error processing gift: {e}", e)
-            )
+    async def on_gift(self, event: GiftEvent):
+        await self._ingest(GIFT, event)
 
     async def on_comment(self, event: CommentEvent):
-        try:
-            # CRITICAL: Do not access event.user directly, it raises TypeError.
-            # CommentEvent uses event.user_info.
-            user = getattr(event, "user_info", None)
-            if not user:
-                # Try fallback but event.user is known to fail
-                user = getattr(event, "user", None)
-
-            if not user:
-                await self.logging_service.warning(
-                    "CommentEvent received without user info"
-                )
-                return
-
-            # Robust Attribute Access
-            unique_id = getattr(user, "unique_id", getattr(user, "username", None))
-            nickname = getattr(user, "nickname", getattr(user, "nick_name", None))
-
-            if not unique_id or not nickname:
-                await self.logging_service.warning(
-                    f"Incomplete user info in CommentEvent: {unique_id}, {nickname}"
-                )
-                return
-
-            # Avatar Extraction
-            avatar_thumb = getattr(user, "avatar_thumb", None)
-            avatar_url = None
-            if avatar_thumb:
-                if hasattr(avatar_thumb, "m_urls") and avatar_thumb.m_urls:
-                    avatar_url = avatar_thumb.m_urls[0]
-                elif hasattr(avatar_thumb, "url_list") and avatar_thumb.url_list:
-                    avatar_url = avatar_thumb.url_list[0]
-                elif hasattr(avatar_thumb, "urls") and avatar_thumb.urls:
-                    avatar_url = avatar_thumb.urls[0]
-
-            await self.data_service.upsert_user(unique_id, nickname, avatar_url)
-            await self.data_service.save_comment(
-                unique_id, self.session_id, event.comment
-            )
-
-            self.scoring_service.process_comment(
-                unique_id,
-                event.comment,
-                user_nickname=nickname,
-                avatar_url=avatar_url,
-            )
-
-            # Log for Admin Dashboard
-            await self.logging_service.info(
-                f"{nickname}: {event.comment}", details={"type": "Chat"}
-            )
-        except Exception as e:
-            # Do NOT access event.user in error handling
-            await self.log_ingestion_error(
-                e,
-                {
-                    "type": "Comment",
-                    "comment": event.comment,
-                    "data": str(event),
-                },
-            )
-            asyncio.create_task(
-                self.logging_service.error(f"Error processing comment: {e}", e)
-            )
+        await self._ingest(COMMENT, event)
 
     async def on_follow(self, event: FollowEvent):
         # Optional: Give points for follow?
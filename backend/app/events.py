@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# ประเภท Event ที่ Adapter ทุกตัวส่งเข้ามา
+LIKE = "like"
+GIFT = "gift"
+COMMENT = "comment"
+FOLLOW = "follow"
+SHARE = "share"
+
+
+class IncompleteEventError(ValueError):
+    """Event จาก Source ขาดข้อมูล User ที่จำเป็น (ข้ามได้ ไม่ใช่ Error ร้ายแรง)"""
+
+
+@dataclass(slots=True)
+class NormalizedEvent:
+    """
+    Event กลางที่ Adapter ทุกตัว (TikTok / Mock) แปลงมาให้
+    Scoring, Persistence และ Logging ใช้ตัวนี้ตัวเดียว ไม่ต้องเดิน Protobuf ซ้ำ
+    """
+
+    type: str
+    user_id: str
+    nickname: str
+    avatar_url: Optional[str] = None
+    is_follower: bool = False
+
+    # like: จำนวน Like | gift: repeat_count (หรือจำนวนที่จะคิดคะแนน)
+    count: int = 0
+
+    # comment
+    comment: Optional[str] = None
+
+    # gift
+    gift_id: Optional[str] = None
+    gift_name: Optional[str] = None
+    diamond_count: int = 0
+    gift_image: Optional[str] = None
+    streakable: bool = False
+    streaking: bool = False
+    group_id: Optional[str] = None
@@ -1,9 +1,13 @@
 import asyncio
-import redis
 from datetime import datetime
-from app.services.scoring_service import ScoringService
+from app.services.scoring_service import ScoringService, get_session_layout
 from app.services.logging_service import LoggingService
 from app.services.data_service import DataService
+from app.services.ingestion_service import IngestionService
+from app.services.gift_catalog import GiftCatalog
+from app.services.change_notifier import ChangeNotifier
+from app.services.log_store import LogStore
+from app.services.redis_client import get_redis
 from app.adapters.mock_adapter import MockLiveAdapter
 from app.adapters.tiktok_adapter import TikTokLiveAdapter
 from app.models.base import AsyncSessionLocal
@@ -14,23 +18,27 @@ import uuid
 
 class GameManager:
     def __init__(self):
-        # Redis Connection
-        self.redis = redis.Redis(host="redis", port=6379, decode_responses=True)
+        # Redis Connection (async, shared connection pool)
+        self.redis = get_redis()
+
+        # Change notifications (scores / logs / question) for the WS publisher
+        self.notifier = ChangeNotifier(self.redis)
 
         # Services
         self.logging_service = LoggingService()
         self.data_service = DataService()
+        self.gift_catalog = GiftCatalog(self.data_service)
         self.current_session_id = None
         self.target_tiktok_id = None
         self.scoring_service = None
+        self.ingestion_service = None
 
         # State Variables
         self.is_connected = False
         self.is_paused = False
         self.is_scoring_active = False
         self.current_question = None
-        self.recent_logs = []  # Store recent logs for WebSocket
-        self.log_counter = 0
+        self.log_store = LogStore()  # Recent logs for WebSocket / dashboard
         self.adapter_task = None
         self.adapter = None
 
@@ -48,25 +56,19 @@ class GameManager:
 
     def add_log(self, level: str, message: str, log_type: str = "System"):
         """Add a log entry to be broadcasted via WebSocket"""
-        self.log_counter += 1
-        log_entry = {
-            "id": self.log_counter,
-            "time": datetime.now().strftime("%H:%M:%S"),
-            "level": level,
-            "type": log_type,
-            "message": message,
-        }
-        self.recent_logs.append(log_entry)
-        # Keep only last 50 logs in memory
-        if len(self.recent_logs) > 50:
-            self.recent_logs.pop(0)
+        self.log_store.append(level, message, log_type)
+        self.notifier.notify_local()
 
-    def get_logs(self, after_id: int = 0):
-        """Get logs newer than after_id (for WebSocket consumption)"""
-        if after_id == 0:
-            return self.recent_logs[:]
-
-        return [log for log in self.recent_logs if log["id"] > after_id]
+    def get_logs(
+        self,
+        after_id: int = 0,
+        until_id: int = None,
+        levels=None,
+        types=None,
+        limit: int = None,
+    ):
+        """Get logs newer than after_id (for WebSocket consumption), see LogStore.get"""
+        return self.log_store.get(after_id, until_id, levels, types, limit)
 
     async def set_current_question(
         self,
@@ -83,13 +85,14 @@ class GameManager:
             "content": content,
             "timestamp": datetime.now().isoformat(),
         }
+        self.notifier.notify_local()
 
         if comment_id:
             # Mark as used in DB
             await self.data_service.mark_comment_as_used(comment_id)
             # Increment used count in Redis (for Leaderboard)
             if self.scoring_service:
-                self.scoring_service.increment_used_comments(user_id)
+                await self.scoring_service.increment_used_comments(user_id)
 
         return self.current_question
 
@@ -98,6 +101,7 @@ class GameManager:
 
     def clear_current_question(self):
         self.current_question = None
+        self.notifier.notify_local()
         return {"status": "cleared"}
 
     async def set_session(
@@ -109,12 +113,25 @@ class GameManager:
             session_id = uuid.uuid4().hex
 
         self.current_session_id = session_id
-        self.scoring_service = ScoringService(self.redis, self.current_session_id)
 
         if reset:
-            keys = self.redis.keys(f"session:{session_id}:*")
+            keys = [
+                key async for key in self.redis.scan_iter(f"session:{session_id}:*")
+            ]
             if keys:
-                self.redis.delete(*keys)
+                await self.redis.delete(*keys)
+
+        # Layout ถูกเลือกตอน Session ยังว่าง แล้วใช้ตลอด Session
+        layout = await get_session_layout(self.redis, session_id, create=True)
+        self.scoring_service = ScoringService(
+            self.redis,
+            self.current_session_id,
+            self.gift_catalog,
+            self.notifier,
+            layout,
+        )
+        # Frame ของ Session ใหม่ (Overlay / WS) ไม่ต้องรอคะแนนแรก
+        self.notifier.notify_local()
 
         # Create or Update Session in DB
         try:
@@ -153,7 +170,7 @@ class GameManager:
             await self.set_session("new", channel_name=target_id)
 
         # Save last channel name
-        self.redis.set("last_channel_name", target_id)
+        await self.redis.set("last_channel_name", target_id)
 
         # Update channel name in DB if not set
         try:
@@ -176,9 +193,22 @@ class GameManager:
             "System",
         )
 
+        # Both adapters only normalize events; the queue workers do the I/O
+        self.ingestion_service = IngestionService(
+            self.scoring_service,
+            self.logging_service,
+            self.data_service,
+            self.current_session_id,
+            gift_catalog=self.gift_catalog,
+        )
+        self.ingestion_service.start()
+
         if mode == "mock":
             self.adapter = MockLiveAdapter(
-                self.scoring_service, self.data_service, "mock_data.jsonl"
+                self.scoring_service,
+                self.data_service,
+                "mock_data.jsonl",
+                ingestion_service=self.ingestion_service,
             )
             self.adapter_task = asyncio.create_task(
                 self.adapter.simulate_from_file(speed_multiplier=2.0)
@@ -190,6 +220,7 @@ class GameManager:
                 self.data_service,
                 target_id,
                 self.current_session_id,
+                ingestion_service=self.ingestion_service,
             )
             self.adapter_task = asyncio.create_task(self.adapter.start())
 
@@ -210,6 +241,8 @@ class GameManager:
             else:
                 await self.adapter.stop()
 
+        await self._stop_ingestion()
+
         self.is_paused = True
         self.add_log("INFO", "Stream paused", "System")
         return {"status": "paused"}
@@ -230,6 +263,8 @@ class GameManager:
             if self.adapter_task:
                 self.adapter_task.cancel()
 
+        await self._stop_ingestion()
+
         # Update DB status to CLOSED
         if self.current_session_id:
             try:
@@ -253,30 +288,58 @@ class GameManager:
         self.add_log("INFO", "Stream stopped and session closed", "System")
         return {"status": "stopped"}
 
+    async def _stop_ingestion(self):
+        """Drain queued events into Redis/DB, then stop the worker pool"""
+        if self.ingestion_service:
+            await self.ingestion_service.stop()
+            self.ingestion_service = None
+
+    def get_ingestion_metrics(self):
+        """Queue depth / age / drop counters of the running ingestion queue"""
+        if not self.ingestion_service:
+            return None
+        return self.ingestion_service.get_metrics()
+
+    def get_gift_streaks(self):
+        """Gift Streak ที่กำลังกดอยู่ (จากหน่วยความจำ ไม่แตะ Redis/DB)"""
+        if not self.ingestion_service:
+            return []
+        return self.ingestion_service.get_active_streaks()
+
     def toggle_scoring(self, active: bool):
         self.is_scoring_active = active
         return {"is_scoring_active": self.is_scoring_active}
 
-    def get_leaderboard(self):
+    async def get_leaderboard(self, offset: int = 0, limit: int = None, fields=None):
         if not self.scoring_service:
             return []
-        return self.scoring_service.get_leaderboard()
+        return await self.scoring_service.get_leaderboard(offset, limit, fields)
+
+    async def get_user_rank(self, user_id: str, around: int = 0, fields=None):
+        if not self.scoring_service:
+            return None
+        return await self.scoring_service.get_user_rank(user_id, around, fields)
+
+    async def get_leaderboard_counts(self):
+        if not self.scoring_service:
+            return {"total": 0, "scored": 0}
+        return await self.scoring_service.get_leaderboard_counts()
 
-    def select_winner(self):
+    async def select_winner(self):
         if not self.scoring_service:
             return None
 
         self.is_scoring_active = False
 
-        top_list = self.scoring_service.get_leaderboard()
+        top_list = await self.scoring_service.get_leaderboard(limit=1)
         if not top_list:
             return None
 
         winner_entry = top_list[0]
-        user_key = winner_entry["user_key"]
-        user_id, nickname = user_key.split("|", 1)
+        user_id = winner_entry["user_id"]
+        nickname = winner_entry["nickname"]
 
-        stats = self.scoring_service.get_user_stats_and_comments(user_id)
+        stats = await self.scoring_service.get_user_stats_and_comments(user_id)
 
         self.add_log(
             "INFO",
@@ -299,7 +362,7 @@ class GameManager:
             return None
 
         # Get basic stats from Redis
-        stats = self.scoring_service.get_user_stats_and_comments(user_id)
+        stats = await self.scoring_service.get_user_stats_and_comments(user_id)
 
         # Get detailed comments from DB (via DataService)
         db_comments = await self.data_service.get_user_comments(
@@ -326,7 +389,7 @@ class GameManager:
             return
 
         # 1. Reset Redis Stats (Move to Used)
-        self.scoring_service.reset_user_stats(user_id)
+        await self.scoring_service.reset_user_stats(user_id)
 
         # 2. Mark comments as used in DB
         db_comments = await self.data_service.get_user_comments(
@@ -350,7 +413,7 @@ class GameManager:
 
         # 2. Decrement used count in Redis
         if self.scoring_service:
-            self.scoring_service.decrement_used_comments(user_id)
+            await self.scoring_service.decrement_used_comments(user_id)
 
         return {"status": "unmarked"}
 
@@ -369,7 +432,7 @@ class GameManager:
                 for s in sessions:
                     # Get user count from Redis Leaderboard
                     leaderboard_key = f"session:{s.id}:leaderboard"
-                    user_count = self.redis.zcard(leaderboard_key) or 0
+                    user_count = await self.redis.zcard(leaderboard_key) or 0
 
                     session_list.append(
                         {
@@ -389,11 +452,30 @@ class GameManager:
             print(f"Error fetching recent sessions: {e}")
             return []
 
+    async def _scoring_for_session(self, session_id: str) -> ScoringService:
+        if self.scoring_service and session_id == self.current_session_id:
+            return self.scoring_service
+        layout = await get_session_layout(self.redis, session_id)
+        return ScoringService(self.redis, session_id, self.gift_catalog, layout=layout)
+
+    async def convert_session_layout(self, session_id: str):
+        """แปลง Session จาก Layout hash (Key ต่อ User) เป็น Layout แบบ Column"""
+        if self.is_connected and session_id == self.current_session_id:
+            return None
+        scoring = await self._scoring_for_session(session_id)
+        converted = await scoring.convert_to_columnar()
+        self.add_log(
+            "INFO",
+            f"Converted session {session_id} to columnar layout ({converted} users)",
+            "System",
+        )
+        return {"session_id": session_id, "layout": scoring.layout, "users": converted}
+
     async def get_session_details(self, session_id: str):
         """Get details for a specific session (for review)"""
         # Re-use ScoringService logic but with a specific session_id
-        temp_scoring = ScoringService(self.redis, session_id)
-        leaderboard = temp_scoring.get_leaderboard()
+        temp_scoring = await self._scoring_for_session(session_id)
+        leaderboard = await temp_scoring.get_leaderboard()
 
         # Get basic info from DB
         session_info = {}
@@ -417,8 +499,8 @@ class GameManager:
     async def get_session_user_details(self, session_id: str, user_id: str):
         """Get detailed stats for a user in a specific session"""
         # Re-use ScoringService logic but with a specific session_id
-        temp_scoring = ScoringService(self.redis, session_id)
-        stats = temp_scoring.get_user_stats_and_comments(user_id)
+        temp_scoring = await self._scoring_for_session(session_id)
+        stats = await temp_scoring.get_user_stats_and_comments(user_id)
 
         # Get detailed comments from DB (via DataService)
         db_comments = await self.data_service.get_user_comments(user_id, session_id)
@@ -438,8 +520,8 @@ class GameManager:
             "gifts_breakdown": stats.get("gifts_breakdown", {}),
         }
 
-    def get_last_channel_name(self):
-        return self.redis.get("last_channel_name") or ""
+    async def get_last_channel_name(self):
+        return await self.redis.get("last_channel_name") or ""
 
 
 game_manager = GameManager()
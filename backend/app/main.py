@@ -1,13 +1,40 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import asyncio
 import json
+import os
 from contextlib import asynccontextmanager
+from dataclasses import replace
 from pydantic import BaseModel
 
 from app.game_manager import game_manager
 from app.schemas import SessionRequest, SystemStatus, WinnerResponse
 from app.models.base import init_db
+from app.services.redis_client import close_redis
+from app.services.scoring_service import (
+    LEADERBOARD_FIELDS,
+    migrate_leaderboard_members,
+)
+from app.services.snapshot_hub import (
+    SnapshotHub,
+    DELTA_PROTOCOL_VERSION,
+    WS_LOG_CATCHUP,
+)
+from app.services.overlay_frame import OverlayPublisher, OverlayRelay
+from app.services.ws_views import View, DEFAULT_VIEW
+from app.services.ws_codec import decode, encode, negotiate_format
+from app.services.ws_clients import ClientRegistry, SlowClientError, WsClient
+from app.services.sse_stream import (
+    event_id,
+    format_event,
+    format_retry,
+    parse_last_event_id,
+)
+
+# Tunables (override via environment)
+LEADERBOARD_PAGE_MAX = int(os.getenv("LEADERBOARD_PAGE_MAX", "500"))
+LEADERBOARD_AROUND_MAX = int(os.getenv("LEADERBOARD_AROUND_MAX", "50"))
 
 
 @asynccontextmanager
@@ -20,14 +47,52 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Database Initialization Failed: {e}")
 
+    # Leaderboards from older versions keyed members as "user_id|nickname"
+    try:
+        migrated = await migrate_leaderboard_members(game_manager.redis)
+        if migrated:
+            print(f"Migrated {migrated} leaderboard members to user_id keys.")
+    except Exception as e:
+        print(f"Leaderboard member migration failed: {e}")
+
+    # Gift lookups are served from memory from here on
+    await game_manager.gift_catalog.load()
+    game_manager.data_service.comment_writer.start()
+    game_manager.logging_service.start()
+    game_manager.notifier.start()
+    snapshot_hub.start()
+    overlay_relay.start()
+    overlay_publisher.start()
+
     yield
 
     # Shutdown
+    await snapshot_hub.stop()
+    await overlay_publisher.stop()
+    await overlay_relay.stop()
+    await game_manager.notifier.stop()
     await game_manager.stop_stream()
+    # Ingestion is drained above, so every buffered comment is in the writer now
+    await game_manager.data_service.comment_writer.stop()
+    await game_manager.logging_service.stop()
+    await close_redis()
 
 
 app = FastAPI(title="TikTok Live Support System", lifespan=lifespan)
 
+# One leaderboard snapshot per change, shared by every /ws connection
+snapshot_hub = SnapshotHub(game_manager)
+game_manager.notifier.add_listener(snapshot_hub.wake)
+
+# WebSocket Clients: Send timeout / ตัด Client ที่ช้า / Lag ต่อ Connection
+ws_clients = ClientRegistry()
+
+# Overlay: Top-N Frame สำเร็จรูปจากฝั่งเขียน, /ws/overlay แค่ส่งต่อ Text
+overlay_publisher = OverlayPublisher(game_manager, game_manager.redis)
+overlay_relay = OverlayRelay(game_manager.redis)
+overlay_publisher.add_listener(overlay_relay.push)
+game_manager.notifier.add_listener(overlay_publisher.wake)
+
 # --- CORS Setting ---
 app.add_middleware(
     CORSMiddleware,
@@ -68,9 +133,20 @@ async def get_session_user_details(session_id: str, user_id: str):
     return await game_manager.get_session_user_details(session_id, user_id)
 
 
+@app.post("/sessions/{session_id}/layout/columnar")
+async def convert_session_layout(session_id: str):
+    """ย้ายสถิติของ Session ไปเก็บแบบ Column (ทำได้เมื่อไม่ได้ Stream Session นี้อยู่)"""
+    result = await game_manager.convert_session_layout(session_id)
+    if not result:
+        raise HTTPException(
+            status_code=409, detail="Stop the stream before converting its session"
+        )
+    return result
+
+
 @app.get("/channel/last")
-def get_last_channel():
-    return {"channel_name": game_manager.get_last_channel_name()}
+async def get_last_channel():
+    return {"channel_name": await game_manager.get_last_channel_name()}
 
 
 class StreamRequest(BaseModel):
@@ -98,9 +174,56 @@ async def resume_stream():
     return await game_manager.resume_stream()
 
 
+def _parse_leaderboard_fields(fields: str):
+    """"nickname,score" -> ["nickname", "score"] (None = ทุก Field)"""
+    if not fields:
+        return None
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(field_list) - set(LEADERBOARD_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown leaderboard fields: {sorted(unknown)}"
+        )
+    return field_list
+
+
+@app.get("/leaderboard")
+async def get_leaderboard_page(offset: int = 0, limit: int = 50, fields: str = None):
+    """
+    Leaderboard ทีละหน้า: อันดับ offset + 1 ถึง offset + limit
+    fields = รายชื่อ Field คั่นด้วย , (เช่น nickname,score,avatar_url)
+    """
+    if offset < 0 or not 0 < limit <= LEADERBOARD_PAGE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset must be >= 0 and limit between 1 and {LEADERBOARD_PAGE_MAX}",
+        )
+    field_list = _parse_leaderboard_fields(fields)
+    items = await game_manager.get_leaderboard(offset, limit, field_list)
+    counts = await game_manager.get_leaderboard_counts()
+    return {"offset": offset, "limit": limit, "total": counts["total"], "items": items}
+
+
+@app.get("/leaderboard/rank/{user_id}")
+async def get_user_rank(user_id: str, around: int = 5, fields: str = None):
+    """อันดับของ User พร้อม around อันดับเหนือ/ใต้ (ไม่ต้องโหลด Leaderboard ทั้งหมด)"""
+    if not 0 <= around <= LEADERBOARD_AROUND_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"around must be between 0 and {LEADERBOARD_AROUND_MAX}",
+        )
+    field_list = _parse_leaderboard_fields(fields)
+    result = await game_manager.get_user_rank(user_id, around, field_list)
+    if not result:
+        raise HTTPException(
+            status_code=404, detail="User not on leaderboard or no active session"
+        )
+    return result
+
+
 @app.post("/game/winner")
-def select_winner():
-    winner = game_manager.select_winner()
+async def select_winner():
+    winner = await game_manager.select_winner()
     if not winner:
         raise HTTPException(status_code=404, detail="No winner found")
     return winner
@@ -163,45 +286,281 @@ def get_status():
         "is_scoring_active": game_manager.is_scoring_active,
         "session_id": game_manager.current_session_id,
         "target_id": game_manager.target_tiktok_id,
+        "ingestion": game_manager.get_ingestion_metrics(),
+        "user_cache": game_manager.data_service.get_user_cache_metrics(),
+        "gift_catalog": game_manager.gift_catalog.get_metrics(),
+        "comment_writer": game_manager.data_service.comment_writer.get_metrics(),
+        "logging": game_manager.logging_service.get_metrics(),
+        "log_store": game_manager.log_store.get_metrics(),
+        "ws_hub": snapshot_hub.get_metrics(),
+        "ws_clients": ws_clients.get_metrics(),
+        "overlay": {
+            "publisher": overlay_publisher.get_metrics(),
+            "relay": overlay_relay.get_metrics(),
+        },
+        "change_notifications": game_manager.notifier.get_metrics(),
+    }
+
+
+def _parse_csv(value: str):
+    """"ERROR,WARNING" -> {"ERROR", "WARNING"} (None = ไม่กรอง)"""
+    if not value:
+        return None
+    return {v.strip() for v in value.split(",") if v.strip()}
+
+
+@app.get("/logs")
+def get_logs(
+    after_id: int = 0, levels: str = None, types: str = None, limit: int = 200
+):
+    """Log ล่าสุดในหน่วยความจำ (Admin Dashboard) after_id = Cursor, limit = รายการล่าสุด"""
+    if after_id < 0 or limit <= 0:
+        raise HTTPException(status_code=400, detail="after_id must be >= 0, limit > 0")
+    items = game_manager.get_logs(
+        after_id=after_id,
+        levels=_parse_csv(levels),
+        types=_parse_csv(types),
+        limit=limit,
+    )
+    return {
+        "items": items,
+        "last_id": game_manager.log_store.last_id,
     }
 
 
+class LogSamplingRequest(BaseModel):
+    log_type: str
+    every_n: int
+
+
+@app.get("/logging/sampling")
+def get_log_sampling():
+    return game_manager.logging_service.get_sampling()
+
+
+@app.put("/logging/sampling")
+def set_log_sampling(request: LogSamplingRequest):
+    """เก็บ Log ประเภทนี้ลง DB 1 ใน every_n (0 = เก็บแค่ยอดสรุป)"""
+    if request.every_n < 0:
+        raise HTTPException(status_code=400, detail="every_n must be >= 0")
+    return game_manager.logging_service.set_sampling(request.log_type, request.every_n)
+
+
+async def _ws_send_frames(client: WsClient, state: dict):
+    """
+    ส่ง Frame จาก SnapshotHub (v1 = Snapshot ทุก Tick, v2 = Snapshot แล้ว Delta)
+    ไม่มี Queue: ส่งเสร็จแล้วค่อยรับ Frame ล่าสุด Frame ที่ออกไม่ทันถูกข้าม
+    (v2: ข้าม Frame = Delta ไม่ได้อิง Frame ที่ Client มี -> ส่ง Snapshot แทน)
+    """
+    version = state["version"]
+    last_seq = 0
+    sent_seq = 0
+    last_log_id = 0
+    while True:
+        frame = await snapshot_hub.next_frame(last_seq)
+        last_seq = frame.seq
+        view = state["view"]
+        view_frame = frame.views.get(view)
+        if view_frame is None:
+            # Just subscribed to a new view: it is rendered from the next frame on
+            continue
+
+        # Logs older than the shared frame (first frame / skipped frames)
+        if view.logs and last_log_id < frame.logs_after:
+            missed = game_manager.get_logs(
+                after_id=last_log_id,
+                until_id=frame.logs_after,
+                levels=view.log_levels,
+                types=view.log_types,
+                limit=WS_LOG_CATCHUP,
+            )
+            if missed:
+                if version >= DELTA_PROTOCOL_VERSION:
+                    message = {"v": version, "type": "logs", "logs": missed}
+                else:
+                    message = {"logs": missed}
+                await client.send(encode(message, view.format))
+
+        if version < DELTA_PROTOCOL_VERSION:
+            await client.send(view_frame.text)
+        elif not state["resync"] and sent_seq and view_frame.base == sent_seq:
+            await client.send(view_frame.delta_v2)
+        else:
+            # First frame, new view, client-reported gap, or the delta is
+            # not against the frame this client has
+            state["resync"] = False
+            await client.send(view_frame.snapshot_v2)
+        sent_seq = frame.seq
+        last_log_id = frame.last_log_id
+        client.frame_sent(frame.seq)
+
+
+async def _ws_receive_messages(client: WsClient, state: dict):
+    """
+    อ่านข้อความจาก Client
+    - {"type": "subscribe", ...}: เลือก Channel / Field ที่ต้องการ (ดู View.from_message)
+    - {"type": "resync"}: (v2) seq ไม่ต่อเนื่อง ขอ Snapshot ใหม่
+    ข้อความเป็น JSON (Text) หรือ msgpack (Binary) ก็ได้
+    """
+    while True:
+        raw = await client.websocket.receive()
+        if raw["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(raw.get("code", 1000))
+        data = raw.get("bytes")
+        try:
+            message = decode(data if data is not None else raw.get("text"))
+        except ValueError as e:
+            error = {"type": "error", "message": str(e)}
+            await client.send(encode(error, state["view"].format))
+            continue
+        if not isinstance(message, dict):
+            continue
+        if message.get("type") == "resync":
+            state["resync"] = True
+        elif message.get("type") == "subscribe":
+            fmt = state["view"].format
+            try:
+                view = replace(View.from_message(message), format=fmt)
+            except (ValueError, TypeError) as e:
+                error = {"type": "error", "message": str(e)}
+                await client.send(encode(error, fmt))
+                continue
+            snapshot_hub.change_view(state["view"], view)
+            state["view"] = view
+            state["resync"] = True
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(
+    websocket: WebSocket, v: int = 1, format: str = "json"
+):
+    """
+    v=2: Snapshot แล้ว Delta
+    format=msgpack: Frame เป็น Binary (msgpack) ถ้า Server ไม่มี msgpack จะได้ JSON
+    """
     await websocket.accept()
-    last_log_id = 0
+    client = ws_clients.connect(websocket, "/ws", lambda: snapshot_hub.seq)
+    view = replace(DEFAULT_VIEW, format=negotiate_format(format))
+    state = {"version": v, "resync": False, "view": view}
+    snapshot_hub.add_subscriber(state["view"])
+    tasks = [
+        asyncio.create_task(_ws_send_frames(client, state)),
+        asyncio.create_task(_ws_receive_messages(client, state)),
+    ]
+    evicted = False
     try:
-        while True:
-            # Check if client disconnected
-            # if websocket.client_state == WebSocket.client_state.DISCONNECTED:
-            #    break
-
-            data = game_manager.get_leaderboard()
-            question = game_manager.get_current_question()
-            logs = game_manager.get_logs(after_id=last_log_id)
-
-            if logs:
-                last_log_id = logs[-1]["id"]
-
-            await websocket.send_json(
-                {
-                    "leaderboard": data,
-                    "question": question,
-                    "logs": logs,
-                    "status": {
-                        "is_connected": game_manager.is_connected,
-                        "is_paused": game_manager.is_paused,
-                        "session_id": game_manager.current_session_id,
-                    },
-                }
-            )
-            await asyncio.sleep(1)
+        # Either side ending (disconnect / send error) closes the connection
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except WebSocketDisconnect:
         print("WebSocket disconnected")
+    except SlowClientError as e:
+        evicted = True
+        print(f"WebSocket {client.id} evicted (slow client): {e}")
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        try:
-            await websocket.close()
-        except RuntimeError:
-            pass  # Already closed
+        for task in tasks:
+            task.cancel()
+        snapshot_hub.remove_subscriber(state["view"])
+        await ws_clients.disconnect(client, evicted)
+
+
+async def _ws_send_overlay_frames(client: WsClient):
+    seq = 0
+    while True:
+        seq, text = await overlay_relay.next_frame(seq)
+        await client.send(text)
+        client.frame_sent(seq)
+
+
+async def _ws_drain(client: WsClient):
+    """อ่านทิ้ง (รู้ทันทีเมื่อ Client ปิด แม้ยังไม่มี Frame ใหม่)"""
+    while True:
+        await client.websocket.receive_text()
+
+
+@app.websocket("/ws/overlay")
+async def overlay_websocket(websocket: WebSocket):
+    """Top-N สำหรับ Overlay: ส่ง Frame ที่ Publisher Serialize ไว้แล้วต่อไปตรงๆ"""
+    await websocket.accept()
+    client = ws_clients.connect(websocket, "/ws/overlay", lambda: overlay_relay.seq)
+    overlay_relay.subscribers += 1
+    tasks = [
+        asyncio.create_task(_ws_send_overlay_frames(client)),
+        asyncio.create_task(_ws_drain(client)),
+    ]
+    evicted = False
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        print("Overlay WebSocket disconnected")
+    except SlowClientError as e:
+        evicted = True
+        print(f"Overlay WebSocket {client.id} evicted (slow client): {e}")
+    except Exception as e:
+        print(f"Overlay WebSocket error: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        overlay_relay.subscribers -= 1
+        await ws_clients.disconnect(client, evicted)
+
+
+async def _sse_frames(view: View, sent_seq: int):
+    """
+    Event จาก SnapshotHub (Frame เดียวกับ /ws?v=2)
+    sent_seq = Frame ที่ Client มีแล้ว (Last-Event-ID): ถ้า Delta อิง Frame นั้น ส่งแค่ Delta
+    """
+    snapshot_hub.add_subscriber(view)
+    try:
+        yield format_retry()
+        last_seq = sent_seq
+        while True:
+            frame = await snapshot_hub.next_frame(last_seq)
+            last_seq = frame.seq
+            view_frame = frame.views.get(view)
+            if view_frame is None:
+                # View just added: it is rendered from the next frame on
+                continue
+            if sent_seq and view_frame.base == sent_seq:
+                event, data = "delta", view_frame.delta_v2
+            else:
+                event, data = "snapshot", view_frame.snapshot_v2
+            yield format_event(data, event, event_id(frame.seq))
+            sent_seq = frame.seq
+    finally:
+        snapshot_hub.remove_subscriber(view)
+
+
+@app.get("/sse")
+async def sse_stream(
+    limit: int = None,
+    fields: str = None,
+    question: bool = True,
+    last_event_id: str = Header(None),
+):
+    """
+    Server-Sent Events ของ Leaderboard / Question สำหรับ Overlay ที่อ่านอย่างเดียว
+    Event: snapshot (เต็ม) / delta (Row ที่เปลี่ยน) รูปแบบเดียวกับ /ws?v=2
+    Reconnect ด้วย Last-Event-ID ได้ Delta ต่อจากเดิมโดยไม่ต้องโหลดใหม่ทั้งหมด
+    """
+    field_list = _parse_leaderboard_fields(fields)
+    try:
+        view = View.from_message(
+            {
+                "type": "subscribe",
+                "leaderboard": {"limit": limit, "fields": field_list},
+                "question": question,
+            }
+        )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        _sse_frames(view, parse_last_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import uuid
+import redis.asyncio as aioredis
+
+# Tunables (override via environment)
+CHANGE_CHANNEL = os.getenv("CHANGE_CHANNEL", "live:changes")
+CHANGE_PUBSUB = os.getenv("CHANGE_PUBSUB", "1") != "0"
+
+
+class ChangeNotifier:
+    """
+    สัญญาณ "ข้อมูลเปลี่ยน" จาก Scoring / Logs / Question ไปหา Publisher (SnapshotHub)
+    ใน Process เดียวกันเรียก Listener ตรงๆ, ข้าม Process ใช้ Redis Pub/Sub
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis = None,
+        channel: str = CHANGE_CHANNEL,
+        use_pubsub: bool = CHANGE_PUBSUB,
+    ):
+        self.r = redis_client
+        self.channel = channel
+        self.use_pubsub = use_pubsub and redis_client is not None
+        # ข้อความของตัวเองที่วนกลับมาจาก Pub/Sub ไม่ต้องแจ้งซ้ำ
+        self.instance_id = uuid.uuid4().hex
+        self.listeners = []
+        self.listen_task = None
+
+        # Metrics
+        self.local_notifications = 0
+        self.published = 0
+        self.remote_notifications = 0
+
+    def add_listener(self, callback):
+        """callback: sync callable ไม่มี Argument (เช่น Event.set)"""
+        self.listeners.append(callback)
+
+    def notify_local(self):
+        self.local_notifications += 1
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in change listener: {e}")
+
+    async def notify(self, session_id: str = ""):
+        """แจ้ง Listener ใน Process นี้ และ Publish ให้ Process อื่น"""
+        self.notify_local()
+        if not self.use_pubsub:
+            return
+        try:
+            await self.r.publish(self.channel, f"{self.instance_id}|{session_id}")
+            self.published += 1
+        except Exception as e:
+            print(f"Error publishing change notification: {e}")
+
+    def start(self):
+        if self.listen_task is None and self.use_pubsub:
+            self.listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listen_task:
+            self.listen_task.cancel()
+            await asyncio.gather(self.listen_task, return_exceptions=True)
+            self.listen_task = None
+
+    def get_metrics(self) -> dict:
+        return {
+            "local": self.local_notifications,
+            "published": self.published,
+            "remote": self.remote_notifications,
+        }
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.r.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        sender = str(message.get("data", "")).split("|", 1)[0]
+                        if sender == self.instance_id:
+                            continue
+                        self.remote_notifications += 1
+                        self.notify_local()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change subscription error, retrying: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from app.models.base import AsyncSessionLocal
+from app.models.comment import Comment
+
+# Tunables (override via environment)
+COMMENT_FLUSH_INTERVAL_MS = int(os.getenv("COMMENT_FLUSH_INTERVAL_MS", "250"))
+COMMENT_FLUSH_MAX_ROWS = int(os.getenv("COMMENT_FLUSH_MAX_ROWS", "200"))
+
+
+class CommentWriter:
+    """
+    Write-behind ของตาราง comments: สะสม Row แล้ว INSERT หลายแถวใน Statement เดียว
+    ทุก N แถว หรือ T มิลลิวินาที (แล้วแต่อย่างไหนถึงก่อน)
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: int = COMMENT_FLUSH_INTERVAL_MS,
+        max_rows: int = COMMENT_FLUSH_MAX_ROWS,
+    ):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_rows = max(1, max_rows)
+        self.pending = []  # [row dict]
+        self.flush_task = None
+        self.is_running = False
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+        # Metrics
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_rows = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, user_id: str, session_id: str, content: str):
+        """ใส่ Comment เข้า Buffer (เขียนลง DB ตอน Flush ครั้งถัดไป)"""
+        row = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "content": content,
+            "timestamp": datetime.utcnow(),
+            "is_used": False,
+        }
+        self.pending.append(row)
+        if len(self.pending) >= self.max_rows:
+            self._full.set()
+
+    def start(self):
+        if self.flush_task is None:
+            self.is_running = True
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.is_running = False
+            self._full.set()
+            await self.flush_task
+            self.flush_task = None
+        # Flush whatever is left so no comment is lost on shutdown
+        await self.flush()
+
+    async def flush(self):
+        # Lock: get_user_comments อาจสั่ง Flush พร้อมกับ Loop
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            rows = self.pending
+            self.pending = []
+            self._full.clear()
+
+            started = time.monotonic()
+            try:
+                ids = await self._insert(rows)
+            except Exception as e:
+                # แถวเสียแถวเดียว (เช่น FK) ไม่ควรทำให้ทั้ง Batch หาย
+                print(f"Error bulk inserting {len(rows)} comments, retrying per row: {e}")
+                ids = await self._insert_each(rows)
+
+            written = sum(1 for comment_id in ids if comment_id is not None)
+            self.flushes += 1
+            self.rows_written += written
+            self.failed_rows += len(rows) - written
+            self.last_batch_size = len(rows)
+            self.last_flush_ms = (time.monotonic() - started) * 1000
+
+    async def _insert(self, rows: list) -> list:
+        """INSERT ... VALUES (...), (...) RETURNING id เรียงตามลำดับ Row"""
+        async with AsyncSessionLocal() as session:
+            result = await session.scalars(
+                insert(Comment).returning(Comment.id, sort_by_parameter_order=True),
+                rows,
+            )
+            ids = list(result)
+            await session.commit()
+            return ids
+
+    async def _insert_each(self, rows: list) -> list:
+        ids = []
+        for row in rows:
+            try:
+                ids.extend(await self._insert([row]))
+            except Exception as e:
+                print(f"Error saving comment: {e}")
+                ids.append(None)
+        return ids
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failed_rows": self.failed_rows,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
+
+    async def _flush_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
@@ -1,71 +1,155 @@
+import os
+from collections import OrderedDict
+from sqlalchemy import and_, func, or_
 from sqlalchemy.future import select
 from sqlalchemy.dialects.postgresql import insert
 from app.models.base import AsyncSessionLocal
 from app.models.user import User
 from app.models.gift import Gift
 from app.models.comment import Comment
+from app.services.comment_writer import CommentWriter
 from datetime import datetime
 
 
+# Tunables (override via environment), 0 = ปิด Cache
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+
 class DataService:
+    def __init__(self, user_cache_size: int = USER_CACHE_SIZE):
+        # LRU: tiktok_id -> (nickname, avatar_url) ที่อยู่ใน DB แล้ว
+        self.user_cache = OrderedDict()
+        self.user_cache_size = user_cache_size
+
+        # Write-behind comments (start() จาก Lifespan, ถ้าไม่ start จะเขียนทีละแถว)
+        self.comment_writer = CommentWriter()
+
+        # Metrics
+        self.user_cache_hits = 0
+        self.user_cache_misses = 0
+        self.user_writes = 0
+
+    def _user_is_known(self, tiktok_id: str, nickname: str, avatar_url: str) -> bool:
+        cached = self.user_cache.get(tiktok_id)
+        if cached is None:
+            return False
+        cached_nickname, cached_avatar = cached
+        # avatar_url ว่าง = ไม่เปลี่ยนรูปเดิม (เหมือน upsert เดิม)
+        if cached_nickname != nickname or (avatar_url and cached_avatar != avatar_url):
+            return False
+        self.user_cache.move_to_end(tiktok_id)
+        return True
+
+    def _remember_user(self, tiktok_id: str, nickname: str, avatar_url: str):
+        if self.user_cache_size <= 0:
+            return
+        if not avatar_url and tiktok_id in self.user_cache:
+            avatar_url = self.user_cache[tiktok_id][1]
+        self.user_cache[tiktok_id] = (nickname, avatar_url)
+        self.user_cache.move_to_end(tiktok_id)
+        if len(self.user_cache) > self.user_cache_size:
+            self.user_cache.popitem(last=False)
+
+    @staticmethod
+    def _upsert_user_stmt(tiktok_id: str, nickname: str, avatar_url: str = None):
+        """INSERT ... ON CONFLICT DO UPDATE ที่เขียนเฉพาะเมื่อ nickname/avatar เปลี่ยน"""
+        now = datetime.utcnow()
+        stmt = insert(User).values(
+            tiktok_id=tiktok_id,
+            nickname=nickname,
+            avatar_url=avatar_url,
+            created_at=now,
+            updated_at=now,
+        )
+        excluded = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=[User.tiktok_id],
+            set_={
+                "nickname": excluded.nickname,
+                "avatar_url": func.coalesce(excluded.avatar_url, User.avatar_url),
+                "updated_at": now,
+            },
+            where=or_(
+                User.nickname.is_distinct_from(excluded.nickname),
+                and_(
+                    excluded.avatar_url.isnot(None),
+                    User.avatar_url.is_distinct_from(excluded.avatar_url),
+                ),
+            ),
+        )
+
     async def upsert_user(self, tiktok_id: str, nickname: str, avatar_url: str = None):
+        if self._user_is_known(tiktok_id, nickname, avatar_url):
+            # Unchanged user: no DB round trip
+            self.user_cache_hits += 1
+            return
+        self.user_cache_misses += 1
+
         async with AsyncSessionLocal() as session:
             try:
-                # Check if user exists
-                result = await session.execute(
-                    select(User).where(User.tiktok_id == tiktok_id)
+                await session.execute(
+                    self._upsert_user_stmt(tiktok_id, nickname, avatar_url)
                 )
-                user = result.scalar_one_or_none()
-
-                if user:
-                    # Update info if changed
-                    if user.nickname != nickname or (
-                        avatar_url and user.avatar_url != avatar_url
-                    ):
-                        user.nickname = nickname
-                        if avatar_url:
-                            user.avatar_url = avatar_url
-                        user.updated_at = datetime.utcnow()
-                        await session.commit()
-                else:
-                    # Create new user
-                    new_user = User(
-                        tiktok_id=tiktok_id, nickname=nickname, avatar_url=avatar_url
-                    )
-                    session.add(new_user)
-                    await session.commit()
+                await session.commit()
+                self.user_writes += 1
+                self._remember_user(tiktok_id, nickname, avatar_url)
             except Exception as e:
                 print(f"Error upserting user: {e}")
                 await session.rollback()
 
+    def get_user_cache_metrics(self) -> dict:
+        lookups = self.user_cache_hits + self.user_cache_misses
+        return {
+            "size": len(self.user_cache),
+            "capacity": self.user_cache_size,
+            "hits": self.user_cache_hits,
+            "misses": self.user_cache_misses,
+            "hit_rate": round(self.user_cache_hits / lookups, 3) if lookups else 0.0,
+            "writes": self.user_writes,
+        }
+
     async def upsert_gift(
         self, gift_id: str, name: str, diamond_count: int, image_url: str = None
     ):
+        """Insert Gift ใหม่ หรืออัปเดตรูปเมื่อเปลี่ยน (Statement เดียว) คืนค่า False ถ้าเขียนไม่สำเร็จ"""
+        now = datetime.utcnow()
+        stmt = insert(Gift).values(
+            gift_id=gift_id,
+            name=name,
+            diamond_count=diamond_count,
+            image_url=image_url,
+            created_at=now,
+            updated_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Gift.gift_id],
+            set_={"image_url": stmt.excluded.image_url, "updated_at": now},
+            where=and_(
+                stmt.excluded.image_url.isnot(None),
+                Gift.image_url.is_distinct_from(stmt.excluded.image_url),
+            ),
+        )
         async with AsyncSessionLocal() as session:
             try:
-                result = await session.execute(
-                    select(Gift).where(Gift.gift_id == gift_id)
-                )
-                gift = result.scalar_one_or_none()
-
-                if not gift:
-                    new_gift = Gift(
-                        gift_id=gift_id,
-                        name=name,
-                        diamond_count=diamond_count,
-                        image_url=image_url,
-                    )
-                    session.add(new_gift)
-                    await session.commit()
-                elif gift.image_url is None and image_url:
-                    gift.image_url = image_url
-                    await session.commit()
-
+                await session.execute(stmt)
+                await session.commit()
+                return True
             except Exception as e:
                 print(f"Error upserting gift: {e}")
                 await session.rollback()
+                return False
+
+    async def get_all_gifts(self):
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Gift))
+            return result.scalars().all()
 
     async def save_comment(self, user_id: str, session_id: str, content: str):
+        if self.comment_writer.is_running:
+            # Buffered: flushed as one multi-row INSERT by CommentWriter
+            self.comment_writer.add(user_id, session_id, content)
+            return
+
         async with AsyncSessionLocal() as session:
             try:
                 new_comment = Comment(
@@ -78,6 +162,8 @@ class DataService:
                 await session.rollback()
 
     async def get_user_comments(self, user_id: str, session_id: str):
+        # Buffered comments must have ids before the question feature sees them
+        await self.comment_writer.flush()
         async with AsyncSessionLocal() as session:
             result = await session.execute(
                 select(Comment)
@@ -0,0 +1,76 @@
+from app.services.data_service import DataService
+
+
+class GiftCatalog:
+    """
+    รายการ Gift ทั้งหมดในหน่วยความจำ (โหลดจากตาราง gifts ตอน Startup)
+    ตอบ Lookup ได้ทันที และเขียนลง DB เฉพาะตอนเจอ Gift ID ใหม่ หรือรูปเปลี่ยน
+    """
+
+    def __init__(self, data_service: DataService):
+        self.data_service = data_service
+        self.gifts = {}  # gift_id -> {"name", "diamond_count", "icon"}
+
+        # Metrics
+        self.lookups = 0
+        self.writes = 0
+        self.failed_writes = 0
+
+    async def load(self):
+        """โหลดตาราง gifts ทั้งหมดเข้าหน่วยความจำ"""
+        try:
+            rows = await self.data_service.get_all_gifts()
+        except Exception as e:
+            print(f"Error loading gift catalog: {e}")
+            return
+        for gift in rows:
+            self.gifts[gift.gift_id] = {
+                "name": gift.name,
+                "diamond_count": gift.diamond_count,
+                "icon": gift.image_url,
+            }
+        print(f"Gift catalog loaded: {len(self.gifts)} gifts")
+
+    def get(self, gift_id: str):
+        self.lookups += 1
+        return self.gifts.get(gift_id)
+
+    def is_known(self, gift_id: str, image_url: str = None) -> bool:
+        """True ถ้ารู้จัก Gift นี้แล้ว และรูปไม่เปลี่ยน (รูปว่าง = ไม่เปลี่ยน)"""
+        meta = self.gifts.get(gift_id)
+        if meta is None:
+            return False
+        return not image_url or meta["icon"] == image_url
+
+    async def record(
+        self, gift_id: str, name: str, diamond_count: int, image_url: str = None
+    ) -> bool:
+        """
+        บันทึก Gift ที่เห็นจาก Event คืนค่า True ถ้ามีการเขียนลง DB
+        จำในหน่วยความจำหลังเขียนสำเร็จเท่านั้น (เขียนไม่สำเร็จ = ลองใหม่ครั้งหน้าที่เห็น)
+        """
+        if self.is_known(gift_id, image_url):
+            return False
+
+        if not await self.data_service.upsert_gift(
+            gift_id, name, diamond_count, image_url
+        ):
+            self.failed_writes += 1
+            return False
+
+        meta = self.gifts.get(gift_id)
+        self.gifts[gift_id] = {
+            "name": name if meta is None else meta["name"],
+            "diamond_count": diamond_count if meta is None else meta["diamond_count"],
+            "icon": image_url or (meta["icon"] if meta else None),
+        }
+        self.writes += 1
+        return True
+
+    def get_metrics(self) -> dict:
+        return {
+            "gifts": len(self.gifts),
+            "lookups": self.lookups,
+            "writes": self.writes,
+            "failed_writes": self.failed_writes,
+        }
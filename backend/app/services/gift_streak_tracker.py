@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from app.events import NormalizedEvent
+
+# Tunables (override via environment)
+# Streak ที่ไม่มี Tick ใหม่เกินเวลานี้ถือว่าถูกทิ้ง (ไม่ได้รับ Tick สุดท้าย)
+GIFT_STREAK_TIMEOUT_MS = int(os.getenv("GIFT_STREAK_TIMEOUT_MS", "10000"))
+GIFT_STREAK_SWEEP_MS = int(os.getenv("GIFT_STREAK_SWEEP_MS", "1000"))
+
+
+class GiftStreakTracker:
+    """
+    State ของ Gift Streak ในหน่วยความจำ key = (user_id, gift_id, group_id)
+    Tick ระหว่าง Streak ถูกตัดทิ้งตรงนี้ (ก่อน DB/Redis) เหลือแค่ Tick สุดท้ายที่คิดคะแนน
+    Streak ที่เงียบเกิน Timeout จะถูกลบทิ้งโดย Sweep Loop
+    """
+
+    def __init__(
+        self,
+        on_expire=None,
+        timeout_ms: int = GIFT_STREAK_TIMEOUT_MS,
+        sweep_ms: int = GIFT_STREAK_SWEEP_MS,
+    ):
+        # on_expire: async callable รับ NormalizedEvent (Tick ล่าสุดของ Streak ที่หมดเวลา)
+        self.on_expire = on_expire
+        self.timeout = timeout_ms / 1000.0
+        self.sweep_interval = max(sweep_ms, 1) / 1000.0
+        self.active = {}  # key -> [started_at, last_seen, NormalizedEvent]
+        self.sweep_task = None
+        self.is_running = False
+        self._stopped = asyncio.Event()
+
+        # Metrics
+        self.ticks_in = 0
+        self.ticks_dropped = 0
+        self.completed = 0
+        self.expired = 0
+
+    @staticmethod
+    def _key(event: NormalizedEvent):
+        return (event.user_id, event.gift_id, event.group_id)
+
+    def observe(self, event: NormalizedEvent) -> bool:
+        """
+        คืนค่า True ถ้า Event ต้องส่งต่อ (Gift ธรรมดา หรือ Tick สุดท้ายของ Streak)
+        False = Tick ระหว่าง Streak (เก็บแค่ Progress ไว้ในหน่วยความจำ)
+        """
+        if not event.streakable:
+            return True
+
+        self.ticks_in += 1
+        key = self._key(event)
+        now = time.monotonic()
+
+        if not event.streaking:
+            # Tick สุดท้าย ปิด Streak แล้วส่งต่อไปคิดคะแนน
+            self.active.pop(key, None)
+            self.completed += 1
+            return True
+
+        state = self.active.get(key)
+        if state is None:
+            self.active[key] = [now, now, event]
+        else:
+            state[1] = now
+            state[2] = event
+        self.ticks_dropped += 1
+        return False
+
+    def get_active(self) -> list:
+        """Progress ของ Streak ที่ยังไม่จบ (สำหรับ Overlay) เรียงตามเวลาเริ่ม"""
+        streaks = []
+        for started_at, _, event in sorted(self.active.values(), key=lambda s: s[0]):
+            streaks.append(
+                {
+                    "user_id": event.user_id,
+                    "nickname": event.nickname,
+                    "avatar_url": event.avatar_url,
+                    "gift_id": event.gift_id,
+                    "gift_name": event.gift_name,
+                    "gift_image": event.gift_image,
+                    "diamond_count": event.diamond_count,
+                    "count": event.count,
+                }
+            )
+        return streaks
+
+    def start(self):
+        if self.sweep_task is None and self.timeout > 0:
+            self.is_running = True
+            self._stopped.clear()
+            self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.sweep_task:
+            self.is_running = False
+            self._stopped.set()
+            await self.sweep_task
+            self.sweep_task = None
+
+    async def expire(self, now: float = None):
+        """ลบ Streak ที่ไม่มี Tick ใหม่เกิน Timeout"""
+        now = time.monotonic() if now is None else now
+        stale = [
+            key
+            for key, (_, last_seen, _) in self.active.items()
+            if now - last_seen >= self.timeout
+        ]
+        for key in stale:
+            _, _, event = self.active.pop(key)
+            self.expired += 1
+            if self.on_expire:
+                try:
+                    await self.on_expire(event)
+                except Exception as e:
+                    print(f"Error in gift streak expire callback: {e}")
+
+    def get_metrics(self) -> dict:
+        return {
+            "active": len(self.active),
+            "ticks_in": self.ticks_in,
+            "ticks_dropped": self.ticks_dropped,
+            "completed": self.completed,
+            "expired": self.expired,
+        }
+
+    async def _sweep_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.expire()
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from app.services.scoring_service import ScoringService
+from app.services.logging_service import LoggingService
+from app.services.data_service import DataService
+from app.services.score_batcher import ScoreBatcher
+from app.services.like_coalescer import LikeCoalescer, LIKE_COALESCE_WINDOW_MS
+from app.services.gift_streak_tracker import GiftStreakTracker
+from app.services.gift_catalog import GiftCatalog
+from app.events import NormalizedEvent, LIKE, GIFT, COMMENT
+
+# Tunables (override via environment)
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "5000"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "4"))
+INGESTION_OVERFLOW_POLICY = os.getenv("INGESTION_OVERFLOW_POLICY", "drop_oldest")
+
+# drop_oldest: ทิ้ง Event เก่าสุดในคิวเพื่อรับ Event ใหม่
+# drop_newest: ทิ้ง Event ใหม่ที่เข้ามาตอนคิวเต็ม
+# block: รอจนคิวมีที่ว่าง (จะหน่วง TikTok callback)
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+async def log_ingestion_error(error: Exception, event_data: dict):
+    """Log ingestion errors to a JSONL file"""
+    try:
+        log_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "error": str(error),
+            "event_data": str(
+                event_data
+            ),  # Convert to string to avoid serialization issues
+        }
+        with open("ingestion_errors.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(log_entry) + "\n")
+    except Exception as log_err:
+        print(f"Failed to log ingestion error: {log_err}")
+
+
+class IngestionService:
+    """
+    คิวกลางระหว่าง Adapter (TikTok callback) กับ Scoring/Persistence
+    Adapter แค่ normalize แล้ว submit() เข้าคิว ส่วน DB/Redis ทำใน Worker Pool
+    """
+
+    def __init__(
+        self,
+        scoring_service: ScoringService,
+        logging_service: LoggingService,
+        data_service: DataService,
+        session_id: str,
+        maxsize: int = INGESTION_QUEUE_SIZE,
+        workers: int = INGESTION_WORKERS,
+        overflow_policy: str = INGESTION_OVERFLOW_POLICY,
+        like_window_ms: int = LIKE_COALESCE_WINDOW_MS,
+        gift_catalog: GiftCatalog = None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy '{overflow_policy}', "
+                f"expected one of {OVERFLOW_POLICIES}"
+            )
+
+        self.scoring_service = scoring_service
+        self.logging_service = logging_service
+        self.data_service = data_service
+        self.session_id = session_id
+        self.gift_catalog = gift_catalog
+        self.maxsize = maxsize
+        self.worker_count = max(1, workers)
+        self.overflow_policy = overflow_policy
+
+        # Item = (enqueued_at, NormalizedEvent)
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.workers = []
+
+        # Scoring writes are folded into one Redis pipeline per flush window
+        self.score_batcher = ScoreBatcher(
+            scoring_service, on_error=log_ingestion_error
+        )
+
+        # Like bursts are summed per user before they ever reach the queue
+        self.like_coalescer = LikeCoalescer(self._enqueue, like_window_ms)
+
+        # Intermediate gift streak ticks are dropped before any DB/Redis work
+        self.gift_streaks = GiftStreakTracker(on_expire=self._on_streak_expired)
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.last_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+        self.handlers = {
+            LIKE: self._handle_like,
+            GIFT: self._handle_gift,
+            COMMENT: self._handle_comment,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.workers)
+
+    def start(self):
+        if self.workers:
+            return
+        self.score_batcher.start()
+        self.workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.worker_count)
+        ]
+        self.like_coalescer.start()
+        self.gift_streaks.start()
+
+    async def stop(self, drain: bool = True, timeout: float = 5.0):
+        """หยุด Worker ทั้งหมด (drain=True จะรอเคลียร์คิวก่อน ไม่เกิน timeout วินาที)"""
+        # Push coalesced likes into the queue before draining it
+        await self.like_coalescer.stop()
+        await self.gift_streaks.stop()
+
+        if drain and self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(
+                    f"Ingestion drain timed out, {self.queue.qsize()} events left in queue"
+                )
+
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.score_batcher.stop()
+
+    async def submit(self, event: NormalizedEvent) -> bool:
+        """
+        ใส่ Event เข้าคิว คืนค่า False ถ้า Event ถูกทิ้งตาม overflow policy
+        (Like จะถูกรวมยอดใน LikeCoalescer ก่อนเข้าคิว, Gift Streak ส่งแค่ Tick สุดท้าย)
+        """
+        if event.type == LIKE and self.like_coalescer.enabled:
+            self.like_coalescer.add(event)
+            return True
+        if event.type == GIFT and not self.gift_streaks.observe(event):
+            return True
+        return await self._enqueue(event)
+
+    async def _enqueue(self, event: NormalizedEvent) -> bool:
+        item = (time.monotonic(), event)
+
+        if self.overflow_policy == "block":
+            await self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.overflow_policy == "drop_newest":
+                    return False
+                # drop_oldest
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                except asyncio.QueueEmpty:
+                    pass
+                self.queue.put_nowait(item)
+
+        self.enqueued += 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def get_metrics(self) -> dict:
+        oldest_age_ms = 0.0
+        if not self.queue.empty():
+            # asyncio.Queue ไม่มี peek จึงอ่านจาก deque ภายใน
+            oldest_age_ms = (time.monotonic() - self.queue._queue[0][0]) * 1000
+
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.maxsize,
+            "max_depth": self.max_depth,
+            "oldest_age_ms": round(oldest_age_ms, 1),
+            "last_wait_ms": round(self.last_wait_ms, 1),
+            "max_wait_ms": round(self.max_wait_ms, 1),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "workers": len(self.workers),
+            "overflow_policy": self.overflow_policy,
+            "scoring": self.score_batcher.get_metrics(),
+            "like_coalescing": self.like_coalescer.get_metrics(),
+            "gift_streaks": self.gift_streaks.get_metrics(),
+        }
+
+    def get_active_streaks(self) -> list:
+        return self.gift_streaks.get_active()
+
+    async def _on_streak_expired(self, event: NormalizedEvent):
+        # ไม่ได้รับ Tick สุดท้าย (เช่น หลุดการเชื่อมต่อ) -> ไม่คิดคะแนน เหมือนเดิม
+        await self.logging_service.warning(
+            f"{event.nickname} {event.gift_name} streak expired at x{event.count} (not scored)",
+            details={"type": "Gift"},
+        )
+
+    async def _worker(self, worker_id: int):
+        while True:
+            enqueued_at, event = await self.queue.get()
+            try:
+                wait_ms = (time.monotonic() - enqueued_at) * 1000
+                self.last_wait_ms = wait_ms
+                if wait_ms > self.max_wait_ms:
+                    self.max_wait_ms = wait_ms
+
+                handler = self.handlers.get(event.type)
+                if handler:
+                    await handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                await log_ingestion_error(e, {"type": event.type, "data": event})
+                asyncio.create_task(
+                    self.logging_service.error(
+                        f"Error processing {event.type}: {e}", e
+                    )
+                )
+            finally:
+                self.queue.task_done()
+
+    # ==================================================================
+    # == Handlers (ทำงานใน Worker ไม่ใช่ใน TikTok callback) ==
+    # ==================================================================
+
+    async def _handle_like(self, event: NormalizedEvent):
+        await self.data_service.upsert_user(
+            event.user_id, event.nickname, event.avatar_url
+        )
+
+        self.score_batcher.add(event)
+
+        # Log for Admin Dashboard
+        await self.logging_service.info(
+            f"{event.nickname} sent {event.count} likes",
+            details={"type": "Like"},
+        )
+
+    async def _handle_gift(self, event: NormalizedEvent):
+        await self.data_service.upsert_user(
+            event.user_id, event.nickname, event.avatar_url
+        )
+        if self.gift_catalog:
+            # Known gift with the same image: no DB write
+            await self.gift_catalog.record(
+                event.gift_id,
+                event.gift_name,
+                event.diamond_count,
+                event.gift_image,
+            )
+        else:
+            await self.data_service.upsert_gift(
+                event.gift_id,
+                event.gift_name,
+                event.diamond_count,
+                event.gift_image,
+            )
+
+        repeat_count = event.count
+        if event.streakable and not event.streaking:
+            # End of streak or single gift
+            quantity = repeat_count
+        elif not event.streakable:
+            # Non-streakable
+            quantity = 1
+        else:
+            # Tick ระหว่าง Streak ถูกตัดใน GiftStreakTracker แล้ว ไม่ควรมาถึงตรงนี้
+            quantity = 0
+
+        if quantity:
+            # count = จำนวนที่คิดคะแนนจริง
+            event.count = quantity
+            self.score_batcher.add(event)
+
+        # Log for Admin Dashboard
+        await self.logging_service.info(
+            f"{event.nickname} sent {event.gift_name} x{repeat_count}",
+            details={"type": "Gift"},
+        )
+
+    async def _handle_comment(self, event: NormalizedEvent):
+        await self.data_service.upsert_user(
+            event.user_id, event.nickname, event.avatar_url
+        )
+        await self.data_service.save_comment(
+            event.user_id, self.session_id, event.comment
+        )
+
+        self.score_batcher.add(event)
+
+        # Log for Admin Dashboard
+        await self.logging_service.info(
+            f"{event.nickname}: {event.comment}", details={"type": "Chat"}
+        )
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from app.events import NormalizedEvent
+
+# Tunables (override via environment), 0 = ปิดการรวม Like
+LIKE_COALESCE_WINDOW_MS = int(os.getenv("LIKE_COALESCE_WINDOW_MS", "1000"))
+
+
+class LikeCoalescer:
+    """
+    รวมยอด Like ต่อ (user_id, is_follower) ภายใน Window แล้วปล่อยออกครั้งเดียวต่อ User
+    ยอดรวมเท่าเดิม แต่ upsert_user / process_like / SystemLog ลดลงตามจำนวน Burst
+    """
+
+    def __init__(self, emit, window_ms: int = LIKE_COALESCE_WINDOW_MS):
+        # emit: async callable รับ Like Event ที่รวมยอดแล้ว
+        self.emit = emit
+        self.window = window_ms / 1000.0
+        self.pending = {}  # (user_id, is_follower) -> NormalizedEvent
+        self.flush_task = None
+        self.is_running = False
+        self._stopped = asyncio.Event()
+
+        # Metrics
+        self.likes_in = 0
+        self.likes_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, event: NormalizedEvent):
+        self.likes_in += 1
+        key = (event.user_id, event.is_follower)
+        current = self.pending.get(key)
+        if current is None:
+            # First like of the window becomes the aggregate (events are not shared)
+            self.pending[key] = event
+            return
+
+        current.count += event.count
+        # Keep latest display data
+        current.nickname = event.nickname
+        if event.avatar_url:
+            current.avatar_url = event.avatar_url
+
+    def start(self):
+        if self.flush_task is None and self.enabled:
+            self.is_running = True
+            self._stopped.clear()
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.is_running = False
+            self._stopped.set()
+            await self.flush_task
+            self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = {}
+        for event in batch.values():
+            self.likes_out += 1
+            await self.emit(event)
+
+    def get_metrics(self) -> dict:
+        return {
+            "window_ms": int(self.window * 1000),
+            "pending_users": len(self.pending),
+            "likes_in": self.likes_in,
+            "likes_out": self.likes_out,
+        }
+
+    async def _flush_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
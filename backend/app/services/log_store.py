@@ -0,0 +1,153 @@
+import heapq
+import os
+from bisect import bisect_right
+from datetime import datetime
+
+# Tunables (override via environment)
+# จำนวน Log ล่าสุดที่เก็บในหน่วยความจำ (สำหรับ WebSocket / Admin Dashboard)
+LOG_STORE_SIZE = int(os.getenv("LOG_STORE_SIZE", "2000"))
+
+
+class _IdIndex:
+    """
+    id ของ Log หนึ่ง type / level เรียงจากน้อยไปมาก (append อย่างเดียว)
+    id ที่หลุดจาก Ring ถูกตัดจากหัวแบบเลื่อน head (ไม่ pop(0))
+    """
+
+    __slots__ = ("ids", "head")
+
+    def __init__(self):
+        self.ids = []
+        self.head = 0
+
+    def append(self, log_id: int):
+        self.ids.append(log_id)
+
+    def drop_before(self, first_id: int):
+        while self.head < len(self.ids) and self.ids[self.head] < first_id:
+            self.head += 1
+        # Compact เมื่อส่วนที่ตัดแล้วเกินครึ่ง (Amortized O(1))
+        if self.head > 64 and self.head * 2 > len(self.ids):
+            del self.ids[: self.head]
+            self.head = 0
+
+    def between(self, after_id: int, until_id: int) -> list:
+        start = bisect_right(self.ids, after_id, lo=self.head)
+        stop = bisect_right(self.ids, until_id, lo=start)
+        return self.ids[start:stop]
+
+    def __len__(self):
+        return len(self.ids) - self.head
+
+
+class LogStore:
+    """
+    Ring Buffer ขนาดคงที่ของ Log ล่าสุด id ต่อเนื่อง (1, 2, 3, ...)
+    - append: O(1) เขียนทับ Slot ที่เก่าที่สุด
+    - get(after_id): หา Slot จาก id โดยตรง อ่านแค่ Log ที่ใหม่กว่า Cursor
+    - กรอง type / level ผ่าน Index (bisect) ไม่ต้อง Scan ทั้ง Buffer
+    """
+
+    def __init__(self, capacity: int = LOG_STORE_SIZE):
+        self.capacity = max(1, capacity)
+        self._slots = [None] * self.capacity
+        self.last_id = 0
+        self._by_level = {}  # level -> _IdIndex
+        self._by_type = {}  # type -> _IdIndex
+
+    @property
+    def first_id(self) -> int:
+        """id ที่เก่าที่สุดที่ยังอยู่ใน Buffer"""
+        return max(1, self.last_id - self.capacity + 1)
+
+    def __len__(self):
+        return self.last_id - self.first_id + 1 if self.last_id else 0
+
+    def append(self, level: str, message: str, log_type: str = "System") -> dict:
+        self.last_id += 1
+        entry = {
+            "id": self.last_id,
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "level": level,
+            "type": log_type,
+            "message": message,
+        }
+        slot = (self.last_id - 1) % self.capacity
+        evicted = self._slots[slot]
+        self._slots[slot] = entry
+
+        for indexes, key in ((self._by_level, level), (self._by_type, log_type)):
+            index = indexes.get(key)
+            if index is None:
+                index = indexes[key] = _IdIndex()
+            index.append(self.last_id)
+        if evicted is not None:
+            self._drop(evicted)
+        return entry
+
+    def _drop(self, evicted: dict):
+        """Entry ที่ถูกเขียนทับหลุดจาก Ring: ตัด id ออกจาก Index ของมัน"""
+        first_id = self.first_id
+        pairs = (
+            (self._by_level, evicted["level"]),
+            (self._by_type, evicted["type"]),
+        )
+        for indexes, key in pairs:
+            index = indexes.get(key)
+            if index is None:
+                continue
+            index.drop_before(first_id)
+            if not len(index):
+                del indexes[key]
+
+    def get(
+        self,
+        after_id: int = 0,
+        until_id: int = None,
+        levels=None,
+        types=None,
+        limit: int = None,
+    ) -> list:
+        """
+        Log ที่ after_id < id <= until_id เรียงจากเก่าไปใหม่
+        levels / types: กรองเฉพาะค่าที่ระบุ (None = ทั้งหมด)
+        limit: เอาแค่ limit รายการล่าสุดในช่วงนั้น
+        """
+        if not self.last_id:
+            return []
+        after_id = max(after_id, self.first_id - 1)
+        until_id = self.last_id if until_id is None else min(until_id, self.last_id)
+        if until_id <= after_id:
+            return []
+
+        if levels is None and types is None:
+            if limit is not None:
+                after_id = max(after_id, until_id - max(limit, 0))
+            ids = range(after_id + 1, until_id + 1)
+        else:
+            # Index ของมิติที่ระบุ (levels ก่อน) แล้วเช็คอีกมิติจาก Entry
+            indexes = self._by_level if levels is not None else self._by_type
+            keys = levels if levels is not None else types
+            ids = heapq.merge(
+                *(
+                    indexes[key].between(after_id, until_id)
+                    for key in keys
+                    if key in indexes
+                )
+            )
+
+        entries = [self._slots[(log_id - 1) % self.capacity] for log_id in ids]
+        if levels is not None and types is not None:
+            entries = [entry for entry in entries if entry["type"] in types]
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return entries
+
+    def get_metrics(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "size": len(self),
+            "last_id": self.last_id,
+            "levels": len(self._by_level),
+            "types": len(self._by_type),
+        }
@@ -1,42 +1,111 @@
 from app.models.log import SystemLog
 from app.models.base import AsyncSessionLocal
+from sqlalchemy import insert
+from datetime import datetime
+import asyncio
 import json
+import os
+import time
 import traceback
 
+# Tunables (override via environment)
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "1000"))
+LOG_FLUSH_MAX_ROWS = int(os.getenv("LOG_FLUSH_MAX_ROWS", "500"))
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+
+# เก็บลง DB 1 ใน N ต่อประเภท Log (1 = เก็บทุกอัน, 0 = ไม่เก็บเลย นับรวมอย่างเดียว)
+# ตัวอย่าง: LOG_SAMPLING="Like=20,Gift=1,Chat=1"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "Like=20")
+
+
+def parse_sampling(spec: str) -> dict:
+    sampling = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        log_type, every_n = part.split("=", 1)
+        sampling[log_type.strip()] = max(0, int(every_n))
+    return sampling
+
 
 class LoggingService:
-    def __init__(self):
+    def __init__(self, sampling: dict = None):
         self.log_callback = None
 
+        # Background sink (start() จาก Lifespan, ถ้าไม่ start จะเขียนทีละแถวเหมือนเดิม)
+        self.pending = []
+        self.flush_task = None
+        self.is_running = False
+        self._full = asyncio.Event()
+
+        # Sampling ต่อประเภท (แก้ได้ตอน Runtime ผ่าน set_sampling)
+        self.sampling = parse_sampling(LOG_SAMPLING) if sampling is None else sampling
+        self.seen = {}  # log_type -> จำนวนที่เข้ามาทั้งหมด
+        self.skipped = {}  # log_type -> จำนวนที่ไม่ได้เก็บ (รอสรุปตอน Flush)
+
+        # Metrics
+        self.flushes = 0
+        self.rows_written = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
     def set_callback(self, callback):
         self.log_callback = callback
 
+    def set_sampling(self, log_type: str, every_n: int):
+        """เก็บ 1 ใน every_n ของ Log ประเภทนี้ (1 = ทุกอัน, 0 = สรุปยอดอย่างเดียว)"""
+        self.sampling[log_type] = max(0, int(every_n))
+        return self.get_sampling()
+
+    def get_sampling(self) -> dict:
+        return dict(self.sampling)
+
+    def _should_store(self, level: str, log_type: str) -> bool:
+        # WARNING / ERROR เก็บทุกอันเสมอ
+        if level != "INFO":
+            return True
+        every_n = self.sampling.get(log_type, 1)
+        count = self.seen.get(log_type, 0) + 1
+        self.seen[log_type] = count
+        if every_n and (count - 1) % every_n == 0:
+            return True
+        self.skipped[log_type] = self.skipped.get(log_type, 0) + 1
+        return False
+
     async def log(self, level: str, message: str, details: dict = None):
         """
         Log system events to Database and Console
         """
-        try:
-            async with AsyncSessionLocal() as session:
-                log_entry = SystemLog(
-                    level=level,
-                    message=message,
-                    details=json.dumps(details, default=str) if details else None,
-                )
-                session.add(log_entry)
-                await session.commit()
-        except Exception as e:
-            print(f"Failed to write log to DB: {e}")
-
-        # Always print to console
-        print(f"[{level}] {message}")
-
-        # Trigger callback if set (e.g. for WebSocket)
+        # Trigger callback first (e.g. for WebSocket), never delayed by the DB
         if self.log_callback:
             try:
                 self.log_callback(level, message, details)
             except Exception as e:
                 print(f"Error in log callback: {e}")
 
+        log_type = details.get("type", "System") if details else "System"
+        if not self._should_store(level, log_type):
+            return
+
+        print(f"[{level}] {message}")
+
+        row = {
+            "timestamp": datetime.utcnow(),
+            "level": level,
+            "message": message,
+            "details": json.dumps(details, default=str) if details else None,
+        }
+        if self.is_running:
+            if len(self.pending) >= LOG_BUFFER_SIZE:
+                self.dropped += 1
+                return
+            self.pending.append(row)
+            if len(self.pending) >= LOG_FLUSH_MAX_ROWS:
+                self._full.set()
+            return
+
+        await self._write([row])
+
     async def error(self, message: str, error: Exception = None):
         details = {}
         if error:
@@ -49,3 +118,78 @@ class LoggingService:
 
     async def warning(self, message: str, details: dict = None):
         await self.log("WARNING", message, details)
+
+    def start(self):
+        if self.flush_task is None:
+            self.is_running = True
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.is_running = False
+            self._full.set()
+            await self.flush_task
+            self.flush_task = None
+        await self.flush()
+
+    def _summary_rows(self) -> list:
+        """แถวสรุปยอดของ Log ที่ไม่ได้เก็บ (1 แถวต่อประเภทต่อ Flush)"""
+        rows = []
+        for log_type, count in self.skipped.items():
+            rows.append(
+                {
+                    "timestamp": datetime.utcnow(),
+                    "level": "INFO",
+                    "message": f"{count} {log_type} logs aggregated (not stored individually)",
+                    "details": json.dumps(
+                        {
+                            "type": log_type,
+                            "aggregated": count,
+                            "sample_every": self.sampling.get(log_type, 1),
+                        }
+                    ),
+                }
+            )
+        self.skipped = {}
+        return rows
+
+    async def flush(self):
+        rows = self.pending + self._summary_rows()
+        self.pending = []
+        self._full.clear()
+        if not rows:
+            return
+
+        started = time.monotonic()
+        await self._write(rows)
+        self.flushes += 1
+        self.last_flush_ms = (time.monotonic() - started) * 1000
+
+    async def _write(self, rows: list):
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(SystemLog), rows)
+                await session.commit()
+            self.rows_written += len(rows)
+        except Exception as e:
+            print(f"Failed to write {len(rows)} logs to DB: {e}")
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "sampling": self.get_sampling(),
+        }
+
+    async def _flush_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(
+                    self._full.wait(), LOG_FLUSH_INTERVAL_MS / 1000.0
+                )
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
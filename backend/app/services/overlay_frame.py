@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+import redis.asyncio as aioredis
+from app.services.ws_codec import encode_json
+
+# Tunables (override via environment)
+OVERLAY_TOP_N = int(os.getenv("OVERLAY_TOP_N", "10"))
+OVERLAY_MIN_INTERVAL_MS = int(os.getenv("OVERLAY_MIN_INTERVAL_MS", "100"))
+OVERLAY_FRAME_KEY = os.getenv("OVERLAY_FRAME_KEY", "overlay:frame")
+OVERLAY_CHANNEL = os.getenv("OVERLAY_CHANNEL", "overlay:frames")
+OVERLAY_PUBSUB = os.getenv("OVERLAY_PUBSUB", "1") != "0"
+
+# Field ที่ Overlay ใช้ (Top-N + รูป)
+OVERLAY_FIELDS = ("user_id", "nickname", "score", "avatar_url", "rank")
+
+
+class OverlayPublisher:
+    """
+    ฝั่งเขียน: เมื่อคะแนนเปลี่ยน (ChangeNotifier) สร้าง Frame JSON ของ Top-N ครั้งเดียว
+    ถ้าต่างจากครั้งก่อน -> SET ลง Key และ PUBLISH ให้ทุก Process
+    """
+
+    def __init__(
+        self,
+        game_manager,
+        redis_client: aioredis.Redis = None,
+        top_n: int = OVERLAY_TOP_N,
+        min_interval_ms: int = OVERLAY_MIN_INTERVAL_MS,
+        key: str = OVERLAY_FRAME_KEY,
+        channel: str = OVERLAY_CHANNEL,
+    ):
+        self.game_manager = game_manager
+        self.r = redis_client
+        self.top_n = top_n
+        self.min_interval = min_interval_ms / 1000.0
+        self.key = key
+        self.channel = channel
+        self.last_text = None
+        self.last_published_at = 0.0
+        self.listeners = []
+        self.publish_task = None
+        self.is_running = False
+        self._wake = asyncio.Event()
+
+        # Metrics
+        self.published = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.last_build_ms = 0.0
+
+    def add_listener(self, callback):
+        """callback(text): ได้ Frame ใหม่ใน Process นี้ทันที (ไม่ต้องรอ Pub/Sub)"""
+        self.listeners.append(callback)
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self.publish_task is None:
+            self.is_running = True
+            # Frame แรกของ Session ปัจจุบัน (Process ที่ไม่มี Session ไม่ต้องปลุก)
+            if self.game_manager.scoring_service is not None:
+                self._wake.set()
+            self.publish_task = asyncio.create_task(self._publish_loop())
+
+    async def stop(self):
+        if self.publish_task:
+            self.is_running = False
+            self._wake.set()
+            await self.publish_task
+            self.publish_task = None
+
+    async def publish(self) -> bool:
+        """สร้าง Frame แล้วส่งต่อถ้า Top-N / ยอดรวมเปลี่ยน คืนค่า True ถ้าส่ง"""
+        gm = self.game_manager
+        # เฉพาะ Process ที่ถือ Session อยู่เป็นคนเขียน Key / Channel
+        # (Process อื่นที่ถูกปลุกจาก ChangeNotifier จะเขียน Frame ว่างทับ Frame จริง)
+        if gm.scoring_service is None:
+            return False
+        started = time.monotonic()
+        rows = await gm.get_leaderboard(0, self.top_n, OVERLAY_FIELDS)
+        counts = await gm.get_leaderboard_counts()
+        text = encode_json(
+            {
+                "type": "overlay",
+                "session_id": gm.current_session_id,
+                **counts,
+                "leaderboard": rows,
+            }
+        )
+        self.last_build_ms = (time.monotonic() - started) * 1000
+        if text == self.last_text:
+            self.unchanged += 1
+            return False
+
+        self.last_text = text
+        for callback in self.listeners:
+            try:
+                callback(text)
+            except Exception as e:
+                print(f"Error in overlay listener: {e}")
+
+        if self.r is not None:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.set(self.key, text)
+            pipe.publish(self.channel, text)
+            await pipe.execute()
+        self.published += 1
+        return True
+
+    def get_metrics(self) -> dict:
+        return {
+            "published": self.published,
+            "unchanged": self.unchanged,
+            "errors": self.errors,
+            "frame_bytes": len(self.last_text or ""),
+            "last_build_ms": round(self.last_build_ms, 1),
+        }
+
+    async def _publish_loop(self):
+        while self.is_running:
+            await self._wake.wait()
+            if not self.is_running:
+                break
+
+            # Rate limit: a burst of score changes becomes one frame
+            delay = self.min_interval - (time.monotonic() - self.last_published_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self._wake.clear()
+            self.last_published_at = time.monotonic()
+            try:
+                await self.publish()
+            except Exception as e:
+                self.errors += 1
+                print(f"Overlay publisher error: {e}")
+
+
+class OverlayRelay:
+    """
+    ฝั่ง WebSocket: ถือ Frame ล่าสุด (Text ที่ Serialize แล้ว) แล้วส่งต่อให้ /ws/overlay
+    ไม่เรียก ScoringService เลย: Frame มาจาก Publisher ใน Process เดียวกัน (push)
+    หรือจาก Redis Key / Channel ที่ Process อื่น Publish
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis = None,
+        key: str = OVERLAY_FRAME_KEY,
+        channel: str = OVERLAY_CHANNEL,
+        use_pubsub: bool = OVERLAY_PUBSUB,
+    ):
+        self.r = redis_client
+        self.key = key
+        self.channel = channel
+        self.use_pubsub = use_pubsub and redis_client is not None
+        self.text = None
+        self.seq = 0
+        self.subscribers = 0
+        self.listen_task = None
+        # ถูก set แล้วเปลี่ยนเป็นอันใหม่ทุก Frame (ปลุกทุก Client ที่รออยู่)
+        self._new_frame = asyncio.Event()
+
+        # Metrics
+        self.frames = 0
+        self.remote_frames = 0
+
+    def push(self, text: str):
+        """Frame ใหม่ (ซ้ำกับล่าสุด = ไม่นับ เช่น Frame ของตัวเองที่วนกลับมาจาก Pub/Sub)"""
+        if text == self.text:
+            return False
+        self.text = text
+        self.seq += 1
+        self.frames += 1
+        new_frame, self._new_frame = self._new_frame, asyncio.Event()
+        new_frame.set()
+        return True
+
+    async def next_frame(self, after_seq: int):
+        """รอ Frame ที่ใหม่กว่า after_seq คืนค่า (seq, text)"""
+        while self.text is None or self.seq <= after_seq:
+            await self._new_frame.wait()
+        return self.seq, self.text
+
+    def start(self):
+        if self.listen_task is None and self.use_pubsub:
+            self.listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listen_task:
+            self.listen_task.cancel()
+            await asyncio.gather(self.listen_task, return_exceptions=True)
+            self.listen_task = None
+
+    def get_metrics(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "frames": self.frames,
+            "remote_frames": self.remote_frames,
+            "seq": self.seq,
+        }
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.r.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Frame ล่าสุดก่อน Subscribe (Process นี้เพิ่งเริ่ม / เชื่อมต่อใหม่)
+                    text = await self.r.get(self.key)
+                    if text and self.text is None:
+                        self.push(text)
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        if self.push(message["data"]):
+                            self.remote_frames += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Overlay subscription error, retrying: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,30 @@
+import os
+import redis.asyncio as aioredis
+
+# Use environment variables for Redis connection
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+# Pool tuning: every coroutine (scoring workers, /ws loops, API) shares this pool.
+# When all connections are busy, callers wait up to REDIS_POOL_TIMEOUT seconds.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+
+redis_pool = aioredis.BlockingConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    decode_responses=True,
+)
+
+
+def get_redis() -> aioredis.Redis:
+    """Redis client bound to the shared connection pool"""
+    return aioredis.Redis(connection_pool=redis_pool)
+
+
+async def close_redis():
+    await redis_pool.disconnect()
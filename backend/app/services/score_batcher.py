@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from app.services.scoring_service import ScoringService
+from app.events import NormalizedEvent
+
+# Tunables (override via environment)
+SCORE_FLUSH_INTERVAL_MS = int(os.getenv("SCORE_FLUSH_INTERVAL_MS", "30"))
+SCORE_FLUSH_MAX_EVENTS = int(os.getenv("SCORE_FLUSH_MAX_EVENTS", "500"))
+
+
+class ScoreBatcher:
+    """
+    สะสม Scoring Event ไว้ใน Flush Window สั้นๆ (เวลา หรือ จำนวน Event ครบก่อน)
+    แล้วส่งเข้า ScoringService.process_batch ทีเดียว
+    """
+
+    def __init__(
+        self,
+        scoring_service: ScoringService,
+        flush_interval_ms: int = SCORE_FLUSH_INTERVAL_MS,
+        max_events: int = SCORE_FLUSH_MAX_EVENTS,
+        on_error=None,
+    ):
+        self.scoring_service = scoring_service
+        # on_error: async callable(error, event_data) ต่อ Event ที่ Flush ไม่สำเร็จ
+        self.on_error = on_error
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_events = max(1, max_events)
+        self.pending = []
+        self.flush_task = None
+        self.is_running = False
+        self._full = asyncio.Event()
+
+        # Metrics
+        self.flushes = 0
+        self.flushed_events = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.failed_flushes = 0
+        self.failed_events = 0
+
+    def add(self, event: NormalizedEvent):
+        self.pending.append(event)
+        if len(self.pending) >= self.max_events:
+            self._full.set()
+
+    def start(self):
+        if self.flush_task is None:
+            self.is_running = True
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            # Let the loop finish its current flush instead of cancelling mid-write
+            self.is_running = False
+            self._full.set()
+            await self.flush_task
+            self.flush_task = None
+        # Flush whatever is left so no score is lost on shutdown
+        await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = []
+        self._full.clear()
+
+        started = time.monotonic()
+        try:
+            await self.scoring_service.process_batch(batch)
+        except Exception as e:
+            # ไม่ Retry: Pipeline อาจเขียนไปแล้วบางส่วน (Retry = คะแนนซ้ำ)
+            # Log ทุก Event ที่ไม่ได้คะแนนแทน
+            self.failed_flushes += 1
+            self.failed_events += len(batch)
+            print(f"Error flushing score batch ({len(batch)} events): {e}")
+            if self.on_error:
+                for event in batch:
+                    await self.on_error(e, {"type": event.type, "data": event})
+            return
+
+        self.flushes += 1
+        self.flushed_events += len(batch)
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = (time.monotonic() - started) * 1000
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "failed_flushes": self.failed_flushes,
+            "failed_events": self.failed_events,
+        }
+
+    async def _flush_loop(self):
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
@@ -1,50 +1,280 @@
+import os
 import redis
+import redis.asyncio as aioredis
 import math
 import json
+from collections import defaultdict
 from datetime import datetime
-
-
-class ScoringService:
+from app.events import LIKE, GIFT, COMMENT
+
+# ปิดการใช้ Lua Script ได้ (เช่น Redis ที่ปิด EVAL ไว้) -> ใช้ Pipeline แทน
+SCORING_USE_LUA = os.getenv("SCORING_USE_LUA", "1") != "0"
+
+# รูปแบบการเก็บสถิติของ User ใน Redis (เลือกต่อ Session, เก็บไว้ที่ session:<id>:layout)
+# hash     = 1 Hash ต่อ User (user_data:<user_id>, user_gifts:<user_id>)
+# columnar = 1 Hash ต่อ Field (col:<field> มี user_id เป็น Field) ใช้ Key น้อย และ
+#            ดึงทั้งหน้า Leaderboard ได้ด้วย HMGET ต่อ Column
+LAYOUT_HASH = "hash"
+LAYOUT_COLUMNAR = "columnar"
+LAYOUTS = (LAYOUT_HASH, LAYOUT_COLUMNAR)
+# Layout ของ Session ใหม่
+SCORING_LAYOUT = os.getenv("SCORING_LAYOUT", LAYOUT_HASH)
+
+# ==================================================================
+# == Lua Scripts (EVALSHA: อัปเดตทุก Key ของ Event ใน Round Trip เดียว) ==
+# ==================================================================
+
+# Row สำหรับแสดงผลของ User (JSON) เก็บใน session:<id>:rows (HASH user_id -> JSON)
+# สร้างใหม่ใน Script เดียวกับที่เขียนสถิติ อ่าน Leaderboard จึงไม่ต้อง Join อะไรอีก
+# build_row(layout, user_id, stats_src, gifts_src, gift_ids_key, gift_meta_key)
+#   hash:     stats_src = user_data:<id>, gifts_src = user_gifts:<id>
+#   columnar: stats_src = col,            gifts_src = col:gift
+ROW_LUA = """
+local function build_row(layout, user_id, stats_src, gifts_src, gift_ids_key, gift_meta_key)
+    local function stat(name)
+        if layout == 'columnar' then
+            return redis.call('HGET', stats_src .. ':' .. name, user_id)
+        end
+        return redis.call('HGET', stats_src, name)
+    end
+
+    local gifts = {}
+    if layout == 'columnar' then
+        for _, gift_id in ipairs(redis.call('SMEMBERS', gift_ids_key)) do
+            local count = redis.call('HGET', gifts_src .. ':' .. gift_id, user_id)
+            if count then
+                gifts[gift_id] = count
+            end
+        end
+    else
+        local raw = redis.call('HGETALL', gifts_src)
+        for i = 1, #raw, 2 do
+            gifts[raw[i]] = raw[i + 1]
+        end
+    end
+
+    local row = {
+        nickname = stat('nickname') or '',
+        avatar_url = stat('avatar_url') or '',
+        comments = (tonumber(stat('total_comments')) or 0)
+            - (tonumber(stat('used_comments_count')) or 0),
+        likes = tonumber(stat('total_likes')) or 0,
+        gifts = tonumber(stat('total_gifts_sent')) or 0,
+    }
+    -- ไม่มี Gift = ไม่ใส่ gifts_breakdown (cjson เข้ารหัส Table ว่างเป็น [] ได้)
+    for gift_id, count in pairs(gifts) do
+        local meta_json = redis.call('HGET', gift_meta_key, gift_id)
+        local meta = meta_json and cjson.decode(meta_json)
+            or {name = 'Unknown', diamond_count = 0}
+        row.gifts_breakdown = row.gifts_breakdown or {}
+        row.gifts_breakdown[meta.name] = {
+            id = gift_id,
+            count = tonumber(count),
+            diamond_count = meta.diamond_count,
+            icon = meta.icon or cjson.null,
+        }
+    end
+    return cjson.encode(row)
+end
+"""
+
+# KEYS: rows, gift_meta
+# ARGV: layout, stats_prefix, gifts_prefix, gift_ids_key, user_id...
+ROW_SCRIPT = ROW_LUA + """
+for i = 5, #ARGV do
+    local user_id = ARGV[i]
+    local stats_src, gifts_src = ARGV[2], ARGV[3]
+    if ARGV[1] ~= 'columnar' then
+        stats_src = stats_src .. ':' .. user_id
+        gifts_src = gifts_src .. ':' .. user_id
+    end
+    redis.call('HSET', KEYS[1], user_id,
+        build_row(ARGV[1], user_id, stats_src, gifts_src, ARGV[4], KEYS[2]))
+end
+return #ARGV - 4
+"""
+
+# KEYS: leaderboard, user_data, user_gifts, gift_meta, rows
+# ARGV: member, points, nickname, avatar_url ("" = ไม่อัปเดต), like_count, like_type_key
+LIKE_SCRIPT = ROW_LUA + """
+redis.call('ZINCRBY', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], 'nickname', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[2], 'avatar_url', ARGV[4])
+end
+redis.call('HINCRBY', KEYS[2], 'total_likes', ARGV[5])
+redis.call('HINCRBY', KEYS[2], ARGV[6], ARGV[5])
+redis.call('HINCRBYFLOAT', KEYS[2], 'points_from_likes', ARGV[2])
+redis.call('HSET', KEYS[5], ARGV[1], build_row('hash', ARGV[1], KEYS[2], KEYS[3], '', KEYS[4]))
+return 1
+"""
+
+# KEYS: leaderboard, user_data, user_gifts, gift_meta, rows
+# ARGV: member, points, nickname, avatar_url, total_coin_value, quantity, gift_id,
+#       meta_json ("" = มีใน gift_meta แล้ว ไม่ต้องเขียนซ้ำ)
+GIFT_SCRIPT = ROW_LUA + """
+redis.call('ZINCRBY', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], 'nickname', ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[2], 'avatar_url', ARGV[4])
+end
+redis.call('HINCRBY', KEYS[2], 'total_gift_coins', ARGV[5])
+redis.call('HINCRBY', KEYS[2], 'total_gifts_sent', ARGV[6])
+redis.call('HINCRBYFLOAT', KEYS[2], 'points_from_gifts', ARGV[2])
+redis.call('HINCRBY', KEYS[3], ARGV[7], ARGV[6])
+if ARGV[8] ~= '' then
+    redis.call('HSET', KEYS[4], ARGV[7], ARGV[8])
+end
+redis.call('HSET', KEYS[5], ARGV[1], build_row('hash', ARGV[1], KEYS[2], KEYS[3], '', KEYS[4]))
+return 1
+"""
+
+# KEYS: leaderboard, user_data, comments, user_gifts, gift_meta, rows
+# ARGV: member ("" = ไม่ต้องใส่ Leaderboard), nickname, avatar_url, comment_json, user_id
+COMMENT_SCRIPT = ROW_LUA + """
+if ARGV[2] ~= '' then
+    redis.call('HSET', KEYS[2], 'nickname', ARGV[2])
+end
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[2], 'avatar_url', ARGV[3])
+end
+if ARGV[1] ~= '' then
+    redis.call('ZINCRBY', KEYS[1], 0, ARGV[1])
+end
+redis.call('RPUSH', KEYS[3], ARGV[4])
+local total = redis.call('HINCRBY', KEYS[2], 'total_comments', 1)
+redis.call('HSET', KEYS[6], ARGV[5], build_row('hash', ARGV[5], KEYS[2], KEYS[4], '', KEYS[5]))
+return total
+"""
+
+# KEYS: user_data, user_gifts, gift_meta, rows -- ลดค่าแต่ไม่ให้ต่ำกว่า 0
+# (atomic แทน read-then-write)  ARGV: user_id
+DECREMENT_USED_COMMENTS_SCRIPT = ROW_LUA + """
+local current = tonumber(redis.call('HGET', KEYS[1], 'used_comments_count') or '0')
+if current > 0 then
+    current = redis.call('HINCRBY', KEYS[1], 'used_comments_count', -1)
+    redis.call('HSET', KEYS[4], ARGV[1], build_row('hash', ARGV[1], KEYS[1], KEYS[2], '', KEYS[3]))
+end
+return current
+"""
+
+
+# Field ของ Leaderboard Row (เรียงตามลำดับที่ส่งออก)
+LEADERBOARD_FIELDS = (
+    "user_key",
+    "user_id",
+    "nickname",
+    "score",
+    "avatar_url",
+    "comments",
+    "likes",
+    "gifts",
+    "gifts_breakdown",
+    "rank",
+)
+
+# Field ทั้งหมดที่อาจมีในสถิติของ User (ใช้อ่านแบบ HGETALL ใน Layout แบบ Column)
+USER_DATA_FIELDS = (
+    "nickname",
+    "avatar_url",
+    "total_likes",
+    "likes_as_follower",
+    "likes_as_non_follower",
+    "points_from_likes",
+    "total_gift_coins",
+    "total_gifts_sent",
+    "points_from_gifts",
+    "total_comments",
+    "unique_comments_count",
+    "used_comments_count",
+    "used_likes",
+    "used_gifts_sent",
+    "used_gift_coins",
+    "used_points",
+)
+
+# Field ที่มาจาก Row สำเร็จรูป (rows) ที่เหลือมาจาก ZSET
+ROW_FIELDS = (
+    "nickname",
+    "avatar_url",
+    "comments",
+    "likes",
+    "gifts",
+    "gifts_breakdown",
+)
+
+# Field ของ Row -> Field ใน user_data ที่ใช้สร้าง Row (_build_rows)
+# (user_key (= user_id เก็บไว้ให้ Client เดิม) / user_id / score / rank มาจาก ZSET,
+# gifts_breakdown มาจาก user_gifts)
+USER_HASH_FIELDS = {
+    "nickname": ("nickname",),
+    "avatar_url": ("avatar_url",),
+    "comments": ("total_comments", "used_comments_count"),
+    "likes": ("total_likes",),
+    "gifts": ("total_gifts_sent",),
+}
+
+
+async def get_session_layout(
+    redis_client: aioredis.Redis, session_id: str, create: bool = False
+) -> str:
     """
-    จัดการ Logic การคำนวณคะแนนและ Leaderboard
-    (Hybrid Model: เก็บ Raw Stats + อัปเดต Real-time Leaderboard)
+    Layout ของ Session (create=True: Session ที่ยังไม่มีข้อมูลจะใช้ SCORING_LAYOUT และบันทึกไว้)
+    Session ที่มีข้อมูลจากก่อนมี Layout ถือเป็น hash
     """
+    layout_key = f"session:{session_id}:layout"
+    layout = await redis_client.get(layout_key)
+    if layout:
+        return layout
+    if not create or await redis_client.exists(f"session:{session_id}:leaderboard"):
+        return LAYOUT_HASH
+    layout = SCORING_LAYOUT if SCORING_LAYOUT in LAYOUTS else LAYOUT_HASH
+    await redis_client.set(layout_key, layout)
+    return layout
 
-    def __init__(self, redis_client: redis.Redis, session_id: str = "default_live"):
-        self.r = redis_client
-        self.session_id = session_id
-
-        # Key หลักสำหรับ Leaderboard (ต้องเร็ว)
-        self.leaderboard_key = f"session:{self.session_id}:leaderboard"  # ZSET
-
-        # Key สำหรับเก็บ "ข้อมูลดิบ" ของแต่ละ User (สำหรับข้อ 5)
-        self.user_data_key_prefix = f"session:{self.session_id}:user_data"  # HASH
 
-        # Key สำหรับเก็บ "Unique Comments" (สำหรับข้อ 5)
-        self.user_comments_key_prefix = f"session:{self.session_id}:comments"  # SET
-
-    def _get_gift_multiplier(self, coin_value: int) -> int:
-        """
-        คำนวณตัวคูณตามมูลค่า Coin (Logic ข้อ 3)
-        """
-        if coin_value <= 4:
-            return 5
-        if coin_value <= 9:
-            return 6
-        if coin_value <= 19:
-            return 7
-        if coin_value <= 49:
-            return 8
-        if coin_value <= 99:
-            return 10
-        if coin_value <= 299:
-            return 15
-        if coin_value <= 999:
-            return 20
+# ตั้งค่าหลัง migrate_leaderboard_members() ทำงานเสร็จ (ครั้งต่อไปข้ามเลย)
+MEMBER_MIGRATION_KEY = "migrations:leaderboard_user_id_members"
 
 
-import redis
-import math
+async def migrate_leaderboard_members(redis_client: aioredis.Redis) -> int:
+    """
+    One-shot: แปลง Member แบบเก่า "user_id|nickname" ของทุก Session เป็น user_id
+    Row ที่แตกเพราะเปลี่ยนชื่อจะถูกรวมคะแนนกลับเป็น Row เดียว
+    คืนค่าจำนวน Member เก่าที่แปลง
+    """
+    if await redis_client.exists(MEMBER_MIGRATION_KEY):
+        return 0
+
+    migrated = 0
+    async for leaderboard_key in redis_client.scan_iter(match="session:*:leaderboard"):
+        legacy = {}
+        async for member, score in redis_client.zscan_iter(
+            leaderboard_key, match="*|*"
+        ):
+            legacy[member] = score
+        if not legacy:
+            continue
+
+        merged = defaultdict(float)  # user_id -> score รวม
+        nicknames = {}
+        for member, score in legacy.items():
+            user_id, nickname = member.split("|", 1)
+            merged[user_id] += score
+            nicknames.setdefault(user_id, nickname)
+
+        user_data_prefix = leaderboard_key[: -len("leaderboard")] + "user_data"
+        pipe = redis_client.pipeline()
+        pipe.zrem(leaderboard_key, *legacy)
+        for user_id, score in merged.items():
+            pipe.zincrby(leaderboard_key, score, user_id)
+            # ชื่อเดิมเก็บใน Hash (ถ้ายังไม่มี) เพราะ Member ไม่มีชื่อแล้ว
+            pipe.hsetnx(f"{user_data_prefix}:{user_id}", "nickname", nicknames[user_id])
+        await pipe.execute()
+        migrated += len(legacy)
+
+    await redis_client.set(MEMBER_MIGRATION_KEY, 1)
+    return migrated
 
 
 class ScoringService:
@@ -53,9 +283,26 @@ class ScoringService:
     (Hybrid Model: เก็บ Raw Stats + อัปเดต Real-time Leaderboard)
     """
 
-    def __init__(self, redis_client: redis.Redis, session_id: str = "default_live"):
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        session_id: str = "default_live",
+        gift_catalog=None,
+        notifier=None,
+        layout: str = LAYOUT_HASH,
+    ):
         self.r = redis_client
         self.session_id = session_id
+        self.layout = layout
+
+        # ChangeNotifier: ปลุก WebSocket Publisher หลังเขียนคะแนน (ไม่ต้องรอ Poll)
+        self.notifier = notifier
+
+        # GiftCatalog (ในหน่วยความจำ) ใช้แทนการอ่าน gift_meta ทั้ง Hash
+        self.gift_catalog = gift_catalog
+        self.gift_meta_key = f"session:{self.session_id}:gift_meta"  # HASH
+        # gift_id -> icon ที่เขียนลง gift_meta ของ Session นี้แล้ว
+        self._gift_meta_written = {}
 
         # Key หลักสำหรับ Leaderboard (ต้องเร็ว)
         self.leaderboard_key = f"session:{self.session_id}:leaderboard"  # ZSET
@@ -66,185 +313,133 @@ class ScoringService:
         # Key สำหรับเก็บ "Unique Comments" (สำหรับข้อ 5)
         self.user_comments_key_prefix = f"session:{self.session_id}:comments"  # SET
 
-    def _get_gift_multiplier(self, coin_value: int) -> int:
-        """
-        คำนวณตัวคูณตามมูลค่า Coin (Logic ข้อ 3)
-        """
-        if coin_value <= 4:
-            return 5
-        if coin_value <= 9:
-            return 6
-        if coin_value <= 19:
-            return 7
-        if coin_value <= 49:
-            return 8
-        if coin_value <= 99:
-            return 10
-        if coin_value <= 299:
-            return 15
-        if coin_value <= 999:
-            return 20
-        return 30  # >= 1000
-
-    def _get_user_key(self, user_id: str, user_nickname: str) -> str:
-        """สร้าง Key มาตรฐานสำหรับ ZSET"""
-        return f"{user_id}|{user_nickname}"
-
-    def process_like(
-        self,
-        user_id: str,
-        user_nickname: str,
-        like_count: int,
-        is_follower: bool,
-        avatar_url: str = None,
-    ):
-        """
-        ประมวลผล Like:
-        1. คำนวณคะแนนเป็น float
-        2. อัปเดต Leaderboard (ZSET)
-        3. เก็บสถิติดิบ (HASH)
-        """
-
-        if is_follower:
-            # 10 likes = 1 point
-            points = like_count / 10.0
-            like_type_key = "likes_as_follower"
-        else:
-            # 15 likes = 1 point
-            points = like_count / 15.0
-            like_type_key = "likes_as_non_follower"
-
-        if points > 0:
-            # print(f"❤️  [{user_nickname}] (Follower: {is_follower}) got {points:.4f} points from {like_count} likes")
-
-            user_key = self._get_user_key(user_id, user_nickname)
-            user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-
-            # 2. อัปเดต Leaderboard (ZSET)
-            self.r.zincrby(self.leaderboard_key, points, user_key)
-
-            # 3. เก็บสถิติดิบ (HASH)
-            pipe = self.r.pipeline()
-            pipe.hset(user_hash_key, "nickname", user_nickname)
-            if avatar_url:
-                pipe.hset(user_hash_key, "avatar_url", avatar_url)
-            pipe.hincrby(user_hash_key, "total_likes", like_count)
-            pipe.hincrby(user_hash_key, like_type_key, like_count)
-            pipe.hincrbyfloat(user_hash_key, "points_from_likes", points)
-            pipe.execute()
+        # Layout แบบ Column: col:<field> (HASH user_id -> ค่า), col:gift:<gift_id>
+        # (HASH user_id -> จำนวน) และ col:gift_ids (SET ของ Gift ที่มีใน Session)
+        self.layout_key = f"session:{self.session_id}:layout"  # STRING
+        self.column_key_prefix = f"session:{self.session_id}:col"
+        self.gift_ids_key = f"{self.column_key_prefix}:gift_ids"  # SET
+
+        # Row ที่พร้อมแสดงผลของแต่ละ User (HASH user_id -> JSON, ดู ROW_LUA)
+        self.rows_key = f"session:{self.session_id}:rows"
+        self._row_script_sha = None
+
+        # Lua Scripts (register_script ไม่ได้คุยกับ Server, โหลดตอนเรียกครั้งแรก)
+        # Script เขียนสถิติเป็นของ Layout hash, Layout แบบ Column ใช้ Pipeline
+        # (+ ROW_SCRIPT อัปเดต Row ใน MULTI เดียวกัน)
+        self.use_scripts = SCORING_USE_LUA
+        self._like_script = self.r.register_script(LIKE_SCRIPT)
+        self._gift_script = self.r.register_script(GIFT_SCRIPT)
+        self._comment_script = self.r.register_script(COMMENT_SCRIPT)
+        self._decrement_used_script = self.r.register_script(
+            DECREMENT_USED_COMMENTS_SCRIPT
+        )
 
-    def process_gift(
-        self,
-        user_id: str,
-        user_nickname: str,
-        coin_value_per_unit: int,
-        gift_id: str,
-        gift_name: str,
-        gift_quantity: int,
-        avatar_url: str = None,
-    ):
+    async def _run_script(self, script, keys: list, args: list) -> bool:
         """
-        ประมวลผล Gift
+        รัน Lua Script, คืนค่า False ถ้า Server ไม่รองรับ Scripting
+        (ครั้งต่อไปจะใช้ Pipeline Fallback เลย)
         """
-        multiplier = self._get_gift_multiplier(coin_value_per_unit)
-        points = (coin_value_per_unit * multiplier) * gift_quantity
-        total_coin_value = coin_value_per_unit * gift_quantity
-
-        # print(f"🎁 [{user_nickname}] got {points} points from {gift_quantity}x {gift_name}")
-
-        user_key = self._get_user_key(user_id, user_nickname)
-        user_summary_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-        user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
-
-        self.r.zincrby(self.leaderboard_key, points, user_key)
-
-        pipe = self.r.pipeline()
-        pipe.hset(user_summary_hash_key, "nickname", user_nickname)
-        if avatar_url:
-            pipe.hset(user_summary_hash_key, "avatar_url", avatar_url)
-        pipe.hincrby(user_summary_hash_key, "total_gift_coins", total_coin_value)
-        pipe.hincrby(user_summary_hash_key, "total_gifts_sent", gift_quantity)
-        pipe.hincrbyfloat(user_summary_hash_key, "points_from_gifts", points)
-
-        gift_field_key = f"{gift_id}|{gift_name}"
-        pipe.hincrby(user_gifts_hash_key, gift_field_key, gift_quantity)
-        pipe.execute()
-
-    def process_comment(
-        self,
-        user_id: str,
-        comment_text: str,
-        user_nickname: str = "",
-        avatar_url: str = None,
-    ):
+        if not self.use_scripts or self.layout != LAYOUT_HASH:
+            return False
+        try:
+            await script(keys=keys, args=args)
+            return True
+        except redis.exceptions.ResponseError as e:
+            if self._scripting_unavailable(e):
+                return False
+            raise
+
+    def _scripting_unavailable(self, error: Exception) -> bool:
+        message = str(error).lower()
+        if "unknown command" in message or "noperm" in message or "disabled" in message:
+            print(f"Redis scripting unavailable, falling back to pipelines: {error}")
+            self.use_scripts = False
+            return True
+        return False
+
+    def _row_sources(self):
+        """(stats_prefix, gifts_prefix) ของ ROW_SCRIPT ตาม Layout"""
+        if self.layout == LAYOUT_COLUMNAR:
+            return self.column_key_prefix, f"{self.column_key_prefix}:gift"
+        return self.user_data_key_prefix, f"session:{self.session_id}:user_gifts"
+
+    async def _queue_row_refresh(self, pipe, user_ids) -> bool:
         """
-        เก็บ Unique Comment ของ User
+        ใส่ EVALSHA ROW_SCRIPT ต่อท้าย Pipeline (อัปเดต Row พร้อมกับสถิติ)
+        ใช้ SHA ตรงๆ (ไม่ผ่าน Script Object) เพื่อไม่ให้ Pipeline ถาม SCRIPT EXISTS ทุกครั้ง
+        คืนค่า False ถ้าใช้ Lua ไม่ได้ (ต้อง _build_rows เองหลัง execute)
         """
-        comment_key = f"{self.user_comments_key_prefix}:{user_id}"
-        user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-
-        # Update User Info
-        if user_nickname or avatar_url:
-            pipe = self.r.pipeline()
-            if user_nickname:
-                pipe.hset(user_hash_key, "nickname", user_nickname)
-            if avatar_url:
-                pipe.hset(user_hash_key, "avatar_url", avatar_url)
-            pipe.execute()
-
-        # SADD: returns 1 if new
-        if self.r.sadd(comment_key, comment_text):
-            # print(f"💬 Saved NEW comment for {user_id}: {comment_text}")
-            self.r.hincrby(user_hash_key, "unique_comments_count", 1)
-
-        # Always increment total comments
-        # Always increment total comments
-        self.r.hincrby(user_hash_key, "total_comments", 1)
+        if not user_ids or not self.use_scripts:
+            return False
+        if self._row_script_sha is None:
+            try:
+                self._row_script_sha = await self.r.script_load(ROW_SCRIPT)
+            except redis.exceptions.ResponseError as e:
+                if self._scripting_unavailable(e):
+                    return False
+                raise
+        stats_prefix, gifts_prefix = self._row_sources()
+        pipe.evalsha(
+            self._row_script_sha,
+            2,
+            self.rows_key,
+            self.gift_meta_key,
+            self.layout,
+            stats_prefix,
+            gifts_prefix,
+            self.gift_ids_key,
+            *user_ids,
+        )
+        return True
 
-    def increment_used_comments(self, user_id: str):
+    async def _execute_with_rows(self, pipe, user_ids):
         """
-        Increment the count of used comments for a user.
+        execute() Pipeline ที่เขียนสถิติ แล้วให้ Row ของ user_ids ตรงกับสถิติใหม่
+        pipe เป็น MULTI/EXEC: EVALSHA อยู่ใน Transaction เดียวกับสถิติ (Atomic)
+        ยกเว้นตอนใช้ Lua ไม่ได้ / Script หาย: สร้าง Row หลัง execute (มีช่วงสั้นๆ ที่ Row ยังเก่า)
         """
-        user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-        self.r.hincrby(user_hash_key, "used_comments_count", 1)
-
-    def decrement_used_comments(self, user_id: str):
+        queued = await self._queue_row_refresh(pipe, user_ids)
+        try:
+            await pipe.execute()
+        except redis.exceptions.NoScriptError:
+            # Script หายจาก Server (Restart / SCRIPT FLUSH): สถิติเขียนแล้ว เหลือแค่ Row
+            self._row_script_sha = None
+            queued = False
+        if not queued:
+            await self._build_rows(user_ids)
+
+    async def _notify(self):
+        if self.notifier:
+            await self.notifier.notify(self.session_id)
+
+    def _gift_meta_json(self, gift_id: str, name: str, diamond_count: int, icon: str):
+        """JSON ของ gift_meta หรือ None ถ้า Session นี้มีข้อมูลเดิมอยู่แล้ว (รูปไม่เปลี่ยน)"""
+        if gift_id in self._gift_meta_written and (
+            not icon or self._gift_meta_written[gift_id] == icon
+        ):
+            return None
+        return json.dumps({"name": name, "diamond_count": diamond_count, "icon": icon})
+
+    async def _get_gift_meta(self, gift_ids) -> dict:
         """
-        Decrement the count of used comments for a user.
+        Metadata ของ Gift ตาม ID: ดูจาก GiftCatalog ก่อน
+        อ่าน gift_meta (HMGET) เฉพาะ ID ที่ Catalog ไม่รู้จัก (เช่น Session เก่า)
         """
-        user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-        # Ensure we don't go below 0
-        current = int(self.r.hget(user_hash_key, "used_comments_count") or 0)
-        if current > 0:
-            self.r.hincrby(user_hash_key, "used_comments_count", -1)
-
-    # ==================================================================
-    # == ส่วนของการ "แสดงผล" (คำนวณจาก ZSET ที่เตรียมไว้แล้ว) ==
-    # ==================================================================
-
-
-import redis
-import math
-
-
-class ScoringService:
-    """
-    จัดการ Logic การคำนวณคะแนนและ Leaderboard
-    (Hybrid Model: เก็บ Raw Stats + อัปเดต Real-time Leaderboard)
-    """
-
-    def __init__(self, redis_client: redis.Redis, session_id: str = "default_live"):
-        self.r = redis_client
-        self.session_id = session_id
-
-        # Key หลักสำหรับ Leaderboard (ต้องเร็ว)
-        self.leaderboard_key = f"session:{self.session_id}:leaderboard"  # ZSET
-
-        # Key สำหรับเก็บ "ข้อมูลดิบ" ของแต่ละ User (สำหรับข้อ 5)
-        self.user_data_key_prefix = f"session:{self.session_id}:user_data"  # HASH
-
-        # Key สำหรับเก็บ "Unique Comments" (สำหรับข้อ 5)
-        self.user_comments_key_prefix = f"session:{self.session_id}:comments"  # SET
+        meta_map = {}
+        missing = []
+        for gid in gift_ids:
+            meta = self.gift_catalog.get(gid) if self.gift_catalog else None
+            if meta:
+                meta_map[gid] = meta
+            else:
+                missing.append(gid)
+
+        if missing:
+            raw = await self.r.hmget(self.gift_meta_key, missing)
+            for gid, value in zip(missing, raw):
+                if value:
+                    meta_map[gid] = json.loads(value)
+        return meta_map
 
     def _get_gift_multiplier(self, coin_value: int) -> int:
         """
@@ -266,11 +461,40 @@ class ScoringService:
             return 20
         return 30  # >= 1000
 
-    def _get_user_key(self, user_id: str, user_nickname: str) -> str:
-        """สร้าง Key มาตรฐานสำหรับ ZSET"""
-        return f"{user_id}|{user_nickname}"
+    def _user_field(self, user_id: str, name: str):
+        """(key, field) ของสถิติ name ของ User ตาม Layout ของ Session"""
+        if self.layout == LAYOUT_COLUMNAR:
+            return f"{self.column_key_prefix}:{name}", user_id
+        return f"{self.user_data_key_prefix}:{user_id}", name
+
+    def _gift_field(self, user_id: str, gift_id: str):
+        """(key, field) ของจำนวน Gift gift_id ที่ User ส่ง ตาม Layout ของ Session"""
+        if self.layout == LAYOUT_COLUMNAR:
+            return f"{self.column_key_prefix}:gift:{gift_id}", user_id
+        return f"session:{self.session_id}:user_gifts:{user_id}", gift_id
+
+    def _get_user_key(self, user_id: str) -> str:
+        """
+        Member ของ ZSET = user_id อย่างเดียว (ชื่อ / Avatar อยู่ใน user_data Hash)
+        เปลี่ยนชื่อแล้วยังเป็น Row เดิม และหา / Reset ได้ด้วย Key เดียว
+        """
+        return str(user_id)
+
+    def _calc_like_points(self, like_count: int, is_follower: bool):
+        """คืนค่า (points, like_type_key) ของ Like"""
+        if is_follower:
+            # 10 likes = 1 point
+            return like_count / 10.0, "likes_as_follower"
+        # 15 likes = 1 point
+        return like_count / 10.0, "likes_as_non_follower"
 
-    def process_like(
+    def _calc_gift_points(self, coin_value_per_unit: int, gift_quantity: int):
+        """คืนค่า (points, total_coin_value) ของ Gift"""
+        multiplier = self._get_gift_multiplier(coin_value_per_unit)
+        points = (coin_value_per_unit * multiplier) * gift_quantity
+        return points, coin_value_per_unit * gift_quantity
+
+    async def process_like(
         self,
         user_id: str,
         user_nickname: str,
@@ -284,36 +508,52 @@ class ScoringService:
         2. อัปเดต Leaderboard (ZSET)
         3. เก็บสถิติดิบ (HASH)
         """
-
-        if is_follower:
-            # 10 likes = 1 point
-            points = like_count / 10.0
-            like_type_key = "likes_as_follower"
-        else:
-            # 15 likes = 1 point
-            points = like_count / 10.0
-            like_type_key = "likes_as_non_follower"
+        points, like_type_key = self._calc_like_points(like_count, is_follower)
 
         if points > 0:
             # print(f"❤️  [{user_nickname}] (Follower: {is_follower}) got {points:.4f} points from {like_count} likes")
 
-            user_key = self._get_user_key(user_id, user_nickname)
+            user_key = self._get_user_key(user_id)
             user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
+            user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
 
+            if await self._run_script(
+                self._like_script,
+                [
+                    self.leaderboard_key,
+                    user_hash_key,
+                    user_gifts_hash_key,
+                    self.gift_meta_key,
+                    self.rows_key,
+                ],
+                [
+                    user_key,
+                    points,
+                    user_nickname,
+                    avatar_url or "",
+                    like_count,
+                    like_type_key,
+                ],
+            ):
+                await self._notify()
+                return
+
+            # Fallback: MULTI/EXEC Pipeline
+            pipe = self.r.pipeline()
             # 2. อัปเดต Leaderboard (ZSET)
-            self.r.zincrby(self.leaderboard_key, points, user_key)
+            pipe.zincrby(self.leaderboard_key, points, user_key)
 
             # 3. เก็บสถิติดิบ (HASH)
-            pipe = self.r.pipeline()
-            pipe.hset(user_hash_key, "nickname", user_nickname)
+            pipe.hset(*self._user_field(user_id, "nickname"), user_nickname)
             if avatar_url:
-                pipe.hset(user_hash_key, "avatar_url", avatar_url)
-            pipe.hincrby(user_hash_key, "total_likes", like_count)
-            pipe.hincrby(user_hash_key, like_type_key, like_count)
-            pipe.hincrbyfloat(user_hash_key, "points_from_likes", points)
-            pipe.execute()
-
-    def process_gift(
+                pipe.hset(*self._user_field(user_id, "avatar_url"), avatar_url)
+            pipe.hincrby(*self._user_field(user_id, "total_likes"), like_count)
+            pipe.hincrby(*self._user_field(user_id, like_type_key), like_count)
+            pipe.hincrbyfloat(*self._user_field(user_id, "points_from_likes"), points)
+            await self._execute_with_rows(pipe, [user_id])
+            await self._notify()
+
+    async def process_gift(
         self,
         user_id: str,
         user_nickname: str,
@@ -327,41 +567,72 @@ class ScoringService:
         """
         ประมวลผล Gift
         """
-        multiplier = self._get_gift_multiplier(coin_value_per_unit)
-        points = (coin_value_per_unit * multiplier) * gift_quantity
-        total_coin_value = coin_value_per_unit * gift_quantity
+        points, total_coin_value = self._calc_gift_points(
+            coin_value_per_unit, gift_quantity
+        )
 
         # print(f"🎁 [{user_nickname}] got {points} points from {gift_quantity}x {gift_name}")
 
-        user_key = self._get_user_key(user_id, user_nickname)
+        user_key = self._get_user_key(user_id)
         user_summary_hash_key = f"{self.user_data_key_prefix}:{user_id}"
         user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
-        gift_meta_key = f"session:{self.session_id}:gift_meta"
+        gift_meta_key = self.gift_meta_key
 
-        self.r.zincrby(self.leaderboard_key, points, user_key)
+        # Gift Metadata (Global for session) เขียนเฉพาะ Gift ใหม่/รูปเปลี่ยน
+        meta_json = self._gift_meta_json(
+            gift_id, gift_name, coin_value_per_unit, gift_icon
+        )
 
+        if await self._run_script(
+            self._gift_script,
+            [
+                self.leaderboard_key,
+                user_summary_hash_key,
+                user_gifts_hash_key,
+                gift_meta_key,
+                self.rows_key,
+            ],
+            [
+                user_key,
+                points,
+                user_nickname,
+                avatar_url or "",
+                total_coin_value,
+                gift_quantity,
+                gift_id,
+                meta_json or "",
+            ],
+        ):
+            if meta_json:
+                self._gift_meta_written[gift_id] = gift_icon
+            await self._notify()
+            return
+
+        # Fallback: MULTI/EXEC Pipeline
         pipe = self.r.pipeline()
-        pipe.hset(user_summary_hash_key, "nickname", user_nickname)
+        pipe.zincrby(self.leaderboard_key, points, user_key)
+        pipe.hset(*self._user_field(user_id, "nickname"), user_nickname)
         if avatar_url:
-            pipe.hset(user_summary_hash_key, "avatar_url", avatar_url)
-        pipe.hincrby(user_summary_hash_key, "total_gift_coins", total_coin_value)
-        pipe.hincrby(user_summary_hash_key, "total_gifts_sent", gift_quantity)
-        pipe.hincrbyfloat(user_summary_hash_key, "points_from_gifts", points)
+            pipe.hset(*self._user_field(user_id, "avatar_url"), avatar_url)
+        pipe.hincrby(*self._user_field(user_id, "total_gift_coins"), total_coin_value)
+        pipe.hincrby(*self._user_field(user_id, "total_gifts_sent"), gift_quantity)
+        pipe.hincrbyfloat(*self._user_field(user_id, "points_from_gifts"), points)
 
         # Store User Gift Count (Key = Gift ID)
-        pipe.hincrby(user_gifts_hash_key, gift_id, gift_quantity)
+        pipe.hincrby(*self._gift_field(user_id, gift_id), gift_quantity)
+        if self.layout == LAYOUT_COLUMNAR:
+            pipe.sadd(self.gift_ids_key, gift_id)
 
         # Store Gift Metadata (Global for session)
-        meta_data = {
-            "name": gift_name,
-            "diamond_count": coin_value_per_unit,
-            "icon": gift_icon,
-        }
-        pipe.hset(gift_meta_key, gift_id, json.dumps(meta_data))
+        if meta_json:
+            pipe.hset(gift_meta_key, gift_id, meta_json)
 
-        pipe.execute()
+        await self._execute_with_rows(pipe, [user_id])
+        if meta_json:
+            self._gift_meta_written[gift_id] = gift_icon
+        await self._notify()
 
-    def process_comment(
+    async def process_comment(
         self,
         user_id: str,
         comment_text: str,
@@ -373,42 +644,221 @@ class ScoringService:
         """
         comment_key = f"{self.user_comments_key_prefix}:{user_id}"
         user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
+        user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
 
-        # Update User Info
-        if user_nickname or avatar_url:
-            pipe = self.r.pipeline()
-            if user_nickname:
-                pipe.hset(user_hash_key, "nickname", user_nickname)
-            if avatar_url:
-                pipe.hset(user_hash_key, "avatar_url", avatar_url)
-            pipe.execute()
+        user_key = self._get_user_key(user_id) if user_nickname else ""
 
-        # Ensure user is in leaderboard (with 0 score if new)
+        # Create Comment Object
+        comment_json = json.dumps(
+            {
+                "text": comment_text,
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
+
+        if await self._run_script(
+            self._comment_script,
+            [
+                self.leaderboard_key,
+                user_hash_key,
+                comment_key,
+                user_gifts_hash_key,
+                self.gift_meta_key,
+                self.rows_key,
+            ],
+            [user_key, user_nickname or "", avatar_url or "", comment_json, user_id],
+        ):
+            await self._notify()
+            return
+
+        # Fallback: MULTI/EXEC Pipeline
+        pipe = self.r.pipeline()
+
+        # Update User Info
         if user_nickname:
-            user_key = self._get_user_key(user_id, user_nickname)
-            self.r.zincrby(self.leaderboard_key, 0, user_key)
+            pipe.hset(*self._user_field(user_id, "nickname"), user_nickname)
+        if avatar_url:
+            pipe.hset(*self._user_field(user_id, "avatar_url"), avatar_url)
 
-        # Create Comment Object
-        comment_obj = {
-            "text": comment_text,
-            "timestamp": datetime.now().isoformat(),
-        }
+        # Ensure user is in leaderboard (with 0 score if new)
+        if user_key:
+            pipe.zincrby(self.leaderboard_key, 0, user_key)
 
         # RPUSH: Append to list (store all comments)
-        self.r.rpush(comment_key, json.dumps(comment_obj))
+        pipe.rpush(comment_key, comment_json)
 
         # Always increment total comments
-        self.r.hincrby(user_hash_key, "total_comments", 1)
+        pipe.hincrby(*self._user_field(user_id, "total_comments"), 1)
+        await self._execute_with_rows(pipe, [user_id])
+        await self._notify()
+
+    async def process_batch(self, events: list):
+        """
+        ประมวลผล Event หลายตัว (ที่สะสมใน Flush Window) ด้วย Pipeline เดียว
+        ได้ Key/ค่าเหมือนเรียก process_like/process_gift/process_comment ทีละตัว
+        แต่รวมยอดต่อ User ก่อนส่ง จึงเสีย Round Trip เดียวต่อ Batch
 
-    def reset_user_stats(self, user_id: str):
+        events: list ของ NormalizedEvent (like / gift / comment)
+          gift ใช้ event.count เป็นจำนวนที่คิดคะแนน
+        """
+        if not events:
+            return
+
+        zset_incr = defaultdict(float)  # user_key -> points
+        hash_set = {}  # (key, field) -> value
+        hash_incr = defaultdict(int)  # (key, field) -> int
+        hash_incr_float = defaultdict(float)
+        gift_meta = {}  # gift_id -> json
+        gift_icons = {}  # gift_id -> icon (ที่จะเขียนใน Batch นี้)
+        gift_ids = set()
+        comment_push = defaultdict(list)  # list key -> [json]
+        touched = []  # user_id ที่ต้องสร้าง Row ใหม่ (ตามลำดับที่เจอ)
+
+        for event in events:
+            user_id = event.user_id
+            nickname = event.nickname
+            avatar_url = event.avatar_url
+
+            if event.type == LIKE:
+                points, like_type_key = self._calc_like_points(
+                    event.count, event.is_follower
+                )
+                if points <= 0:
+                    continue
+                touched.append(user_id)
+                zset_incr[self._get_user_key(user_id)] += points
+                hash_set[self._user_field(user_id, "nickname")] = nickname
+                if avatar_url:
+                    hash_set[self._user_field(user_id, "avatar_url")] = avatar_url
+                hash_incr[self._user_field(user_id, "total_likes")] += event.count
+                hash_incr[self._user_field(user_id, like_type_key)] += event.count
+                hash_incr_float[self._user_field(user_id, "points_from_likes")] += points
+
+            elif event.type == GIFT:
+                quantity = event.count
+                points, total_coin_value = self._calc_gift_points(
+                    event.diamond_count, quantity
+                )
+                touched.append(user_id)
+                zset_incr[self._get_user_key(user_id)] += points
+                hash_set[self._user_field(user_id, "nickname")] = nickname
+                if avatar_url:
+                    hash_set[self._user_field(user_id, "avatar_url")] = avatar_url
+                hash_incr[self._user_field(user_id, "total_gift_coins")] += total_coin_value
+                hash_incr[self._user_field(user_id, "total_gifts_sent")] += quantity
+                hash_incr_float[self._user_field(user_id, "points_from_gifts")] += points
+                hash_incr[self._gift_field(user_id, event.gift_id)] += quantity
+                gift_ids.add(event.gift_id)
+                meta_json = self._gift_meta_json(
+                    event.gift_id,
+                    event.gift_name,
+                    event.diamond_count,
+                    event.gift_image,
+                )
+                if meta_json:
+                    gift_meta[event.gift_id] = meta_json
+                    gift_icons[event.gift_id] = event.gift_image
+
+            elif event.type == COMMENT:
+                touched.append(user_id)
+                if nickname:
+                    hash_set[self._user_field(user_id, "nickname")] = nickname
+                    # Ensure user is in leaderboard (with 0 score if new)
+                    zset_incr[self._get_user_key(user_id)] += 0
+                if avatar_url:
+                    hash_set[self._user_field(user_id, "avatar_url")] = avatar_url
+                comment_obj = {
+                    "text": event.comment,
+                    "timestamp": datetime.now().isoformat(),
+                }
+                comment_push[f"{self.user_comments_key_prefix}:{user_id}"].append(
+                    json.dumps(comment_obj)
+                )
+                hash_incr[self._user_field(user_id, "total_comments")] += 1
+
+        # HSET หลาย Field ของ Key เดียวกันใน Command เดียว
+        mappings = defaultdict(dict)
+        for (key, field), value in hash_set.items():
+            mappings[key][field] = value
+
+        # MULTI/EXEC: Reader ไม่เห็นคะแนนใหม่ก่อนที่ Row จะถูกสร้างใหม่
+        pipe = self.r.pipeline()
+        for user_key, points in zset_incr.items():
+            pipe.zincrby(self.leaderboard_key, points, user_key)
+        for key, mapping in mappings.items():
+            pipe.hset(key, mapping=mapping)
+        for (key, field), amount in hash_incr.items():
+            pipe.hincrby(key, field, amount)
+        for (key, field), amount in hash_incr_float.items():
+            pipe.hincrbyfloat(key, field, amount)
+        for key, values in comment_push.items():
+            pipe.rpush(key, *values)
+        if gift_meta:
+            pipe.hset(self.gift_meta_key, mapping=gift_meta)
+        if gift_ids and self.layout == LAYOUT_COLUMNAR:
+            pipe.sadd(self.gift_ids_key, *gift_ids)
+        # Row ของทุกคนใน Batch อัปเดตใน EVALSHA เดียวต่อท้าย Pipeline นี้
+        await self._execute_with_rows(pipe, list(dict.fromkeys(touched)))
+        self._gift_meta_written.update(gift_icons)
+        # One notification per batch (the publisher coalesces further)
+        await self._notify()
+
+    async def increment_used_comments(self, user_id: str):
+        """
+        Increment the count of used comments for a user.
+        """
+        pipe = self.r.pipeline()
+        pipe.hincrby(*self._user_field(user_id, "used_comments_count"), 1)
+        await self._execute_with_rows(pipe, [user_id])
+        await self._notify()
+
+    async def decrement_used_comments(self, user_id: str):
+        """
+        Decrement the count of used comments for a user.
+        """
+        user_hash_key, field = self._user_field(user_id, "used_comments_count")
+        # Ensure we don't go below 0
+        if await self._run_script(
+            self._decrement_used_script,
+            [
+                user_hash_key,
+                f"session:{self.session_id}:user_gifts:{user_id}",
+                self.gift_meta_key,
+                self.rows_key,
+            ],
+            [user_id],
+        ):
+            await self._notify()
+            return
+
+        # Fallback: WATCH/MULTI (optimistic lock แทน Lua)
+        async with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(user_hash_key)
+                    current = int(await pipe.hget(user_hash_key, field) or 0)
+                    if current <= 0:
+                        await pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.hincrby(user_hash_key, field, -1)
+                    await self._execute_with_rows(pipe, [user_id])
+                    await self._notify()
+                    return
+                except redis.exceptions.WatchError:
+                    continue
+
+    async def reset_user_stats(self, user_id: str):
         """
         Reset คะแนนและสถิติปัจจุบันของ User โดยย้ายไปเก็บใน 'Used' History
         """
-        user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
         user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
 
+        def stat(name):
+            return self._user_field(user_id, name)
+
         # 1. ดึงข้อมูลปัจจุบัน
-        stats = self.r.hgetall(user_hash_key)
+        stats = await self._get_user_stats(user_id)
         current_likes = int(stats.get("total_likes", 0))
         current_gifts_sent = int(stats.get("total_gifts_sent", 0))
         current_gift_coins = int(stats.get("total_gift_coins", 0))
@@ -418,19 +868,19 @@ class ScoringService:
         current_total_points = current_points_likes + current_points_gifts
 
         # ดึง Gifts ปัจจุบัน
-        current_gifts_raw = self.r.hgetall(user_gifts_hash_key)
+        current_gifts_raw = await self._get_user_gifts(user_id)
 
         # 2. Atomic Update
         pipe = self.r.pipeline()
 
         # 2.1 เพิ่มเข้า Used Stats
-        pipe.hincrby(user_hash_key, "used_likes", current_likes)
-        pipe.hincrby(user_hash_key, "used_gifts_sent", current_gifts_sent)
-        pipe.hincrby(user_hash_key, "used_gift_coins", current_gift_coins)
-        pipe.hincrbyfloat(user_hash_key, "used_points", current_total_points)
+        pipe.hincrby(*stat("used_likes"), current_likes)
+        pipe.hincrby(*stat("used_gifts_sent"), current_gifts_sent)
+        pipe.hincrby(*stat("used_gift_coins"), current_gift_coins)
+        pipe.hincrbyfloat(*stat("used_points"), current_total_points)
 
         # Reset used comments count for new session/round
-        pipe.hset(user_hash_key, "used_comments_count", 0)
+        pipe.hset(*stat("used_comments_count"), 0)
 
         # 2.2 Merge Gifts เข้า Used Gifts Breakdown (ต้องทำแบบ Read-Modify-Write ถ้าจะเก็บละเอียด)
         # แต่เพื่อความง่ายและ Atomic เราจะเก็บเป็น JSON List ของ "Sessions" หรือแค่รวมยอด
@@ -440,110 +890,351 @@ class ScoringService:
         #     pipe.hincrby(used_gifts_hash_key, gid, int(count))
 
         # 2.3 Reset Current Stats
-        pipe.hset(user_hash_key, "total_likes", 0)
-        pipe.hset(user_hash_key, "likes_as_follower", 0)
-        pipe.hset(user_hash_key, "likes_as_non_follower", 0)
-        pipe.hset(user_hash_key, "points_from_likes", 0)
+        pipe.hset(*stat("total_likes"), 0)
+        pipe.hset(*stat("likes_as_follower"), 0)
+        pipe.hset(*stat("likes_as_non_follower"), 0)
+        pipe.hset(*stat("points_from_likes"), 0)
 
-        pipe.hset(user_hash_key, "total_gifts_sent", 0)
-        pipe.hset(user_hash_key, "total_gift_coins", 0)
-        pipe.hset(user_hash_key, "points_from_gifts", 0)
+        pipe.hset(*stat("total_gifts_sent"), 0)
+        pipe.hset(*stat("total_gift_coins"), 0)
+        pipe.hset(*stat("points_from_gifts"), 0)
 
-        pipe.hset(user_hash_key, "total_comments", 0)
-        pipe.hset(user_hash_key, "unique_comments_count", 0)
+        pipe.hset(*stat("total_comments"), 0)
+        pipe.hset(*stat("unique_comments_count"), 0)
 
         # 2.4 Reset Gifts Breakdown
-        pipe.delete(user_gifts_hash_key)
+        if self.layout == LAYOUT_COLUMNAR:
+            for gift_id in current_gifts_raw:
+                pipe.hdel(*self._gift_field(user_id, gift_id))
+        else:
+            pipe.delete(user_gifts_hash_key)
 
-        # 2.5 Reset Score in Leaderboard
-        # ต้องหา user_key ก่อน (nickname อาจเปลี่ยนได้ แต่เราจะพยายามหาจาก stats)
-        nickname = stats.get("nickname", "")
-        if nickname:
-            user_key = self._get_user_key(user_id, nickname)
-            pipe.zadd(self.leaderboard_key, {user_key: 0})
+        # 2.5 Reset Score in Leaderboard (XX: เฉพาะ User ที่อยู่ใน Leaderboard แล้ว)
+        pipe.zadd(self.leaderboard_key, {self._get_user_key(user_id): 0}, xx=True)
 
-        pipe.execute()
+        await self._execute_with_rows(pipe, [user_id])
+        await self._notify()
 
     # ==================================================================
     # == ส่วนของการ "แสดงผล" (คำนวณจาก ZSET ที่เตรียมไว้แล้ว) ==
     # ==================================================================
 
-    def get_leaderboard(self) -> list:
+    async def get_leaderboard(
+        self, offset: int = 0, limit: int = None, fields=None
+    ) -> list:
         """
-        ดึง Leaderboard ทั้งหมด พร้อมรายละเอียด (Avatar, Stats, Gift Breakdown)
+        ดึง Leaderboard ช่วงอันดับ [offset, offset + limit) พร้อมรายละเอียด
+        limit = None คือถึงอันดับสุดท้าย, fields = Field ที่ต้องการ (None = ทั้งหมด)
+        อ่าน ZSET แค่ช่วงที่ขอ แล้ว HMGET Row สำเร็จรูปของทุกคนในช่วงนั้น
         """
-        # Get all users (0 to -1)
-        leaderboard_data = self.r.zrevrange(
-            self.leaderboard_key, 0, -1, withscores=True
+        fields = LEADERBOARD_FIELDS if fields is None else tuple(fields)
+        unknown = set(fields) - set(LEADERBOARD_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown leaderboard fields: {sorted(unknown)}")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must be >= 0")
+        if limit == 0:
+            return []
+
+        stop = -1 if limit is None else offset + limit - 1
+        leaderboard_data = await self.r.zrevrange(
+            self.leaderboard_key, offset, stop, withscores=True
         )
+        if not leaderboard_data:
+            return []
 
-        # Pre-fetch gift metadata
-        gift_meta_key = f"session:{self.session_id}:gift_meta"
-        gift_meta_raw = self.r.hgetall(gift_meta_key)
-        gift_meta_map = {k: json.loads(v) for k, v in gift_meta_raw.items()}
+        # Display fields come pre-built from the rows hash: one HMGET, no joins
+        user_ids = [user_id for user_id, _ in leaderboard_data]
+        display = {}
+        if not set(fields).isdisjoint(ROW_FIELDS):
+            display = await self._get_rows(user_ids, "gifts_breakdown" in fields)
 
         result = []
-        for item in leaderboard_data:
-            user_key = item[0]
-            score = math.ceil(item[1])
-            user_id, nickname = user_key.split("|", 1)
+        for rank, (user_id, raw_score) in enumerate(leaderboard_data, start=offset + 1):
+            row = display.get(user_id) or {}
+            row["user_key"] = user_id
+            row["user_id"] = user_id
+            row["score"] = math.ceil(raw_score)
+            row["rank"] = rank
+            result.append({field: row[field] for field in fields})
 
-            # Fetch additional stats from Redis Hash
-            user_hash_key = f"{self.user_data_key_prefix}:{user_id}"
-            stats = self.r.hgetall(user_hash_key)
-
-            # Fetch Gift Breakdown for this user
-            user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
-            user_gifts_raw = self.r.hgetall(user_gifts_hash_key)
+        return result
 
-            gifts_breakdown = {}
-            for gid, count in user_gifts_raw.items():
-                meta = gift_meta_map.get(
-                    gid, {"name": "Unknown", "diamond_count": 0, "icon": None}
+    async def _get_rows(self, user_ids: list, with_gifts: bool = True) -> dict:
+        """
+        user_id -> Row สำหรับแสดงผล (HMGET rows; สร้างให้เฉพาะที่ยังไม่มี)
+        with_gifts: อ่านชื่อ / รูปของ Gift ใน gifts_breakdown ใหม่ (ดู _refresh_gift_meta)
+        """
+        rows = {}
+        missing = []
+        for user_id, blob in zip(user_ids, await self.r.hmget(self.rows_key, user_ids)):
+            if blob is None:
+                missing.append(user_id)
+                continue
+            row = json.loads(blob)
+            row.setdefault("gifts_breakdown", {})
+            rows[user_id] = row
+        if with_gifts:
+            await self._refresh_gift_meta(rows.values())
+        if missing:
+            # Session จากก่อนมี Row (หรือ User ที่ไม่มีสถิติ): สร้างครั้งเดียวแล้วเก็บไว้
+            rows.update(await self._build_rows(missing))
+        return rows
+
+    async def _refresh_gift_meta(self, rows):
+        """
+        Row ถูกสร้างตอนที่ User คนนั้นได้คะแนนครั้งล่าสุด ถ้ารูป / ชื่อของ Gift เปลี่ยนทีหลัง
+        Row ของคนอื่นที่เคยส่ง Gift นั้นจะยังเป็นของเก่า -> อ่าน Metadata ตอนแสดงผลแทน
+        (GiftCatalog ในหน่วยความจำ, HMGET gift_meta เฉพาะ ID ที่ Catalog ไม่รู้จัก)
+        """
+        gift_ids = {
+            entry["id"] for row in rows for entry in row["gifts_breakdown"].values()
+        }
+        if not gift_ids:
+            return
+        meta_map = await self._get_gift_meta(gift_ids)
+        for row in rows:
+            gifts = {}
+            for name, entry in row["gifts_breakdown"].items():
+                gifts[entry["id"]] = entry["count"]
+                # ไม่เจอทั้งใน Catalog และ gift_meta: ใช้ค่าที่อยู่ใน Row
+                meta_map.setdefault(
+                    entry["id"],
+                    {
+                        "name": name,
+                        "diamond_count": entry["diamond_count"],
+                        "icon": entry["icon"],
+                    },
                 )
-                gifts_breakdown[meta["name"]] = {
-                    "id": gid,
-                    "count": int(count),
-                    "diamond_count": meta["diamond_count"],
-                    "icon": meta["icon"],
-                }
+            row["gifts_breakdown"] = self._build_gifts_breakdown(gifts, meta_map)
 
-            result.append(
-                {
-                    "user_key": user_key,
-                    "user_id": user_id,
-                    "nickname": stats.get("nickname", nickname),
-                    "score": score,
-                    "avatar_url": stats.get("avatar_url", ""),
-                    "comments": int(stats.get("total_comments", 0))
-                    - int(stats.get("used_comments_count", 0)),
-                    "likes": int(stats.get("total_likes", 0)),
-                    "gifts": int(stats.get("total_gifts_sent", 0)),
-                    "gifts_breakdown": gifts_breakdown,
-                }
+    async def _build_rows(self, user_ids: list) -> dict:
+        """
+        สร้าง Row จากสถิติดิบ (Join แบบเดิม) แล้วเก็บลง rows
+        ใช้เมื่อ Lua ใช้ไม่ได้ และเติม Row ให้ข้อมูลเก่า
+        """
+        if not user_ids:
+            return {}
+        hash_fields = [f for names in USER_HASH_FIELDS.values() for f in names]
+        if self.layout == LAYOUT_COLUMNAR:
+            stats_list, gifts_list = await self._fetch_columns(user_ids, hash_fields, True)
+        else:
+            stats_list, gifts_list = await self._fetch_user_hashes(
+                user_ids, hash_fields, True
             )
 
-        return result
+        # Gift metadata from the in-memory catalog (HMGET only for unknown ids)
+        gift_meta_map = await self._get_gift_meta(
+            {gid for gifts in gifts_list for gid in gifts}
+        )
+
+        rows = {}
+        for user_id, stats, gifts in zip(user_ids, stats_list, gifts_list):
+            rows[user_id] = {
+                "nickname": stats.get("nickname") or "",
+                "avatar_url": stats.get("avatar_url") or "",
+                "comments": int(stats.get("total_comments") or 0)
+                - int(stats.get("used_comments_count") or 0),
+                "likes": int(stats.get("total_likes") or 0),
+                "gifts": int(stats.get("total_gifts_sent") or 0),
+                "gifts_breakdown": self._build_gifts_breakdown(gifts, gift_meta_map),
+            }
+        await self.r.hset(
+            self.rows_key,
+            mapping={user_id: json.dumps(row) for user_id, row in rows.items()},
+        )
+        return rows
+
+    async def _fetch_user_hashes(self, user_ids: list, hash_fields: list, with_gifts: bool):
+        """Layout hash: HMGET stats (+ HGETALL gifts) ของทุกคนใน Pipeline เดียว"""
+        stats_list = [{} for _ in user_ids]
+        gifts_list = [{} for _ in user_ids]
+        if not hash_fields and not with_gifts:
+            return stats_list, gifts_list
+
+        pipe = self.r.pipeline(transaction=False)
+        for user_id in user_ids:
+            if hash_fields:
+                pipe.hmget(f"{self.user_data_key_prefix}:{user_id}", hash_fields)
+            if with_gifts:
+                pipe.hgetall(f"session:{self.session_id}:user_gifts:{user_id}")
+        replies = iter(await pipe.execute())
+        for i in range(len(user_ids)):
+            if hash_fields:
+                stats_list[i] = dict(zip(hash_fields, next(replies)))
+            if with_gifts:
+                gifts_list[i] = next(replies)
+        return stats_list, gifts_list
+
+    async def _fetch_columns(self, user_ids: list, hash_fields: list, with_gifts: bool):
+        """
+        Layout แบบ Column: 1 HMGET ต่อ Field (+ 1 ต่อชนิด Gift) สำหรับทั้งหน้า
+        จำนวน Command ไม่ขึ้นกับจำนวน User ในหน้า
+        """
+        gift_ids = sorted(await self.r.smembers(self.gift_ids_key)) if with_gifts else []
+        stats_list = [{} for _ in user_ids]
+        gifts_list = [{} for _ in user_ids]
+        if not hash_fields and not gift_ids:
+            return stats_list, gifts_list
+
+        pipe = self.r.pipeline(transaction=False)
+        for name in hash_fields:
+            pipe.hmget(f"{self.column_key_prefix}:{name}", user_ids)
+        for gift_id in gift_ids:
+            pipe.hmget(f"{self.column_key_prefix}:gift:{gift_id}", user_ids)
+        replies = await pipe.execute()
+
+        for name, values in zip(hash_fields, replies):
+            for stats, value in zip(stats_list, values):
+                stats[name] = value
+        for gift_id, counts in zip(gift_ids, replies[len(hash_fields) :]):
+            for gifts, count in zip(gifts_list, counts):
+                if count is not None:
+                    gifts[gift_id] = count
+        return stats_list, gifts_list
+
+    async def _get_user_stats(self, user_id: str) -> dict:
+        """สถิติดิบทั้งหมดของ User (เหมือน HGETALL ของ Layout hash)"""
+        if self.layout != LAYOUT_COLUMNAR:
+            return await self.r.hgetall(f"{self.user_data_key_prefix}:{user_id}")
+        stats_list, _ = await self._fetch_columns([user_id], USER_DATA_FIELDS, False)
+        return {k: v for k, v in stats_list[0].items() if v is not None}
+
+    async def _get_user_gifts(self, user_id: str) -> dict:
+        """gift_id -> จำนวน ของ User"""
+        if self.layout != LAYOUT_COLUMNAR:
+            return await self.r.hgetall(
+                f"session:{self.session_id}:user_gifts:{user_id}"
+            )
+        _, gifts_list = await self._fetch_columns([user_id], [], True)
+        return gifts_list[0]
+
+    async def convert_to_columnar(self, batch_size: int = 500) -> int:
+        """
+        แปลงข้อมูลของ Session นี้จาก Layout hash เป็น Layout แบบ Column
+        ทำทีละ batch_size User (อ่าน 1 Pipeline, เขียน 1 MULTI) แล้วลบ Key เดิม
+        ควรทำตอนที่ไม่ได้ Stream Session นี้อยู่; คืนค่าจำนวน User ที่แปลง
+        """
+        if self.layout == LAYOUT_COLUMNAR:
+            return 0
+
+        converted = 0
+        batch = []
+        async for key in self.r.scan_iter(
+            match=f"{self.user_data_key_prefix}:*", count=batch_size
+        ):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                converted += await self._convert_users(batch)
+                batch = []
+        if batch:
+            converted += await self._convert_users(batch)
+
+        await self.r.set(self.layout_key, LAYOUT_COLUMNAR)
+        # use_scripts ไม่เปลี่ยน: เหมือน Instance ที่สร้างด้วย layout=LAYOUT_COLUMNAR
+        # (_run_script ข้าม Script ของ Layout hash เอง, ROW_SCRIPT รองรับทั้งสอง Layout)
+        self.layout = LAYOUT_COLUMNAR
+        return converted
+
+    async def _convert_users(self, user_data_keys: list) -> int:
+        prefix_len = len(self.user_data_key_prefix) + 1
+        user_ids = [key[prefix_len:] for key in user_data_keys]
+        gift_keys = [
+            f"session:{self.session_id}:user_gifts:{user_id}" for user_id in user_ids
+        ]
+
+        pipe = self.r.pipeline(transaction=False)
+        for user_data_key, gift_key in zip(user_data_keys, gift_keys):
+            pipe.hgetall(user_data_key)
+            pipe.hgetall(gift_key)
+        replies = await pipe.execute()
+
+        columns = defaultdict(dict)  # column key -> {user_id: value}
+        gift_ids = set()
+        for i, user_id in enumerate(user_ids):
+            stats, gifts = replies[2 * i], replies[2 * i + 1]
+            for name, value in stats.items():
+                columns[f"{self.column_key_prefix}:{name}"][user_id] = value
+            for gift_id, count in gifts.items():
+                columns[f"{self.column_key_prefix}:gift:{gift_id}"][user_id] = count
+                gift_ids.add(gift_id)
+
+        pipe = self.r.pipeline()
+        for key, mapping in columns.items():
+            pipe.hset(key, mapping=mapping)
+        if gift_ids:
+            pipe.sadd(self.gift_ids_key, *gift_ids)
+        pipe.delete(*user_data_keys, *gift_keys)
+        await pipe.execute()
+        return len(user_ids)
+
+    async def get_user_rank(self, user_id: str, around: int = 0, fields=None):
+        """
+        อันดับ / คะแนนของ User และ around อันดับที่อยู่เหนือและใต้
+        ZREVRANK + ZSCORE แล้วอ่านแค่ช่วงรอบๆ (O(log N + K)), None = ไม่อยู่ใน Leaderboard
+        """
+        user_key = self._get_user_key(user_id)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zrevrank(self.leaderboard_key, user_key)
+        pipe.zscore(self.leaderboard_key, user_key)
+        pipe.zcard(self.leaderboard_key)
+        rank, score, total = await pipe.execute()
+        if rank is None:
+            return None
+
+        around = max(0, around)
+        offset = max(0, rank - around)
+        neighbors = await self.get_leaderboard(offset, rank - offset + around + 1, fields)
+        index = rank - offset
+        return {
+            "user_id": user_id,
+            "rank": rank + 1,
+            "score": math.ceil(score),
+            "total": total,
+            "above": neighbors[:index],
+            "entry": neighbors[index] if index < len(neighbors) else None,
+            "below": neighbors[index + 1 :],
+        }
+
+    async def get_leaderboard_counts(self) -> dict:
+        """จำนวน User ทั้งหมด / ที่มีคะแนน (ใช้กับ View ที่ดึงแค่ Top-N)"""
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zcard(self.leaderboard_key)
+        pipe.zcount(self.leaderboard_key, "(0", "+inf")
+        total, scored = await pipe.execute()
+        return {"total": total, "scored": scored}
+
+    @staticmethod
+    def _build_gifts_breakdown(gifts_raw: dict, gift_meta_map: dict) -> dict:
+        gifts_breakdown = {}
+        for gid, count in gifts_raw.items():
+            meta = gift_meta_map.get(
+                gid, {"name": "Unknown", "diamond_count": 0, "icon": None}
+            )
+            gifts_breakdown[meta["name"]] = {
+                "id": gid,
+                "count": int(count),
+                "diamond_count": meta["diamond_count"],
+                "icon": meta["icon"],
+            }
+        return gifts_breakdown
 
     # ==================================================================
     # == ส่วนของการ "แสดงที่มา" (คำนวณจาก HASH) ==
     # ==================================================================
 
-    def get_user_stats_and_comments(self, user_id: str) -> dict:
+    async def get_user_stats_and_comments(self, user_id: str) -> dict:
         """
         ดึงสถิติที่มาของคะแนน และ Comments
         """
-        user_summary_hash_key = f"{self.user_data_key_prefix}:{user_id}"
         comments_key = f"{self.user_comments_key_prefix}:{user_id}"
-        user_gifts_hash_key = f"session:{self.session_id}:user_gifts:{user_id}"
-        gift_meta_key = f"session:{self.session_id}:gift_meta"
 
         # 1. ดึงสถิติดิบ (HGETALL)
-        stats_raw = self.r.hgetall(user_summary_hash_key)
+        stats_raw = await self._get_user_stats(user_id)
         stats = {k: v for k, v in stats_raw.items()}
 
         # 2. ดึง Comments (LRANGE) - Get all comments and parse JSON
-        comments_raw = self.r.lrange(comments_key, 0, -1)
+        comments_raw = await self.r.lrange(comments_key, 0, -1)
         comments = []
         for c in comments_raw:
             try:
@@ -554,21 +1245,9 @@ class ScoringService:
                 comments.append({"text": c, "timestamp": None})
 
         # 3. ดึงสถิติของขวัญ (HGETALL) & Metadata
-        gifts_raw = self.r.hgetall(user_gifts_hash_key)
-        gift_meta_raw = self.r.hgetall(gift_meta_key)
-        gift_meta_map = {k: json.loads(v) for k, v in gift_meta_raw.items()}
-
-        gifts_breakdown = {}
-        for gid, count in gifts_raw.items():
-            meta = gift_meta_map.get(
-                gid, {"name": "Unknown", "diamond_count": 0, "icon": None}
-            )
-            gifts_breakdown[meta["name"]] = {
-                "id": gid,
-                "count": int(count),
-                "diamond_count": meta["diamond_count"],
-                "icon": meta["icon"],
-            }
+        gifts_raw = await self._get_user_gifts(user_id)
+        gift_meta_map = await self._get_gift_meta(gifts_raw)
+        gifts_breakdown = self._build_gifts_breakdown(gifts_raw, gift_meta_map)
 
         # 4. Compute Grand Totals (Current + Used)
         total_likes = int(stats.get("total_likes", 0)) + int(stats.get("used_likes", 0))
@@ -0,0 +1,326 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from app.services.scoring_service import LEADERBOARD_FIELDS
+from app.services.ws_views import View, DEFAULT_VIEW
+from app.services.ws_codec import encode, project_question
+
+# Tunables (override via environment)
+# Frame ถูกส่งเมื่อข้อมูลเปลี่ยน (ChangeNotifier) แต่ไม่ถี่กว่า MIN
+# และถ้าไม่มีอะไรเปลี่ยน จะส่ง Heartbeat ทุก MAX
+WS_MIN_INTERVAL_MS = int(os.getenv("WS_MIN_INTERVAL_MS", "100"))
+WS_MAX_INTERVAL_MS = int(os.getenv("WS_MAX_INTERVAL_MS", "5000"))
+# Log สูงสุดต่อ Frame (Client ใหม่ / ตามไม่ทัน ได้แค่ Log ล่าสุดเท่านี้)
+WS_LOG_CATCHUP = int(os.getenv("WS_LOG_CATCHUP", "200"))
+# View ที่ไม่มี Subscriber แล้ว เก็บ Row ล่าสุดไว้อีกกี่ Frame (Reconnect / SSE Last-Event-ID ได้ Delta)
+WS_VIEW_RETAIN_FRAMES = int(os.getenv("WS_VIEW_RETAIN_FRAMES", "50"))
+
+# Protocol version ของ /ws?v=2 (Snapshot ครั้งแรก แล้วส่งแค่ Row ที่เปลี่ยน)
+DELTA_PROTOCOL_VERSION = 2
+
+
+def diff_leaderboard(previous: dict, rows: list):
+    """
+    เทียบ Leaderboard กับ Tick ก่อน (previous: user_id -> row)
+    คืนค่า (upsert, remove): Row ใหม่ส่งทั้ง Row, Row เดิมส่งแค่ Field ที่เปลี่ยน (+user_id)
+    """
+    upsert = []
+    for row in rows:
+        old = previous.get(row["user_id"])
+        if old is None:
+            upsert.append(row)
+            continue
+        changed = {k: v for k, v in row.items() if old.get(k) != v}
+        if changed:
+            changed["user_id"] = row["user_id"]
+            upsert.append(changed)
+
+    current_ids = {row["user_id"] for row in rows}
+    remove = [user_id for user_id in previous if user_id not in current_ids]
+    return upsert, remove
+
+
+@dataclass(slots=True)
+class ViewFrame:
+    """
+    Frame ของ View หนึ่ง ที่ Serialize แล้ว 1 ครั้ง ใช้ร่วมกันทุก Subscriber ของ View นั้น
+    เป็น str (JSON) หรือ bytes (msgpack) ตาม view.format
+    """
+
+    text: str
+    # v2: Snapshot เต็ม (ตอนเชื่อมต่อ / Resync) และ Delta จาก Frame base
+    snapshot_v2: str
+    delta_v2: str
+    # seq ล่าสุดที่ View นี้ถูก Render ก่อนหน้า (0 = ไม่มี: ต้องส่ง Snapshot)
+    base: int = 0
+
+
+@dataclass(slots=True)
+class Frame:
+    seq: int
+    views: dict  # View -> ViewFrame
+    # Log ใน Frame นี้คือ id > logs_after และ <= last_log_id
+    logs_after: int
+    last_log_id: int
+
+
+class SnapshotHub:
+    """
+    Producer ตัวเดียวสร้าง Snapshot (Leaderboard / Question / Logs / Status) ต่อ Tick
+    แล้วกระจาย Frame เดียวกันให้ทุก /ws Connection ที่ขอ View เดียวกัน
+    ค่าใช้จ่าย Redis จึงไม่ขึ้นกับจำนวน Client (ไม่มี Client = ไม่ทำงาน)
+    """
+
+    def __init__(
+        self,
+        game_manager,
+        min_interval_ms: int = WS_MIN_INTERVAL_MS,
+        max_interval_ms: int = WS_MAX_INTERVAL_MS,
+    ):
+        self.game_manager = game_manager
+        self.min_interval = min_interval_ms / 1000.0
+        self.interval = max_interval_ms / 1000.0
+        self.last_produced_at = 0.0
+        self.frame = None
+        self.seq = 0
+        self.last_log_id = 0
+        self.views = {}  # View -> จำนวน Subscriber
+        # View -> (seq, {user_id: row}) ที่ Render ล่าสุด (สำหรับ Delta)
+        self.previous_rows = {}
+        self.subscribers = 0
+        self.producer_task = None
+        self.is_running = False
+        self._has_subscribers = asyncio.Event()
+        self._wake = asyncio.Event()  # ตัด Interval ให้ Tick ถัดไปเริ่มทันที
+        self._new_frame = asyncio.Condition()
+
+        # Metrics
+        self.ticks = 0
+        self.wakeups = 0
+        self.errors = 0
+        self.last_produce_ms = 0.0
+        self.last_frame_bytes = 0
+
+    def start(self):
+        if self.producer_task is None:
+            self.is_running = True
+            self._wake.clear()
+            self.producer_task = asyncio.create_task(self._produce_loop())
+
+    async def stop(self):
+        if self.producer_task:
+            self.is_running = False
+            self._wake.set()
+            self._has_subscribers.set()
+            await self.producer_task
+            self.producer_task = None
+
+    def wake(self):
+        """ข้อมูลเปลี่ยน: ส่ง Frame ใหม่ทันที (ภายใต้ min interval)"""
+        self.wakeups += 1
+        self._wake.set()
+
+    def add_subscriber(self, view: View = DEFAULT_VIEW):
+        self.subscribers += 1
+        if view not in self.views:
+            # New view (or first client after idle): render now, not after the interval
+            self.views[view] = 0
+            self._wake.set()
+        self.views[view] += 1
+        self._has_subscribers.set()
+
+    def remove_subscriber(self, view: View = DEFAULT_VIEW):
+        self.subscribers = max(0, self.subscribers - 1)
+        if view in self.views:
+            self.views[view] -= 1
+            if self.views[view] <= 0:
+                # previous_rows is kept (see _prune_previous) so a quick
+                # reconnect of the same view can still resume with a delta
+                del self.views[view]
+        if not self.subscribers:
+            self._has_subscribers.clear()
+            # Idle: ไม่ส่ง Snapshot เก่าให้ Client ที่มาทีหลัง
+            self.frame = None
+
+    def change_view(self, old: View, new: View):
+        """Client ส่ง subscribe ใหม่: ย้ายไป View ใหม่ (Render ใน Frame ถัดไป)"""
+        self.add_subscriber(new)
+        self.remove_subscriber(old)
+
+    async def next_frame(self, after_seq: int) -> Frame:
+        """
+        รอ Frame ที่ใหม่กว่า after_seq (Client ที่ช้าจะได้ Frame ล่าสุดเลย)
+        View ที่เพิ่งเพิ่มอาจยังไม่มีใน Frame นี้ -> frame.views.get(view) เป็น None
+        """
+        async with self._new_frame:
+            await self._new_frame.wait_for(
+                lambda: self.frame is not None and self.frame.seq > after_seq
+            )
+            return self.frame
+
+    def _leaderboard_window(self, views: list):
+        """
+        ช่วงอันดับและ Field ที่ต้องดึงให้ครอบคลุมทุก View: (offset, limit, fields)
+        None = ไม่มี View ไหนต้องการ Leaderboard
+        """
+        views = [view for view in views if view.leaderboard]
+        if not views:
+            return None
+
+        offset = min(view.offset for view in views)
+        limit = None
+        if all(view.limit is not None for view in views):
+            limit = max(view.offset + view.limit for view in views) - offset
+
+        fields = None
+        if all(view.fields is not None for view in views):
+            # score ใช้นับ scored เมื่อดึงทั้งหมด
+            wanted = {"score"}.union(*(view.fields for view in views))
+            fields = [f for f in LEADERBOARD_FIELDS if f in wanted]
+        return offset, limit, fields
+
+    async def produce(self) -> Frame:
+        gm = self.game_manager
+        started = time.monotonic()
+        views = list(self.views) or [DEFAULT_VIEW]
+
+        # Only fetch the rank window and fields the views actually render
+        window = self._leaderboard_window(views)
+        leaderboard = []
+        counts = {}
+        base = 0
+        if window is not None:
+            base, limit, fields = window
+            leaderboard = await gm.get_leaderboard(base, limit, fields)
+            if base == 0 and limit is None:
+                counts = {
+                    "total": len(leaderboard),
+                    "scored": sum(1 for row in leaderboard if row["score"] > 0),
+                }
+            else:
+                counts = await gm.get_leaderboard_counts()
+
+        logs_after = self.last_log_id
+        logs = gm.get_logs(after_id=logs_after, limit=WS_LOG_CATCHUP)
+        if logs:
+            self.last_log_id = logs[-1]["id"]
+
+        question = project_question(gm.get_current_question())
+        streaks = gm.get_gift_streaks()
+        status = {
+            "is_connected": gm.is_connected,
+            "is_paused": gm.is_paused,
+            "session_id": gm.current_session_id,
+        }
+
+        async with self._new_frame:
+            self.seq += 1
+            rendered = {}
+            frame_bytes = 0
+            for view in views:
+                payload = {}
+                rows = []
+                if view.leaderboard:
+                    rows = view.project_rows(leaderboard, base)
+                    payload.update(counts)
+                if view.question:
+                    payload["question"] = question
+                if view.logs:
+                    payload["logs"] = view.filter_logs(logs)
+                if view.streaks:
+                    payload["streaks"] = streaks
+                if view.status:
+                    payload["status"] = status
+
+                delta_base, previous = self.previous_rows.get(view, (0, {}))
+                upsert, remove = diff_leaderboard(previous, rows)
+                self.previous_rows[view] = (
+                    self.seq,
+                    {row["user_id"]: row for row in rows},
+                )
+
+                header = {"v": DELTA_PROTOCOL_VERSION, "seq": self.seq}
+                board = {"leaderboard": rows} if view.leaderboard else {}
+                changes = (
+                    {"upsert": upsert, "remove": remove} if view.leaderboard else {}
+                )
+                fmt, row_fields = view.format, view.fields
+                view_frame = ViewFrame(
+                    encode({**board, **payload}, fmt, row_fields),
+                    encode(
+                        {**header, "type": "snapshot", **board, **payload},
+                        fmt,
+                        row_fields,
+                    ),
+                    encode(
+                        {
+                            **header,
+                            "type": "delta",
+                            "base": delta_base,
+                            **changes,
+                            **payload,
+                        },
+                        fmt,
+                        row_fields,
+                    ),
+                    delta_base,
+                )
+                rendered[view] = view_frame
+                frame_bytes += len(view_frame.text)
+
+            self.frame = Frame(self.seq, rendered, logs_after, self.last_log_id)
+            self._new_frame.notify_all()
+        self._prune_previous()
+
+        self.ticks += 1
+        self.last_frame_bytes = frame_bytes
+        self.last_produce_ms = (time.monotonic() - started) * 1000
+        return self.frame
+
+    def _prune_previous(self):
+        """ลบ Row ของ View ที่ไม่มี Subscriber และไม่ถูก Render มานานเกิน retain"""
+        oldest = self.seq - WS_VIEW_RETAIN_FRAMES
+        for view, (seq, _) in list(self.previous_rows.items()):
+            if view not in self.views and seq < oldest:
+                del self.previous_rows[view]
+
+    def get_metrics(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "views": len(self.views),
+            "ticks": self.ticks,
+            "wakeups": self.wakeups,
+            "errors": self.errors,
+            "seq": self.seq,
+            "frame_bytes": self.last_frame_bytes,
+            "last_produce_ms": round(self.last_produce_ms, 1),
+        }
+
+    async def _produce_loop(self):
+        while self.is_running:
+            # Idle (no Redis work) until someone is listening
+            await self._has_subscribers.wait()
+            if not self.is_running:
+                break
+
+            # Rate limit: a burst of changes within min_interval becomes one frame
+            delay = self.min_interval - (time.monotonic() - self.last_produced_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self.is_running:
+                break
+
+            # Changes from here on wake the next iteration
+            self._wake.clear()
+            self.last_produced_at = time.monotonic()
+            try:
+                await self.produce()
+            except Exception as e:
+                self.errors += 1
+                print(f"Snapshot producer error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,39 @@
+import os
+import uuid
+
+# Tunables (override via environment)
+# Browser รอเท่านี้ก่อน Reconnect อัตโนมัติ (EventSource)
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "1000"))
+
+# id ของ Event = "<stream>.<seq>": stream เปลี่ยนทุกครั้งที่ Server เริ่มใหม่
+# (seq ของ SnapshotHub เริ่มนับใหม่ Last-Event-ID เก่าจึงใช้ไม่ได้)
+STREAM_ID = uuid.uuid4().hex[:8]
+
+
+def event_id(seq: int) -> str:
+    return f"{STREAM_ID}.{seq}"
+
+
+def parse_last_event_id(value: str) -> int:
+    """Last-Event-ID -> seq ที่ Client มีแล้ว (0 = ไม่มี / มาจาก Server รอบก่อน)"""
+    if not value:
+        return 0
+    stream, _, seq = value.partition(".")
+    if stream != STREAM_ID or not seq.isdigit():
+        return 0
+    return int(seq)
+
+
+def format_event(data: str, event: str = None, id: str = None) -> str:
+    """1 Event ตามรูปแบบ text/event-stream (data หลายบรรทัดแยกเป็นหลาย data:)"""
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def format_retry(retry_ms: int = SSE_RETRY_MS) -> str:
+    return f"retry: {retry_ms}\n\n"
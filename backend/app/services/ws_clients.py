@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import os
+import time
+
+# Tunables (override via environment)
+# ส่ง Frame เดียวนานเกินนี้ = Client ค้าง (Tab ถูกพัก / เน็ตช้า) -> ตัดการเชื่อมต่อ
+WS_SEND_TIMEOUT_MS = int(os.getenv("WS_SEND_TIMEOUT_MS", "2000"))
+WS_CLOSE_TIMEOUT_MS = int(os.getenv("WS_CLOSE_TIMEOUT_MS", "1000"))
+# จำนวน Client ที่ Lag มากที่สุดที่แสดงใน /status
+WS_CLIENT_METRICS_TOP = int(os.getenv("WS_CLIENT_METRICS_TOP", "5"))
+
+# Close code: 1013 Try Again Later (Client ควร Reconnect แล้วได้ Snapshot ใหม่)
+CLOSE_SLOW_CLIENT = 1013
+
+_client_ids = itertools.count(1)
+
+
+class SlowClientError(Exception):
+    pass
+
+
+class WsClient:
+    """
+    หนึ่ง WebSocket Connection: ส่งได้ทีละ Frame (ไม่มี Queue ต่อ Client)
+    Frame ที่ออกไม่ทัน ถูกข้ามไปใช้ Frame ล่าสุดของ Hub แทน (Latest frame wins)
+    """
+
+    def __init__(self, websocket, channel: str, head, send_timeout: float):
+        self.id = next(_client_ids)
+        self.websocket = websocket
+        self.channel = channel
+        self.head = head  # () -> seq ล่าสุดของ Hub / Relay ที่ Client นี้ตามอยู่
+        self.send_timeout = send_timeout
+        self.connected_at = time.monotonic()
+        self._lock = asyncio.Lock()  # Frame Task และ Receive Task ส่งไม่ซ้อนกัน
+        self._send_started = None
+
+        # Metrics
+        self.sent_seq = 0
+        self.frames = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.last_send_ms = 0.0
+        self.max_send_ms = 0.0
+
+    async def send(self, data):
+        """ส่ง 1 ข้อความ (bytes = Binary, str = Text) เกิน send_timeout -> SlowClientError"""
+        async with self._lock:
+            self._send_started = time.monotonic()
+            try:
+                if isinstance(data, bytes):
+                    send = self.websocket.send_bytes(data)
+                else:
+                    send = self.websocket.send_text(data)
+                await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.TimeoutError:
+                raise SlowClientError(
+                    f"send took longer than {self.send_timeout:.1f}s"
+                ) from None
+            finally:
+                elapsed = (time.monotonic() - self._send_started) * 1000
+                self._send_started = None
+            self.last_send_ms = elapsed
+            self.max_send_ms = max(self.max_send_ms, elapsed)
+            self.bytes_sent += len(data)
+
+    def frame_sent(self, seq: int):
+        """บันทึกว่า Frame seq ออกไปแล้ว (Frame ระหว่างนั้นที่ถูกแทนที่นับเป็น skipped)"""
+        if self.sent_seq and seq > self.sent_seq + 1:
+            self.skipped += seq - self.sent_seq - 1
+        self.sent_seq = seq
+        self.frames += 1
+
+    def lag(self) -> int:
+        """จำนวน Frame ที่ Client ตามหลัง Hub อยู่"""
+        return max(0, self.head() - self.sent_seq)
+
+    def get_metrics(self) -> dict:
+        sending_ms = 0.0
+        if self._send_started is not None:
+            sending_ms = (time.monotonic() - self._send_started) * 1000
+        return {
+            "id": self.id,
+            "channel": self.channel,
+            "lag_frames": self.lag(),
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "bytes_sent": self.bytes_sent,
+            "last_send_ms": round(self.last_send_ms, 1),
+            "max_send_ms": round(self.max_send_ms, 1),
+            "sending_ms": round(sending_ms, 1),
+            "connected_s": round(time.monotonic() - self.connected_at),
+        }
+
+
+class ClientRegistry:
+    """ทุก WebSocket Client ที่เชื่อมต่ออยู่ (ใช้ดู Lag และตัด Client ที่ช้า)"""
+
+    def __init__(
+        self,
+        send_timeout_ms: int = WS_SEND_TIMEOUT_MS,
+        close_timeout_ms: int = WS_CLOSE_TIMEOUT_MS,
+    ):
+        self.send_timeout = send_timeout_ms / 1000.0
+        self.close_timeout = close_timeout_ms / 1000.0
+        self.clients = {}  # id -> WsClient
+
+        # Metrics
+        self.connected = 0
+        self.evicted = 0
+
+    def connect(self, websocket, channel: str, head) -> WsClient:
+        client = WsClient(websocket, channel, head, self.send_timeout)
+        self.clients[client.id] = client
+        self.connected += 1
+        return client
+
+    async def disconnect(self, client: WsClient, evicted: bool = False):
+        """ลบ Client และปิด Connection (รอได้ไม่เกิน close_timeout)"""
+        self.clients.pop(client.id, None)
+        code = 1000
+        if evicted:
+            self.evicted += 1
+            code = CLOSE_SLOW_CLIENT
+        try:
+            await asyncio.wait_for(client.websocket.close(code), self.close_timeout)
+        except (RuntimeError, asyncio.TimeoutError):
+            pass  # Already closed / peer not reading
+        except Exception as e:
+            print(f"Error closing WebSocket {client.id}: {e}")
+
+    def get_metrics(self) -> dict:
+        clients = list(self.clients.values())
+        clients.sort(key=lambda c: (c.lag(), c.max_send_ms), reverse=True)
+        return {
+            "clients": len(clients),
+            "connected": self.connected,
+            "evicted": self.evicted,
+            "max_lag_frames": clients[0].lag() if clients else 0,
+            "slowest": [c.get_metrics() for c in clients[:WS_CLIENT_METRICS_TOP]],
+        }
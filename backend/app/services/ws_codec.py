@@ -0,0 +1,96 @@
+import json
+import os
+from app.services.scoring_service import LEADERBOARD_FIELDS
+
+# Optional: Encoder ที่เร็วกว่า (ไม่มีก็ใช้ json ของ stdlib / ส่งเป็น JSON แทน)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Tunables (override via environment)
+WS_USE_ORJSON = os.getenv("WS_USE_ORJSON", "1") != "0"
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+# Schema ของ Payload บน WebSocket (กำหนดที่เดียว ใช้ทั้ง JSON และ msgpack)
+LOG_FIELDS = ("id", "time", "level", "type", "message")
+QUESTION_FIELDS = ("user_id", "nickname", "avatar_url", "content", "timestamp")
+
+
+def available_formats() -> tuple:
+    if msgpack is None:
+        return (FORMAT_JSON,)
+    return (FORMAT_JSON, FORMAT_MSGPACK)
+
+
+def negotiate_format(requested: str) -> str:
+    """format ที่ Client ขอ (?format=msgpack) ถ้า Server ไม่รองรับใช้ JSON"""
+    if requested in available_formats():
+        return requested
+    return FORMAT_JSON
+
+
+def is_binary(fmt: str) -> bool:
+    return fmt == FORMAT_MSGPACK
+
+
+def project_question(question):
+    if question is None:
+        return None
+    return {f: question.get(f) for f in QUESTION_FIELDS}
+
+
+def pack_rows(rows: list, fields) -> dict:
+    """
+    List ของ Row -> {"fields": [...], "rows": [[...], ...]}
+    ชื่อ Field ส่งครั้งเดียวต่อ Frame แทนที่จะซ้ำทุก Row
+    (เรียงตาม Schema เฉพาะ Field ที่ Row มีจริง)
+    """
+    fields = [f for f in fields if rows and f in rows[0]]
+    return {"fields": fields, "rows": [[row.get(f) for f in fields] for row in rows]}
+
+
+def unpack_rows(packed: dict) -> list:
+    fields = packed["fields"]
+    return [dict(zip(fields, values)) for values in packed["rows"]]
+
+
+def encode_json(obj) -> str:
+    if orjson is not None and WS_USE_ORJSON:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def encode(obj: dict, fmt: str = FORMAT_JSON, row_fields=None):
+    """
+    Payload -> Frame (str สำหรับ JSON, bytes สำหรับ msgpack)
+    msgpack: leaderboard / logs ที่เป็น Row เต็มถูกแปลงเป็น pack_rows ตาม Schema
+    (Delta upsert เป็น Row บางส่วน จึงส่งเป็น Map เหมือนเดิม)
+    """
+    if not is_binary(fmt):
+        return encode_json(obj)
+
+    wire = dict(obj)
+    if isinstance(wire.get("leaderboard"), list):
+        wire["leaderboard"] = pack_rows(
+            wire["leaderboard"], row_fields or LEADERBOARD_FIELDS
+        )
+    if isinstance(wire.get("logs"), list):
+        wire["logs"] = pack_rows(wire["logs"], LOG_FIELDS)
+    return msgpack.packb(wire)
+
+
+def decode(data):
+    """ข้อความจาก Client: bytes = msgpack, str = JSON"""
+    if isinstance(data, (bytes, bytearray)):
+        if msgpack is None:
+            raise ValueError("msgpack is not installed on the server")
+        return msgpack.unpackb(data)
+    return json.loads(data)
@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from typing import Optional
+from app.services.scoring_service import LEADERBOARD_FIELDS
+from app.services.ws_codec import FORMAT_JSON
+
+# user_id / rank ส่งเสมอ (ใช้เป็น Key ของ Delta)
+ALWAYS_FIELDS = ("user_id", "rank")
+
+
+@dataclass(frozen=True, slots=True)
+class View:
+    """
+    สิ่งที่ WebSocket Client หนึ่งต้องการ (Channel + Field) ใช้เป็น Key ของ Frame ที่ Render แล้ว
+    Client ที่ขอ View เดียวกันใช้ Frame ที่ Serialize แล้วร่วมกัน
+    """
+
+    leaderboard: bool = True
+    offset: int = 0  # เริ่มที่อันดับ offset + 1
+    limit: Optional[int] = None  # None = ทั้งหมด
+    fields: Optional[tuple] = None  # None = ทุก Field
+    logs: bool = True
+    log_levels: Optional[frozenset] = None
+    log_types: Optional[frozenset] = None
+    question: bool = True
+    status: bool = True
+    streaks: bool = True
+    format: str = FORMAT_JSON  # Frame เป็น JSON หรือ msgpack (ตกลงกันตอนเชื่อมต่อ)
+
+    @classmethod
+    def from_message(cls, message: dict) -> "View":
+        """
+        สร้าง View จากข้อความ {"type": "subscribe", ...}
+        Channel ที่ไม่ระบุ = ไม่รับ, ค่า true = รับแบบ Default
+
+        {"type": "subscribe",
+         "leaderboard": {"offset": 0, "limit": 5, "fields": ["nickname", "score"]},
+         "logs": {"levels": ["ERROR"], "types": ["Gift"]},
+         "question": true, "status": true, "streaks": false}
+        """
+        leaderboard = message.get("leaderboard") or False
+        logs = message.get("logs") or False
+        limit = fields = levels = types = None
+        offset = 0
+
+        if isinstance(leaderboard, dict):
+            offset = int(leaderboard.get("offset") or 0)
+            if offset < 0:
+                raise ValueError("leaderboard.offset must be >= 0")
+            limit = leaderboard.get("limit")
+            if limit is not None:
+                limit = int(limit)
+                if limit <= 0:
+                    raise ValueError("leaderboard.limit must be > 0")
+            if leaderboard.get("fields") is not None:
+                unknown = set(leaderboard["fields"]) - set(LEADERBOARD_FIELDS)
+                if unknown:
+                    raise ValueError(f"Unknown leaderboard fields: {sorted(unknown)}")
+                fields = tuple(
+                    f
+                    for f in LEADERBOARD_FIELDS
+                    if f in leaderboard["fields"] or f in ALWAYS_FIELDS
+                )
+
+        if isinstance(logs, dict):
+            if logs.get("levels") is not None:
+                levels = frozenset(logs["levels"])
+            if logs.get("types") is not None:
+                types = frozenset(logs["types"])
+
+        return cls(
+            leaderboard=bool(leaderboard),
+            offset=offset,
+            limit=limit,
+            fields=fields,
+            logs=bool(logs),
+            log_levels=levels,
+            log_types=types,
+            question=bool(message.get("question", False)),
+            status=bool(message.get("status", False)),
+            streaks=bool(message.get("streaks", False)),
+        )
+
+    def project_rows(self, rows: list, base: int = 0) -> list:
+        """rows = Leaderboard ที่เริ่มจากอันดับ base + 1 (ช่วงที่ Hub ดึงมา)"""
+        start = self.offset - base
+        stop = None if self.limit is None else start + self.limit
+        rows = rows[start:stop]
+        if self.fields is None:
+            return rows
+        return [{f: row[f] for f in self.fields if f in row} for row in rows]
+
+    def filter_logs(self, logs: list) -> list:
+        if not self.logs:
+            return []
+        return [
+            log
+            for log in logs
+            if (self.log_levels is None or log["level"] in self.log_levels)
+            and (self.log_types is None or log["type"] in self.log_types)
+        ]
+
+
+# View ของ Client ที่ไม่ได้ส่ง subscribe (ได้ทุกอย่างเหมือนเดิม)
+DEFAULT_VIEW = View()
@@ -1,7 +1,9 @@
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-const WS_URL = API_URL.replace(/^http/, 'ws') + '/ws';
+const WS_URL = API_URL.replace(/^http/, 'ws') + '/ws?v=2';
+const OVERLAY_WS_URL = API_URL.replace(/^http/, 'ws') + '/ws/overlay';
 
 export const config = {
     apiUrl: API_URL,
-    wsUrl: WS_URL
+    wsUrl: WS_URL,
+    overlayWsUrl: OVERLAY_WS_URL
 };
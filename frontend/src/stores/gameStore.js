@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
 import { config } from '../config'
+import { createLeaderboardSync } from '../wsProtocol'
 
 export const useGameStore = defineStore('game', () => {
     // State
@@ -13,6 +14,7 @@ export const useGameStore = defineStore('game', () => {
     const logs = ref([])
     const ws = ref(null)
     const isLoading = ref(false)
+    const leaderboardSync = createLeaderboardSync()
 
     // Actions
     async function fetchStatus() {
@@ -33,6 +35,7 @@ export const useGameStore = defineStore('game', () => {
         if (ws.value) return
 
         ws.value = new WebSocket(config.wsUrl)
+        leaderboardSync.reset()
 
         ws.value.onopen = () => {
             addLog('INFO', 'WebSocket connected')
@@ -41,7 +44,15 @@ export const useGameStore = defineStore('game', () => {
         ws.value.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data)
-                if (data.leaderboard) leaderboard.value = data.leaderboard
+                if (data.type === 'snapshot' || data.type === 'delta') {
+                    const rows = leaderboardSync.apply(data)
+                    if (rows) {
+                        leaderboard.value = rows
+                    } else {
+                        // Missed a frame: ask for a full snapshot
+                        ws.value.send(JSON.stringify({ type: 'resync' }))
+                    }
+                }
                 if (data.question !== undefined) currentQuestion.value = data.question
                 if (data.logs && data.logs.length > 0) {
                     data.logs.forEach(log => {
@@ -0,0 +1,39 @@
+// /ws?v=2: full snapshot on connect, then row diffs keyed by user_id.
+// Every message carries a seq; a delta whose base is not our last seq means
+// we missed a frame, so we ask the server for a fresh snapshot.
+export const WS_PROTOCOL_VERSION = 2;
+
+export function createLeaderboardSync() {
+  let seq = 0;
+  let rows = new Map(); // user_id -> row
+
+  function sorted() {
+    return Array.from(rows.values()).sort((a, b) => a.rank - b.rank);
+  }
+
+  // Returns the new leaderboard array, or null when a resync is required
+  function apply(message) {
+    if (message.type === "snapshot") {
+      rows = new Map(message.leaderboard.map((row) => [row.user_id, row]));
+      seq = message.seq;
+      return sorted();
+    }
+    if (message.type !== "delta" || message.base !== seq) {
+      return null;
+    }
+    message.remove.forEach((userId) => rows.delete(userId));
+    message.upsert.forEach((change) => {
+      const current = rows.get(change.user_id);
+      rows.set(change.user_id, current ? { ...current, ...change } : change);
+    });
+    seq = message.seq;
+    return sorted();
+  }
+
+  function reset() {
+    seq = 0;
+    rows = new Map();
+  }
+
+  return { apply, reset };
+}